@@ -1,41 +1,157 @@
+import os
+import email.utils
+import inspect
+import contextlib
+import time
+import secrets
+import asyncio
+import datetime
 import fastapi
+import fastapi.responses
 import fastapi.security
 import pydantic
 import functools
 import constants
-from data import DataBaseSession
-from typing import Optional, Annotated
+import cache
+import metrics
+import streaks
+import coplay
+import timeline
+import schemas
+import profiling
+import data
+from data import AsyncDataBaseSession
+from session_calendar import calendar
+from model import Member, Game, MemberStats, GameStats
+from typing import Optional, Annotated, Literal
+
+from rich import print
+
+def is_authorised(token: Optional[str]) -> bool:
+    return constants.MASTER_API_TOKEN is not None and token is not None and secrets.compare_digest(token, constants.MASTER_API_TOKEN)
 
 def get_auth_user(token: str = fastapi.Depends(fastapi.security.APIKeyHeader(name="token"))):
-    print(f"{token=}")
-    return token == constants.MASTER_API_TOKEN
+    if not is_authorised(token): raise fastapi.HTTPException(status_code=401, detail="Invalid token.")
+    return True
+
+response_cache = cache.ResponseCache(constants.RESPONSE_CACHE_SIZE)
+
+def is_not_modified(request: fastapi.Request, etag: str, last_modified: Optional[datetime.datetime]) -> bool:
+    """Checks the conditional request headers, with If-None-Match taking precedence over If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None: return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None: return False
+    try:
+        return last_modified <= email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+def cached(*tables: str):
+    """Serves a route from response_cache until one of the tables it reads is written to.
+
+    Costs one query for the tables' data versions per request. Responses carry an ETag and Last-Modified
+    derived from those versions, and conditional requests that still match are answered with a bare 304.
+    Results are validated against the route's return annotation, a model from schemas, and serialized by
+    pydantic. Routes may return a Response to add headers, which are cached with the body; streamed
+    responses are passed through without caching."""
+    def wrapper(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapped(request: fastapi.Request, **kwargs):
+            if "request" in signature.parameters: kwargs["request"] = request
+            async with AsyncDataBaseSession() as db:
+                versions = await db.get_data_versions(tables)
+
+            key = f"{request.url.path}?{request.query_params}"
+            etag = cache.get_etag(key, versions)
+            last_modified = cache.get_last_modified(versions)
+            headers = {"ETag" : etag}
+            if last_modified is not None: headers["Last-Modified"] = email.utils.format_datetime(last_modified, usegmt=True)
+            if is_not_modified(request, etag, last_modified): return fastapi.Response(status_code=304, headers=headers)
+
+            entry = response_cache.get(key, etag)
+            if entry is None:
+                result = await func(**kwargs)
+                if isinstance(result, fastapi.responses.StreamingResponse):
+                    result.headers.update(headers)
+                    return result
+                if not isinstance(result, fastapi.Response): result = fastapi.Response(schemas.to_json(signature.return_annotation, result), media_type="application/json")
+                extra_headers = {name: value for name, value in result.headers.items() if name not in ("content-length", "content-type")}
+                entry = cache.CachedResponse(etag, last_modified, result.body, extra_headers)
+                response_cache.put(key, entry)
+            return fastapi.Response(entry.body, media_type="application/json", headers=entry.headers | headers)
+
+        # fastapi reads the route's parameters from the signature, so expose the wrapped ones plus the request
+        parameters = [parameter.replace(kind=inspect.Parameter.KEYWORD_ONLY) for parameter in signature.parameters.values() if parameter.name != "request"]
+        wrapped.__signature__ = inspect.Signature([inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=fastapi.Request), *parameters], return_annotation=signature.return_annotation)
+        return wrapped
+    return wrapper
+
+# --- Paging ---
+
+After = Annotated[Optional[int], fastapi.Query(description="Id of the last row of the previous page.")]
+Limit = Annotated[Optional[int], fastapi.Query(ge=1, le=constants.MAX_PAGE_SIZE)]
+FromDate = Annotated[Optional[datetime.date], fastapi.Query(alias="from")]
+ToDate = Annotated[Optional[datetime.date], fastapi.Query(alias="to")]
+Format = Literal["json", "ndjson"]
+Guild = Annotated[int, fastapi.Query(description="Discord guild to read, DISCORD_GUILD_ID if not given.")]
+
+def get_page_response(request: fastapi.Request, model, rows: list[dict], limit: int) -> fastapi.Response:
+    """Encodes a page of rows as a list of model, with a Link to the next page if this one is full."""
+    headers = {}
+    if len(rows) == limit: headers["Link"] = f'<{request.url.include_query_params(after=rows[-1]["id"])}>; rel="next"'
+    return fastapi.Response(schemas.to_json(list[model], rows), media_type="application/json", headers=headers)
+
+def get_stream_response(statement, model, to_dict) -> fastapi.responses.StreamingResponse:
+    """Streams the rows of a statement as newline delimited JSON, reading them from a server-side cursor as they are sent."""
+    async def lines():
+        async with AsyncDataBaseSession() as db:
+            async for row in db.stream_scalars(statement):
+                yield schemas.to_json(model, to_dict(row)) + b"\n"
+    return fastapi.responses.StreamingResponse(lines(), media_type="application/x-ndjson")
 
 public = fastapi.APIRouter(prefix="/api/v1")
 authenticated = fastapi.APIRouter(prefix="/api/v1", dependencies=[fastapi.Depends(get_auth_user)])
 
 # -- sessions
 
-@public.get("/sessions")
-async def get_sessions():
-    with DataBaseSession() as db:
-        return [{ 
-            "id" : session.id, 
-            "date" : session.date 
-        } for session in db.get_sessions()]
+def get_session_response(session) -> dict:
+    return {
+        "id" : session.id,
+        "date" : session.date
+    }
+
+@public.get("/sessions", response_model=list[schemas.Session])
+@cached("sessions")
+async def get_sessions(request: fastapi.Request, after: After = None, limit: Limit = None, from_date: FromDate = None, to_date: ToDate = None, format: Format = "json", guild: Guild = constants.DISCORD_GUILD_ID):
+    """Gets a page of sessions in date order. With format=ndjson and no limit, streams every session instead."""
+    if format == "ndjson": return get_stream_response(data.select_sessions(guild, after, limit, from_date, to_date), schemas.Session, get_session_response)
+
+    limit = limit or constants.PAGE_SIZE
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        sessions = await db.get_sessions(after, limit, from_date, to_date)
+    return get_page_response(request, schemas.Session, [get_session_response(session) for session in sessions], limit)
     
 @public.get("/sessions/{id}")
-async def get_session_by_id(id: int):
-    with DataBaseSession() as db:
-        session = db.get_session_by_id(id)
+@cached("sessions", "members", "games", "session_members", "session_games")
+async def get_session_by_id(id: int, guild: Guild = constants.DISCORD_GUILD_ID) -> Optional[schemas.SessionDetail]:
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        session = await db.get_session_by_id(id)
         if session is None: return None
 
-        session_members = db.get_session_members_for_session(session.id)
-        session_games = db.get_session_games_for_session(session.id)
+        session_members = await db.get_session_members_for_session(session.id)
+        session_games = await db.get_session_games_for_session(session.id)
 
         return {
             "id" : session.id,
             "date" : session.date,
-            "games_master" : None,
+            "games_master" : None if session.games_master is None else {
+                "id" : session.games_master.id,
+                "name" : session.games_master.name,
+            },
             "members" : [{ 
                 "id" : session_member.member.id,
                 "name" : session_member.member.name,
@@ -51,95 +167,354 @@ async def get_session_by_id(id: int):
         }
 
 
+@public.get("/sessions/{id}/timeline")
+@cached("sessions", "games", "session_members", "session_games", "session_timelines")
+async def get_session_timeline(id: int, guild: Guild = constants.DISCORD_GUILD_ID) -> Optional[schemas.SessionTimeline]:
+    """Gets how many members were present and which games were active over a session, and its peak headcount.
+    The timeline of a closed session is stored the first time it is asked for, and served from then on."""
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        session = await db.get_session_by_id(id)
+        if session is None: return None
+
+        stored = await db.get_session_timeline(session.id)
+        if stored is not None: return stored
+
+        session_members = await db.get_session_members_for_session(session.id)
+        session_games = await db.get_session_games_for_session(session.id)
+        response = schemas.SessionTimeline.model_validate({
+            "id" : session.id,
+            "date" : session.date,
+            **timeline.get_timeline(
+                [(session_member.start, session_member.end, session_member.member_id) for session_member in session_members],
+                [(session_game.start, session_game.end, session_game.game_id) for session_game in session_games]),
+            "games" : [{
+                "id" : session_game.game.id,
+                "name" : session_game.game.name,
+            } for session_game in session_games],
+        }).model_dump(mode="json")
+        if calendar.is_closed(session.date, calendar.now()): await db.set_session_timeline(session.id, response)
+        return response
+
+class PutGamesMasterRequest(pydantic.BaseModel):
+    member_id: int | None = None
+
+@authenticated.put("/sessions/{id}/games_master")
+async def put_session_games_master(id: int, request: PutGamesMasterRequest, guild: Guild = constants.DISCORD_GUILD_ID):
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        if request.member_id is not None and await db.get_member_by_id(request.member_id) is None: raise fastapi.HTTPException(status_code=400, detail=f"Member [{request.member_id}] does not exist.")
+        if not await db.set_session_games_master(id, request.member_id): raise fastapi.HTTPException(status_code=404, detail=f"Session [{id}] does not exist.")
 
 # -- members
 
-@public.get("/members")
-async def get_members():
-    with DataBaseSession() as db:
-        return [{
-                "id" : member.id,
-                "name" : member.name,
-                "discord_name" : member.discord_name,
-            } for member in db.get_members()]
+def get_member_response(member) -> dict:
+    return {
+        "id" : member.id,
+        "name" : member.name,
+        "discord_name" : member.discord_name,
+    }
+
+def get_member_session_response(session_member) -> dict:
+    return {
+        "id" : session_member.session.id,
+        "date" : session_member.session.date,
+        "start" : session_member.start,
+        "end" : session_member.end,
+        "duration" : session_member.get_duration(),
+    }
+
+@public.get("/members", response_model=list[schemas.Member])
+@cached("members")
+async def get_members(request: fastapi.Request, after: After = None, limit: Limit = None, format: Format = "json", guild: Guild = constants.DISCORD_GUILD_ID):
+    """Gets a page of members in id order. With format=ndjson and no limit, streams every member instead."""
+    if format == "ndjson": return get_stream_response(data.select_members(guild, after, limit), schemas.Member, get_member_response)
+
+    limit = limit or constants.PAGE_SIZE
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        members = await db.get_members(after, limit)
+    return get_page_response(request, schemas.Member, [get_member_response(member) for member in members], limit)
 
 @public.get("/members/{id}")
-async def get_member_by_id(id: int):
-    with DataBaseSession() as db:
-        member = db.get_member_by_id(id)
+@cached("members", "games", "sessions", "member_games", "session_members", "member_stats")
+async def get_member_by_id(id: int, sessions_limit: Limit = constants.HISTORY_LIMIT, guild: Guild = constants.DISCORD_GUILD_ID) -> Optional[schemas.MemberDetail]:
+    """Gets a member with their games and first sessions_limit sessions, the rest are paged from /members/{id}/sessions."""
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        member = await db.get_member_by_id(id)
         if member is None: return None
 
-        member_games = db.get_member_games_for_member(member.id)
-        session_members = db.get_session_members_for_member(member.id)
+        member_games = await db.get_member_games_for_member(member.id)
+        session_members = await db.get_session_members_for_member(member.id, limit=sessions_limit)
+        stats = await db.get_member_stats(member.id)
 
         return {
             "id" : member.id,
             "name" : member.name,
             "discord_name" : member.discord_name,
             "number_of_games" : len(member_games),
-            "number_of_sessions" : len(session_members),
+            "number_of_sessions" : stats.sessions_attended,
             "games" : [{
                 "id" : member_game.game.id,
                 "name" : member_game.game.name,
             } for member_game in member_games],
-            "sessions" : [{
-                "id" : session_member.session.id,
-                "date" : session_member.session.date,
-                "start" : session_member.start,
-                "end" : session_member.end,
-                "duration" : session_member.get_duration(),
-            } for session_member in session_members]
+            "sessions" : [get_member_session_response(session_member) for session_member in session_members]
         }
 
+@public.get("/members/{id}/sessions", response_model=list[schemas.Attendance])
+@cached("sessions", "session_members")
+async def get_member_sessions(request: fastapi.Request, id: int, after: After = None, limit: Limit = None, from_date: FromDate = None, to_date: ToDate = None, format: Format = "json", guild: Guild = constants.DISCORD_GUILD_ID):
+    """Gets a page of the sessions a member attended in date order. With format=ndjson and no limit, streams all of them instead."""
+    if format == "ndjson": return get_stream_response(data.select_session_members_for_member(guild, id, after, limit, from_date, to_date), schemas.Attendance, get_member_session_response)
+
+    limit = limit or constants.PAGE_SIZE
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        session_members = await db.get_session_members_for_member(id, after, limit, from_date, to_date)
+    return get_page_response(request, schemas.Attendance, [get_member_session_response(session_member) for session_member in session_members], limit)
+
+@public.get("/members/{id}/stats")
+@cached("members", "sessions", "member_stats")
+async def get_member_stats_by_id(id: int, guild: Guild = constants.DISCORD_GUILD_ID) -> Optional[schemas.MemberStats]:
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        member = await db.get_member_by_id(id)
+        if member is None: return None
+
+        stats = await db.get_member_stats(member.id)
+        number_of_sessions = await db.get_number_of_sessions()
+        return get_member_stats_response(member, stats, number_of_sessions)
+
 class PostMemberRequest(pydantic.BaseModel):
     name: str
     discord_name: str
     is_admin: bool | None = None
 
 @authenticated.post("/members")
-async def post_members(request: PostMemberRequest):
-    with DataBaseSession() as db:
-        member = db.get_member_by_discord_name(request.discord_name)
+async def post_members(request: PostMemberRequest, guild: Guild = constants.DISCORD_GUILD_ID):
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        member = await db.get_member_by_discord_name(request.discord_name)
         if member is not None: raise fastapi.HTTPException(status_code=400, detail=f"Member with discord_name [{request.discord_name}] already exists.")  
-        db.add_member(request.name, request.discord_name, request.is_admin if request.is_admin is not None else False)
+        await db.add_member(request.name, request.discord_name, request.is_admin if request.is_admin is not None else False)
 
 # -- games
 
-@public.get("/games")
-async def get_games():
-    with DataBaseSession() as db:
-        return [{
-                "id" : game.id,
-                "name" : game.name,
-            } for game in db.get_games()]
+def get_game_response(game) -> dict:
+    return {
+        "id" : game.id,
+        "name" : game.name,
+    }
+
+def get_game_session_response(session_game) -> dict:
+    return {
+        "id" : session_game.session.id,
+        "date" : session_game.session.date,
+        "start" : session_game.start,
+        "end" : session_game.end,
+        "duration" : session_game.get_duration(),
+    }
+
+@public.get("/games", response_model=list[schemas.Game])
+@cached("games")
+async def get_games(request: fastapi.Request, after: After = None, limit: Limit = None, format: Format = "json", guild: Guild = constants.DISCORD_GUILD_ID):
+    """Gets a page of games in id order. With format=ndjson and no limit, streams every game instead."""
+    if format == "ndjson": return get_stream_response(data.select_games(guild, after, limit), schemas.Game, get_game_response)
+
+    limit = limit or constants.PAGE_SIZE
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        games = await db.get_games(after, limit)
+    return get_page_response(request, schemas.Game, [get_game_response(game) for game in games], limit)
     
+@public.get("/games/{id}/stats")
+@cached("games", "sessions", "game_stats")
+async def get_game_stats_by_id(id: int, guild: Guild = constants.DISCORD_GUILD_ID) -> Optional[schemas.GameStats]:
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        game = await db.get_game_by_id(id)
+        if game is None: return None
+
+        stats = await db.get_game_stats(game.id)
+        number_of_sessions = await db.get_number_of_sessions()
+        return get_game_stats_response(game, stats, number_of_sessions)
+
 @public.get("/games/{id}")
-async def get_game_by_id(id: int):
-    with DataBaseSession() as db:
-        game = db.get_game_by_id(id)
+@cached("games", "members", "sessions", "member_games", "session_games", "game_stats")
+async def get_game_by_id(id: int, sessions_limit: Limit = constants.HISTORY_LIMIT, guild: Guild = constants.DISCORD_GUILD_ID) -> Optional[schemas.GameDetail]:
+    """Gets a game with its members and first sessions_limit sessions, the rest are paged from /games/{id}/sessions."""
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        game = await db.get_game_by_id(id)
         if game is None: return None
 
-        member_games = db.get_member_games_for_game(game.id)
-        session_games = db.get_session_games_for_game(game.id)
+        member_games = await db.get_member_games_for_game(game.id)
+        session_games = await db.get_session_games_for_game(game.id, limit=sessions_limit)
+        stats = await db.get_game_stats(game.id)
 
         return {
             "id" : game.id,
             "name" : game.name,
             "number_of_members" : len(member_games),
-            "number_of_sessions" : len(session_games),
+            "number_of_sessions" : stats.sessions_played,
             "members" : [{
                 "id" : member_game.member.id,
                 "name" : member_game.member.name,
             } for member_game in member_games],
-            "sessions" : [{
-                "id" : session_game.session.id,
-                "date" : session_game.session.date,
-                "start" : session_game.start,
-                "end" : session_game.end,
-                "duration" : session_game.get_duration(),
-            } for session_game in session_games]
+            "sessions" : [get_game_session_response(session_game) for session_game in session_games]
         }
 
+@public.get("/games/{id}/sessions", response_model=list[schemas.Attendance])
+@cached("sessions", "session_games")
+async def get_game_sessions(request: fastapi.Request, id: int, after: After = None, limit: Limit = None, from_date: FromDate = None, to_date: ToDate = None, format: Format = "json", guild: Guild = constants.DISCORD_GUILD_ID):
+    """Gets a page of the sessions a game was played in date order. With format=ndjson and no limit, streams all of them instead."""
+    if format == "ndjson": return get_stream_response(data.select_session_games_for_game(guild, id, after, limit, from_date, to_date), schemas.Attendance, get_game_session_response)
+
+    limit = limit or constants.PAGE_SIZE
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        session_games = await db.get_session_games_for_game(id, after, limit, from_date, to_date)
+    return get_page_response(request, schemas.Attendance, [get_game_session_response(session_game) for session_game in session_games], limit)
+
+class PostGameAliasRequest(pydantic.BaseModel):
+    name: str
+
+@authenticated.post("/games/{id}/aliases")
+async def post_game_alias(id: int, request: PostGameAliasRequest, guild: Guild = constants.DISCORD_GUILD_ID):
+    """Makes a name resolve to the game from now on. Sessions already compacted keep their games until `manage.py merge-games` is run."""
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        if await db.get_game_by_id(id) is None: raise fastapi.HTTPException(status_code=404, detail=f"Game [{id}] does not exist.")
+        if not await db.add_game_alias(id, request.name): raise fastapi.HTTPException(status_code=400, detail=f"Game name [{request.name}] is already in use.")
+
+# -- stats
+
+def get_proportion(count: int, total: int) -> float:
+    return count / total if total > 0 else 0.0
+
+def get_member_stats_response(member: Member, stats: Optional[MemberStats], number_of_sessions: int) -> dict:
+    if stats is None: stats = MemberStats(sessions_attended=0, games_played=0, games_mastered=0)
+    return {
+        "id" : member.id,
+        "name" : member.name,
+        "sessions_attended" : stats.sessions_attended,
+        "games_played" : stats.games_played,
+        "games_mastered" : stats.games_mastered,
+        "attendance_proportion" : get_proportion(stats.sessions_attended, number_of_sessions),
+    }
+
+def get_game_stats_response(game: Game, stats: Optional[GameStats], number_of_sessions: int) -> dict:
+    if stats is None: stats = GameStats(sessions_played=0, members_played=0)
+    return {
+        "id" : game.id,
+        "name" : game.name,
+        "sessions_played" : stats.sessions_played,
+        "members_played" : stats.members_played,
+        "session_proportion" : get_proportion(stats.sessions_played, number_of_sessions),
+    }
+
+@public.get("/stats/members")
+@cached("members", "sessions", "member_stats")
+async def get_all_member_stats(guild: Guild = constants.DISCORD_GUILD_ID) -> list[schemas.MemberStats]:
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        number_of_sessions = await db.get_number_of_sessions()
+        return [get_member_stats_response(member, stats, number_of_sessions) for member, stats in await db.get_all_member_stats()]
+
+@public.get("/stats/games")
+@cached("games", "sessions", "game_stats")
+async def get_all_game_stats(guild: Guild = constants.DISCORD_GUILD_ID) -> list[schemas.GameStats]:
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        number_of_sessions = await db.get_number_of_sessions()
+        return [get_game_stats_response(game, stats, number_of_sessions) for game, stats in await db.get_all_game_stats()]
+
+class StreakCache:
+    """Keeps a streak matrix per guild in memory between requests, appending new sessions rather than reloading all history."""
+
+    def __init__(self, get_pairs: str):
+        self.get_pairs = get_pairs
+        self.matrices: dict[int, streaks.StreakMatrix] = {}
+        self.lock = asyncio.Lock()
+
+    async def get(self, db: AsyncDataBaseSession) -> streaks.StreakMatrix:
+        async with self.lock:
+            self.matrices[db.guild_id] = await db.run_sync(lambda db: streaks.refresh(db, self.matrices.get(db.guild_id), getattr(db, self.get_pairs)))
+            return self.matrices[db.guild_id]
+
+member_streaks = StreakCache("get_session_member_dates")
+game_streaks = StreakCache("get_session_game_dates")
+
+@public.get("/stats/streaks/members")
+@cached("sessions", "session_members")
+async def get_member_streaks(guild: Guild = constants.DISCORD_GUILD_ID) -> list[schemas.Streak]:
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        matrix = await member_streaks.get(db)
+        return matrix.to_dicts()
+
+@public.get("/stats/streaks/games")
+@cached("sessions", "session_games")
+async def get_game_streaks(guild: Guild = constants.DISCORD_GUILD_ID) -> list[schemas.Streak]:
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        matrix = await game_streaks.get(db)
+        return matrix.to_dicts()
+
+class CoPlayCache:
+    """Keeps a co-play graph per guild in memory between requests, computing only new sessions rather than all history."""
+
+    def __init__(self):
+        self.graphs: dict[int, coplay.CoPlayGraph] = {}
+        self.lock = asyncio.Lock()
+
+    async def get(self, db: AsyncDataBaseSession) -> coplay.CoPlayGraph:
+        async with self.lock:
+            self.graphs[db.guild_id] = await db.run_sync(lambda db: coplay.refresh(db, self.graphs.get(db.guild_id)))
+            return self.graphs[db.guild_id]
+
+coplay_graphs = CoPlayCache()
+
+@public.get("/stats/coplay")
+@cached("sessions", "session_members", "session_games", "member_games")
+async def get_coplay(member: Optional[int] = None, guild: Guild = constants.DISCORD_GUILD_ID) -> list[schemas.CoPlay]:
+    """Gets, for each pair of members, the sessions they shared and the time they spent together and playing the
+    same game, optionally only the pairs including one member."""
+    async with AsyncDataBaseSession(guild_id=guild) as db:
+        graph = await coplay_graphs.get(db)
+        return graph.to_dicts(member)
+
 app = fastapi.FastAPI()
 app.include_router(public)
 app.include_router(authenticated)
+
+# --- Metrics ---
+
+@app.middleware("http")
+async def record_metrics(request: fastapi.Request, call_next):
+    """Records the metrics of every request, and profiles it when an authenticated caller sends an X-Profile header.
+    A profiled response names its profile in X-Profile and carries its phases in Server-Timing."""
+    start = time.perf_counter()
+    profiled = "x-profile" in request.headers and is_authorised(request.headers.get("token"))
+    with metrics.statement_scope() as scope:
+        with profiling.profile(request.url.path, scope) if profiled else contextlib.nullcontext() as profile:
+            response = await call_next(request)
+            # label by route template rather than path, so /members/1 and /members/2 share a series
+            route = request.scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            if profile is not None: profile.name = f"{request.method} {path}"
+    if profile is not None:
+        response.headers["X-Profile"] = os.path.basename(profile.path)
+        response.headers["Server-Timing"] = profile.get_server_timing()
+    metrics.REQUEST_SECONDS.labels(request.method, path, response.status_code).observe(time.perf_counter() - start)
+    metrics.REQUEST_STATEMENTS.labels(request.method, path).observe(scope.count)
+    metrics.REQUEST_STATEMENT_SECONDS.labels(request.method, path).observe(scope.seconds)
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return fastapi.Response(metrics.generate(), media_type=metrics.CONTENT_TYPE)
+
+# --- Health ---
+
+@app.get("/healthz", include_in_schema=False)
+def get_health():
+    """Answers as long as the worker is serving requests."""
+    return {"status" : "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def get_readiness():
+    """Answers 200 only while the worker can reach the database, so a load balancer can route around it otherwise."""
+    try:
+        async with AsyncDataBaseSession() as db:
+            await db.ping()
+    except Exception as e:
+        # driver errors can name hosts and users, so they are only logged
+        print(f"Readiness check failed: {e}")
+        return fastapi.responses.JSONResponse({"status" : "unavailable", "detail" : "database unavailable"}, status_code=503)
+    return {"status" : "ok"}
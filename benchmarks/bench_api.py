@@ -0,0 +1,100 @@
+"""Drives every app.py route in-process at several data sizes, reporting throughput, latency and statements per request.
+
+Histories come from benchmarks.generate. The response cache is cleared before each request so the numbers
+measure the data access behind a route, pass --cached to measure cache hits instead. A route whose statements
+grow with the data size is usually a query in a loop or a list read without a limit.
+
+    python -m benchmarks.bench_api --sizes small medium large --requests 50
+"""
+import os
+import time
+import argparse
+import tempfile
+import dataclasses
+
+os.environ.setdefault("CONNECTION_STRING", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("MASTER_API_TOKEN", "bench")
+
+import numpy as np
+import fastapi.routing
+import fastapi.testclient
+import sqlalchemy
+import constants
+import data
+import app
+from benchmarks import generate
+
+@dataclasses.dataclass(frozen=True)
+class Result:
+    route: str
+    requests: int
+    seconds: float
+    p50: float
+    p99: float
+    statements: float
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.seconds
+
+# sample values for each path parameter, ids near the middle of the generated history
+PATH_PARAMETERS = {"id" : lambda size: size.members // 2}
+BODIES = {
+    ("PUT", "/api/v1/sessions/{id}/games_master") : lambda i: {"member_id" : 1},
+    ("POST", "/api/v1/members") : lambda i: {"name" : f"bench-{i}", "discord_name" : f"bench-{i}"},
+    # an alias that is already taken is rejected, so each request adds a new one
+    ("POST", "/api/v1/games/{id}/aliases") : lambda i: {"name" : f"bench alias {i}"},
+}
+
+def get_routes() -> list[tuple[str, str]]:
+    # depending on the fastapi version, the app's router holds copies of the included routes as well, so only
+    # the first of each method and path is kept
+    routes = [route for router in (app.public, app.authenticated, app.app.router) for route in router.routes if isinstance(route, fastapi.routing.APIRoute)]
+    return list(dict.fromkeys((method, route.path) for route in routes for method in sorted(route.methods)))
+
+def run_route(client: fastapi.testclient.TestClient, method: str, path: str, size: generate.Size, requests: int, cached: bool) -> Result:
+    url = path.format(**{name: get(size) for name, get in PATH_PARAMETERS.items()})
+    get_body = BODIES.get((method, path))
+    statements = []
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    timings, counts = [], []
+    engines = [data.get_engine(), data.get_async_engine().sync_engine]
+    for engine in engines: sqlalchemy.event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        for i in range(requests):
+            if not cached: app.response_cache.clear()
+            statements.clear()
+            start = time.perf_counter()
+            response = client.request(method, url, json=None if get_body is None else get_body(i), headers={"token" : constants.MASTER_API_TOKEN})
+            timings.append(time.perf_counter() - start)
+            counts.append(len(statements))
+            if response.status_code >= 400: raise Exception(f"{method} {url} failed with {response.status_code}: {response.text}")
+    finally:
+        for engine in engines: sqlalchemy.event.remove(engine, "before_cursor_execute", on_execute)
+
+    timings = np.array(timings)
+    return Result(f"{method} {path}", requests, timings.sum(), np.percentile(timings, 50), np.percentile(timings, 99), float(np.mean(counts)))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks every API route against generated histories.")
+    parser.add_argument("--sizes", nargs="+", choices=generate.SIZES.keys(), default=["small", "medium"])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cached", action="store_true", help="keep the response cache between requests")
+    arguments = parser.parse_args()
+
+    client = fastapi.testclient.TestClient(app.app)
+    for name in arguments.sizes:
+        size = generate.SIZES[name]
+        counts = generate.generate(size, arguments.seed)
+        app.response_cache.clear()
+        print(f"\n{name}: " + ", ".join(f"{count} {table}" for table, count in counts.items()))
+        print(f"  {'route':<48} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'stmts':>6}")
+        for method, path in get_routes():
+            result = run_route(client, method, path, size, arguments.requests, arguments.cached)
+            print(f"  {result.route:<48} {result.throughput:8.0f} {result.p50 * 1000:8.2f} {result.p99 * 1000:8.2f} {result.statements:6.1f}")
+
+if __name__ == "__main__":
+    main()
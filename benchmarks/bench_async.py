@@ -0,0 +1,83 @@
+"""Shows that concurrent API requests no longer queue behind each other's database calls.
+
+Each statement is given an artificial round trip latency, standing in for a remote Postgres server. The
+blocking variant runs the same queries through DataBaseSession inside an `async def` route, which is how
+app.py used to work, and the async variant calls the real app.py routes.
+
+    python -m benchmarks.bench_async
+"""
+import os
+import time
+import asyncio
+import tempfile
+import datetime
+
+os.environ.setdefault("CONNECTION_STRING", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+import fastapi
+import httpx
+import sqlalchemy
+import data
+import app
+from data import DataBaseSession
+from model import Base
+
+LATENCY = 0.02 # seconds added to every statement
+CONCURRENCY = 10
+
+blocking = fastapi.FastAPI()
+
+@blocking.get("/api/v1/sessions/{id}")
+async def get_session_by_id(id: int):
+    with DataBaseSession() as db:
+        session = db.get_session_by_id(id)
+        return {
+            "id" : session.id,
+            "members" : [session_member.member.name for session_member in db.get_session_members_for_session(session.id)],
+            "games" : [session_game.game.name for session_game in db.get_session_games_for_session(session.id)],
+        }
+
+def populate() -> None:
+    Base.metadata.create_all(data.get_engine())
+    with DataBaseSession() as db:
+        session = db.add_session(datetime.date(2025, 10, 24))
+        start = datetime.datetime(2025, 10, 24, 18)
+        for i in range(5):
+            member = db.add_member(f"member-{i}", f"discord-{i}")
+            game = db.add_game(f"game-{i}")
+            db.add_session_member(member.id, session.id, start, start)
+            db.add_session_game(session.id, game.id, start, start)
+
+def add_latency(statement: str) -> None:
+    time.sleep(LATENCY)
+
+def on_connect(dbapi_connection, connection_record):
+    # sqlite calls the trace callback on whichever thread runs the statement, which for aiosqlite is its worker thread
+    if hasattr(dbapi_connection, "driver_connection"):
+        sqlalchemy.util.await_(dbapi_connection.driver_connection.set_trace_callback(add_latency))
+    else:
+        dbapi_connection.set_trace_callback(add_latency)
+
+async def measure(application: fastapi.FastAPI) -> float:
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[client.get("/api/v1/sessions/1") for _ in range(CONCURRENCY)])
+        elapsed = time.perf_counter() - start
+    assert all(response.status_code == 200 for response in responses)
+    return elapsed
+
+def main() -> None:
+    populate()
+    for engine in (data.get_engine(), data.get_async_engine().sync_engine):
+        engine.dispose()
+        sqlalchemy.event.listen(engine, "connect", on_connect)
+
+    blocking_time = asyncio.run(measure(blocking))
+    async_time = asyncio.run(measure(app.app))
+    print(f"{CONCURRENCY} concurrent requests, {LATENCY * 1000:.0f}ms per statement")
+    print(f"  blocking : {blocking_time * 1000:8.1f}ms")
+    print(f"  async    : {async_time * 1000:8.1f}ms ({blocking_time / async_time:.1f}x)")
+
+if __name__ == "__main__":
+    main()
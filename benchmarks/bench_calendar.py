@@ -0,0 +1,35 @@
+"""Compares classifying a year of interval timestamps with SessionCalendar.classify against a per-row loop.
+
+    python -m benchmarks.bench_calendar
+"""
+import os
+import time
+import datetime
+
+os.environ.setdefault("CONNECTION_STRING", "sqlite://")
+
+import numpy as np
+from session_calendar import calendar
+
+NUMBER_OF_TIMESTAMPS = 1_000_000
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    timestamps = np.datetime64("2025-01-01T00:00", "m") + rng.integers(0, 60 * 24 * 365, NUMBER_OF_TIMESTAMPS).astype("timedelta64[m]")
+    rows = timestamps.astype(datetime.datetime).tolist()
+
+    start = time.perf_counter()
+    looped = [calendar.get_session_date(row) for row in rows]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    classified = calendar.classify(timestamps)
+    classify_time = time.perf_counter() - start
+
+    assert sum(date is not None for date in looped) == np.count_nonzero(~np.isnat(classified))
+    print(f"{NUMBER_OF_TIMESTAMPS:,} timestamps")
+    print(f"  loop     : {loop_time * 1000:8.1f}ms")
+    print(f"  classify : {classify_time * 1000:8.1f}ms ({loop_time / classify_time:.0f}x)")
+
+if __name__ == "__main__":
+    main()
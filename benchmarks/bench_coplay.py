@@ -0,0 +1,80 @@
+"""Compares the sweep-line co-play engine against comparing every pair of intervals in each session.
+
+Uses 10 years of weekly sessions with a few dozen members dropping in and out of each.
+
+    python -m benchmarks.bench_coplay
+"""
+import os
+import time
+import datetime
+
+os.environ.setdefault("CONNECTION_STRING", "sqlite://")
+
+import numpy as np
+import coplay
+
+NUMBER_OF_SESSIONS = 52 * 10
+NUMBER_OF_MEMBERS = 60
+NUMBER_OF_GAMES = 40
+REPEATS = 3
+
+def generate_sessions(rng: np.random.Generator) -> list[tuple[list, list]]:
+    sessions = []
+    for week in range(NUMBER_OF_SESSIONS):
+        start = datetime.datetime(2015, 1, 2, 18) + datetime.timedelta(weeks=week)
+        members = []
+        for member_id in np.nonzero(rng.random(NUMBER_OF_MEMBERS) < 0.6)[0].tolist():
+            # members drop in and out, so each has a few intervals in the evening
+            for _ in range(rng.integers(1, 4)):
+                minute = int(rng.integers(0, 600))
+                members.append((start + datetime.timedelta(minutes=minute), start + datetime.timedelta(minutes=minute + int(rng.integers(10, 180))), member_id))
+        games = []
+        for game_id in rng.choice(NUMBER_OF_GAMES, 8, replace=False).tolist():
+            minute = int(rng.integers(0, 600))
+            games.append((start + datetime.timedelta(minutes=minute), start + datetime.timedelta(minutes=minute + int(rng.integers(30, 240))), game_id))
+        sessions.append((members, games))
+    return sessions
+
+def get_overlaps_naively(intervals) -> dict:
+    overlaps = {}
+    for i, (start, end, id) in enumerate(intervals):
+        for other_start, other_end, other in intervals[i + 1:]:
+            overlap = min(end, other_end) - max(start, other_start)
+            if id == other or overlap <= datetime.timedelta(): continue
+            pair = (min(id, other), max(id, other))
+            overlaps[pair] = overlaps.get(pair, datetime.timedelta()) + overlap
+    return overlaps
+
+def measure(func) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    sessions = generate_sessions(rng)
+    players = {game_id: set(np.nonzero(rng.random(NUMBER_OF_MEMBERS) < 0.4)[0].tolist()) for game_id in range(NUMBER_OF_GAMES)}
+    print(f"{NUMBER_OF_SESSIONS} sessions, {sum(len(members) for members, _ in sessions)} member intervals")
+
+    for members, _ in sessions[:20]: assert dict(coplay.get_overlaps(members)) == get_overlaps_naively(members)
+
+    naive = measure(lambda: [get_overlaps_naively(members) for members, _ in sessions])
+    sweep = measure(lambda: [coplay.get_overlaps(members) for members, _ in sessions])
+    full = measure(lambda: [coplay.get_session_coplay(members, games, players) for members, games in sessions])
+
+    graph = coplay.CoPlayGraph(players)
+    for week, (members, games) in enumerate(sessions[:-1]): graph.set_session(datetime.date(2015, 1, 2) + datetime.timedelta(weeks=week), coplay.get_session_coplay(members, games, players))
+    start = time.perf_counter()
+    graph.set_session(datetime.date(2015, 1, 2) + datetime.timedelta(weeks=NUMBER_OF_SESSIONS - 1), coplay.get_session_coplay(*sessions[-1], players))
+    append = time.perf_counter() - start
+
+    print(f"  every pair          : {naive * 1000:8.1f}ms")
+    print(f"  sweep line          : {sweep * 1000:8.1f}ms ({naive / sweep:.1f}x)")
+    print(f"    with same game    : {full * 1000:8.1f}ms")
+    print(f"  add 1 session       : {append * 1000:8.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compares importing history row by row, one commit per add_* call, against importer.Importer's batched upserts.
+
+Uses a few years of weekly sessions, each row a member's attendance and the game they played. Writes to
+CONNECTION_STRING, a throwaway SQLite file by default or a local Postgres to measure COPY.
+
+    python -m benchmarks.bench_import
+"""
+import os
+import time
+import datetime
+import tempfile
+
+os.environ.setdefault("CONNECTION_STRING", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+import numpy as np
+import data
+import importer
+from model import Base
+
+NUMBER_OF_SESSIONS = 52 * 3
+NUMBER_OF_MEMBERS = 30
+NUMBER_OF_GAMES = 40
+
+def generate_rows(rng: np.random.Generator) -> list[dict]:
+    rows = []
+    for week in range(NUMBER_OF_SESSIONS):
+        start = datetime.datetime(2016, 1, 1, 18) + datetime.timedelta(weeks=week)
+        for member in np.nonzero(rng.random(NUMBER_OF_MEMBERS) < 0.6)[0].tolist():
+            minute = int(rng.integers(0, 300))
+            rows.append({
+                "date" : start.date().isoformat(),
+                "member" : f"member-{member}",
+                "start" : (start + datetime.timedelta(minutes=minute)).isoformat(),
+                "end" : (start + datetime.timedelta(minutes=minute + int(rng.integers(30, 300)))).isoformat(),
+                "game" : f"Game {int(rng.integers(NUMBER_OF_GAMES))}",
+            })
+    return rows
+
+def reset() -> None:
+    Base.metadata.drop_all(data.get_engine())
+    Base.metadata.create_all(data.get_engine())
+
+def import_per_row(rows: list[dict]) -> None:
+    with data.DataBaseSession() as db:
+        for number, row in enumerate(rows, start=1):
+            date, member, name, start, end, game = importer.parse_row(number, row)
+            session = db.get_session_by_date(date) or db.add_session(date)
+            member_id = (db.get_member_by_discord_name(member) or db.add_member(name or member, member)).id
+            game_id = db.get_or_create_game(game).id
+            db.add_session_member(member_id, session.id, start, end)
+            db.add_session_game(session.id, game_id, start, end)
+            db.get_or_add_member_game(member_id, game_id)
+
+def import_batched(rows: list[dict]) -> None:
+    with data.DataBaseSession(autocommit=False) as db:
+        importer.Importer(db).run(rows)
+
+def measure(func, rows: list[dict]) -> float:
+    reset()
+    start = time.perf_counter()
+    func(rows)
+    return time.perf_counter() - start
+
+def main() -> None:
+    rows = generate_rows(np.random.default_rng(0))
+    print(f"{len(rows)} rows into {data.get_engine().dialect.name}")
+
+    # per row add_session_game only inserts, so keep one row per (session, game) to compare like with like
+    unique, seen = [], set()
+    for row in rows:
+        if (row["date"], row["game"]) not in seen: unique.append(row)
+        seen.add((row["date"], row["game"]))
+
+    per_row = measure(import_per_row, unique)
+    batched = measure(import_batched, unique)
+    print(f"  per row             : {per_row:8.2f}s ({len(unique) / per_row:8.0f} rows/sec)")
+    print(f"  batched             : {batched:8.2f}s ({len(unique) / batched:8.0f} rows/sec, {per_row / batched:.1f}x)")
+
+if __name__ == "__main__":
+    main()
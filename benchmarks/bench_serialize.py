@@ -0,0 +1,69 @@
+"""Compares serializing API responses through fastapi's jsonable_encoder, as every route used to, against
+validating them as the models in schemas and serializing them with pydantic.
+
+Uses member detail payloads with ever longer histories, and a page of session rows.
+
+    python -m benchmarks.bench_serialize
+"""
+import os
+import json
+import time
+import datetime
+
+os.environ.setdefault("CONNECTION_STRING", "sqlite://")
+
+import fastapi.encoders
+import schemas
+
+HISTORY_SIZES = [100, 1000, 10000]
+REPEATS = 5
+
+def generate_member(number_of_sessions: int) -> dict:
+    start = datetime.datetime(2015, 1, 2, 18)
+    return {
+        "id" : 1,
+        "name" : "Tom",
+        "discord_name" : "tom",
+        "number_of_games" : 50,
+        "number_of_sessions" : number_of_sessions,
+        "games" : [{"id" : i, "name" : f"Game {i}"} for i in range(50)],
+        "sessions" : [{
+            "id" : i,
+            "date" : (start + datetime.timedelta(weeks=i)).date(),
+            "start" : start + datetime.timedelta(weeks=i),
+            "end" : start + datetime.timedelta(weeks=i, hours=5),
+            "duration" : datetime.timedelta(hours=4, minutes=i % 60),
+        } for i in range(number_of_sessions)],
+    }
+
+def encode_generically(content) -> bytes:
+    # what fastapi.responses.JSONResponse(jsonable_encoder(content)) does
+    return json.dumps(fastapi.encoders.jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+def measure(func) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main() -> None:
+    for size in HISTORY_SIZES:
+        member = generate_member(size)
+        assert json.loads(encode_generically(member)) == json.loads(schemas.to_json(schemas.MemberDetail, member))
+        generic = measure(lambda: encode_generically(member))
+        typed = measure(lambda: schemas.to_json(schemas.MemberDetail, member))
+        print(f"member detail, {size:>5} sessions")
+        print(f"  jsonable_encoder    : {generic * 1000:8.2f}ms")
+        print(f"  response model      : {typed * 1000:8.2f}ms ({generic / typed:.1f}x)")
+
+    page = generate_member(1000)["sessions"]
+    generic = measure(lambda: encode_generically(page))
+    typed = measure(lambda: schemas.to_json(list[schemas.Attendance], page))
+    print(f"page of {len(page)} sessions")
+    print(f"  jsonable_encoder    : {generic * 1000:8.2f}ms")
+    print(f"  response model      : {typed * 1000:8.2f}ms ({generic / typed:.1f}x)")
+
+if __name__ == "__main__":
+    main()
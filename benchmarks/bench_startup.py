@@ -0,0 +1,56 @@
+"""Measures how long the web and bot processes take to start, in fresh interpreters as a container restart would.
+
+Reports the time to import each entry point, which should involve no database work, and the time until the
+first query has been answered, which includes creating the engine and opening its first connection.
+
+    python -m benchmarks.bench_startup --repeats 5
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# each stage prints the seconds since the interpreter started, measured inside the child process
+WEB = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+import fastapi.testclient
+assert fastapi.testclient.TestClient(app.app).get("/api/v1/sessions").status_code == 200
+print(json.dumps({"import" : imported - start, "first query" : time.perf_counter() - start}))
+"""
+
+BOT = """
+import time
+start = time.perf_counter()
+import bot
+imported = time.perf_counter()
+import asyncio
+asyncio.run(bot.directory.load())
+print(json.dumps({"import" : imported - start, "first query" : time.perf_counter() - start}))
+"""
+
+def run(script: str, environment: dict[str, str]) -> dict[str, float]:
+    completed = subprocess.run([sys.executable, "-c", "import json\n" + script], env=environment, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measures process startup time for the web and bot entry points.")
+    parser.add_argument("--repeats", type=int, default=5)
+    arguments = parser.parse_args()
+
+    environment = dict(os.environ)
+    environment.setdefault("CONNECTION_STRING", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}")
+    environment.setdefault("METRICS_PORT", "0")
+    subprocess.run([sys.executable, "manage.py", "migrate"], env=environment, capture_output=True, check=True)
+
+    for name, script in [("web", WEB), ("bot", BOT)]:
+        timings = [run(script, environment) for _ in range(arguments.repeats)]
+        print(f"{name}: " + ", ".join(f"{stage} {statistics.median(timing[stage] for timing in timings) * 1000:.0f}ms" for stage in timings[0]) + f" (median of {arguments.repeats})")
+
+if __name__ == "__main__":
+    main()
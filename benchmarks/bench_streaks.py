@@ -0,0 +1,72 @@
+"""Compares the vectorised streak engine against walking each member's sessions in Python.
+
+Uses 10 years of weekly sessions and a few hundred members, each with their own attendance rate.
+
+    python -m benchmarks.bench_streaks
+"""
+import os
+import time
+import datetime
+
+os.environ.setdefault("CONNECTION_STRING", "sqlite://")
+
+import numpy as np
+from streaks import StreakMatrix
+
+NUMBER_OF_SESSIONS = 52 * 10
+NUMBER_OF_MEMBERS = 300
+REPEATS = 5
+
+def generate_pairs(rng: np.random.Generator) -> tuple[list[datetime.date], list[tuple[datetime.date, int]]]:
+    dates = [datetime.date(2015, 1, 2) + datetime.timedelta(weeks=i) for i in range(NUMBER_OF_SESSIONS)]
+    rates = rng.uniform(0.1, 0.95, NUMBER_OF_MEMBERS)
+    attended = rng.random((NUMBER_OF_MEMBERS, NUMBER_OF_SESSIONS)) < rates[:, None]
+    rows, columns = np.nonzero(attended)
+    return dates, [(dates[column], int(row)) for row, column in zip(rows.tolist(), columns.tolist())]
+
+def get_streaks_naively(dates: list[datetime.date], pairs: list[tuple[datetime.date, int]]) -> dict[int, tuple[int, int, int]]:
+    """One ordered walk over every session per member, as a per-member query loop would do."""
+    attended = {}
+    for date, id in pairs: attended.setdefault(id, set()).add(date)
+    results = {}
+    for id, member_dates in attended.items():
+        current = longest = 0
+        for date in dates:
+            current = current + 1 if date in member_dates else 0
+            longest = max(longest, current)
+        results[id] = (current, longest, len(member_dates))
+    return results
+
+def measure(func) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main() -> None:
+    dates, pairs = generate_pairs(np.random.default_rng(0))
+    print(f"{NUMBER_OF_MEMBERS} members x {NUMBER_OF_SESSIONS} sessions, {len(pairs)} attendances")
+
+    naive = measure(lambda: get_streaks_naively(dates, pairs))
+    vectorised = measure(lambda: StreakMatrix.from_pairs(dates, pairs))
+    loaded = StreakMatrix.from_pairs(dates, pairs)
+    streaks_only = measure(lambda: StreakMatrix(loaded.ids, dates, loaded.attended))
+
+    matrix = StreakMatrix.from_pairs(dates[:-1], [pair for pair in pairs if pair[0] != dates[-1]])
+    last = [id for date, id in pairs if date == dates[-1]]
+    start = time.perf_counter()
+    matrix.append(dates[-1], last)
+    append = time.perf_counter() - start
+
+    expected = get_streaks_naively(dates, pairs)
+    assert {row["id"]: (row["current_streak"], row["longest_streak"], row["total"]) for row in matrix.to_dicts()} == expected
+
+    print(f"  python walk      : {naive * 1000:8.2f}ms")
+    print(f"  vectorised build : {vectorised * 1000:8.2f}ms ({naive / vectorised:.0f}x)")
+    print(f"    streaks only   : {streaks_only * 1000:8.2f}ms")
+    print(f"  append 1 session : {append * 1000:8.3f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Measures API throughput as the number of uvicorn workers grows, on one machine.
+
+Generates a history into CONNECTION_STRING, then for each worker count starts `uvicorn app:app --workers N` and
+drives it with concurrent clients for a fixed time, spread over detail, list and stats routes. The response
+cache is disabled so every request does its full work. Throughput can only scale up to the number of cores.
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --clients 16 --seconds 10
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+os.environ.setdefault("CONNECTION_STRING", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+import httpx
+import numpy as np
+from benchmarks import generate
+
+ROUTES = [
+    lambda rng, size: f"/api/v1/members/{rng.integers(1, size.members + 1)}",
+    lambda rng, size: f"/api/v1/games/{rng.integers(1, size.games + 1)}",
+    lambda rng, size: f"/api/v1/sessions?limit=100&after={rng.integers(0, 50)}",
+    lambda rng, size: "/api/v1/stats/members",
+]
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    environment = os.environ | {
+        "WEB_CONCURRENCY" : str(workers),
+        "RESPONSE_CACHE_SIZE" : "0",
+        "PROMETHEUS_MULTIPROC_DIR" : tempfile.mkdtemp(),
+    }
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"], env=environment)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/readyz").status_code == 200: return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise Exception(f"The server with [{workers}] workers didn't become ready.")
+
+def drive(port: int, size: generate.Size, clients: int, seconds: float) -> tuple[int, int]:
+    """Sends requests from clients threads for seconds, returning the (requests, errors)."""
+    counts = [[0, 0] for _ in range(clients)]
+    deadline = time.monotonic() + seconds
+
+    def run(index: int) -> None:
+        rng = np.random.default_rng(index)
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while time.monotonic() < deadline:
+                route = ROUTES[rng.integers(len(ROUTES))]
+                response = client.get(route(rng, size))
+                counts[index][0] += 1
+                if response.status_code != 200: counts[index][1] += 1
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(clients)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return sum(requests for requests, _ in counts), sum(errors for _, errors in counts)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks API throughput by worker count.")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--size", choices=generate.SIZES.keys(), default="small")
+    arguments = parser.parse_args()
+
+    size = generate.SIZES[arguments.size]
+    counts = generate.generate(size)
+    print(f"{arguments.size}: " + ", ".join(f"{count} {table}" for table, count in counts.items()) + f", {os.cpu_count()} cores")
+    print(f"  {'workers':>7} {'req/s':>8} {'errors':>7} {'scaling':>8}")
+
+    baseline = None
+    for workers in arguments.workers:
+        port = get_free_port()
+        server = start_server(workers, port)
+        try:
+            requests, errors = drive(port, size, arguments.clients, arguments.seconds)
+        finally:
+            server.terminate()
+            server.wait()
+        throughput = requests / arguments.seconds
+        baseline = baseline or throughput
+        print(f"  {workers:>7} {throughput:>8.0f} {errors:>7} {throughput / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
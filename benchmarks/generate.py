@@ -0,0 +1,114 @@
+"""Fills the database with a seeded, realistic history to benchmark against.
+
+Sessions are weekly on SESSION_START_WEEKDAY. Each member has their own attendance rate and library of games,
+and each session's members play a few games from their libraries in overlapping intervals through the evening.
+Writes to CONNECTION_STRING, which can be SQLite or a local Postgres, replacing whatever is there.
+
+    CONNECTION_STRING=sqlite:///bench.db python -m benchmarks.generate --size medium --seed 0
+"""
+import os
+import time
+import argparse
+import datetime
+import dataclasses
+import tempfile
+
+os.environ.setdefault("CONNECTION_STRING", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+import numpy as np
+import sqlalchemy
+import constants
+import data
+from data import DataBaseSession
+from model import Base, Member, Session, Game, SessionMember, SessionGame, MemberGame
+
+@dataclasses.dataclass(frozen=True)
+class Size:
+    years: int
+    members: int
+    games: int
+
+SIZES = {
+    "small" : Size(years=1, members=20, games=15),
+    "medium" : Size(years=5, members=150, games=100),
+    "large" : Size(years=10, members=400, games=300),
+}
+
+LIBRARY_SIZE = 12 # games owned by a typical member
+GAMES_PER_MEMBER = 3 # games a typical member plays in a session
+
+def get_session_dates(years: int, until: datetime.date) -> list[datetime.date]:
+    last = until - datetime.timedelta(days=(until.weekday() - constants.SESSION_START_WEEKDAY) % 7)
+    return [last - datetime.timedelta(weeks=week) for week in reversed(range(52 * years))]
+
+def get_evening(rng: np.random.Generator, count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Gets random (start, end) minute offsets from the session start, inside the session window."""
+    starts = rng.integers(0, 180, count)
+    ends = starts + rng.integers(30, 360, count)
+    return starts, np.minimum(ends, 11 * 60)
+
+def generate(size: Size, seed: int = 0, until: datetime.date = datetime.date(2025, 10, 24)) -> dict[str, int]:
+    """Replaces the contents of the database with a generated history, returning the number of rows in each table."""
+    rng = np.random.default_rng(seed)
+    Base.metadata.drop_all(data.get_engine())
+    Base.metadata.create_all(data.get_engine())
+
+    dates = get_session_dates(size.years, until)
+    rates = rng.beta(2, 3, size.members) # most members turn up less than half the time, a few almost always
+    popularity = rng.zipf(1.5, size.games).astype(float) # a handful of games are played far more than the rest
+    libraries = [rng.choice(size.games, min(size.games, rng.poisson(LIBRARY_SIZE) + 1), replace=False, p=popularity / popularity.sum()) for _ in range(size.members)]
+
+    members = [{"id" : id + 1, "guild_id" : constants.DISCORD_GUILD_ID, "discord_name" : f"discord-{id}", "name" : f"member-{id}", "in_rotation" : True, "is_admin" : id == 0} for id in range(size.members)]
+    games = [{"id" : id + 1, "guild_id" : constants.DISCORD_GUILD_ID, "name" : f"game-{id}"} for id in range(size.games)]
+    member_games = [{"member_id" : member + 1, "game_id" : int(game) + 1} for member, library in enumerate(libraries) for game in library]
+    sessions, session_members, session_games = [], [], []
+
+    for session_id, date in enumerate(dates, start=1):
+        session_start = datetime.datetime.combine(date, datetime.time(constants.SESSION_START_TIME))
+        attendees = np.nonzero(rng.random(size.members) < rates)[0]
+        sessions.append({"id" : session_id, "guild_id" : constants.DISCORD_GUILD_ID, "date" : date, "games_master_id" : int(rng.choice(attendees)) + 1 if len(attendees) > 0 else None})
+
+        starts, ends = get_evening(rng, len(attendees))
+        played = {}
+        for member, start, end in zip(attendees.tolist(), starts.tolist(), ends.tolist()):
+            session_members.append({"member_id" : member + 1, "session_id" : session_id, "start" : session_start + datetime.timedelta(minutes=start), "end" : session_start + datetime.timedelta(minutes=end)})
+            library = libraries[member]
+            for game in rng.choice(library, min(len(library), rng.poisson(GAMES_PER_MEMBER)), replace=False).tolist():
+                # a game's interval spans everyone who played it, so intervals overlap across members and games
+                game_start, game_end = played.get(game, (start, end))
+                played[game] = (min(game_start, start), max(game_end, end))
+        for game, (start, end) in played.items():
+            session_games.append({"game_id" : game + 1, "session_id" : session_id, "start" : session_start + datetime.timedelta(minutes=start), "end" : session_start + datetime.timedelta(minutes=end)})
+
+    with data.get_engine().begin() as connection:
+        for entity, rows in [(Member, members), (Game, games), (Session, sessions), (MemberGame, member_games), (SessionMember, session_members), (SessionGame, session_games)]:
+            if len(rows) > 0: connection.execute(sqlalchemy.insert(entity), rows)
+        if connection.dialect.name == "postgresql":
+            # rows were inserted with explicit ids, so move the sequences past them
+            for entity in (Member, Game, Session):
+                connection.execute(sqlalchemy.text(f"SELECT setval(pg_get_serial_sequence('{entity.__tablename__}', 'id'), (SELECT MAX(id) FROM {entity.__tablename__}))"))
+
+    with DataBaseSession() as db:
+        db.rebuild_stats()
+
+    return {
+        "sessions" : len(sessions),
+        "members" : len(members),
+        "games" : len(games),
+        "member_games" : len(member_games),
+        "session_members" : len(session_members),
+        "session_games" : len(session_games),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fills CONNECTION_STRING with a generated history.")
+    parser.add_argument("--size", choices=SIZES.keys(), default="medium")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(SIZES[arguments.size], arguments.seed)
+    print(f"Generated {arguments.size} history in {time.perf_counter() - start:.1f}s: " + ", ".join(f"{count} {table}" for table, count in counts.items()))
+
+if __name__ == "__main__":
+    main()
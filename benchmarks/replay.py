@@ -0,0 +1,179 @@
+"""Replays a trace of gateway events through the bot's handlers against a local database, without connecting to Discord.
+
+Reports the events per second the handlers absorb, their latency, the statements and transactions the writer
+issues for them, and how long compacting the resulting activity log takes. Traces are JSON lines, one event per line, either recorded or synthesised here:
+
+    {"time": "2025-10-24T19:00:00", "kind": "voice", "member": "discord-3", "before": null, "after": "General"}
+    {"time": "2025-10-24T19:05:00", "kind": "presence", "member": "discord-3", "before": [], "after": [["playing", "game-7"]]}
+
+    python -m benchmarks.replay --events 20000 --members 50
+    python -m benchmarks.replay --trace friday.jsonl
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import tempfile
+import dataclasses
+from typing import Iterable, Optional
+
+os.environ.setdefault("CONNECTION_STRING", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'replay.db')}")
+os.environ.setdefault("METRICS_PORT", "0")
+
+import numpy as np
+import discord
+import sqlalchemy
+import constants
+import data
+import bot
+from model import Base, Member
+
+@dataclasses.dataclass(frozen=True)
+class FakeGuild:
+    id: int
+
+@dataclasses.dataclass(frozen=True)
+class FakeMember:
+    """Stands in for discord.Member, with only the attributes the handlers read. Every member is in DISCORD_GUILD_ID."""
+    name: str
+    activities: tuple[discord.Activity, ...] = ()
+    guild: FakeGuild = FakeGuild(constants.DISCORD_GUILD_ID)
+
+@dataclasses.dataclass(frozen=True)
+class FakeVoiceState:
+    """Stands in for discord.VoiceState, with only the attributes the handlers read."""
+    channel: Optional[str] = None
+
+@dataclasses.dataclass(frozen=True)
+class Event:
+    time: datetime.datetime
+    kind: str
+    member: str
+    before: object
+    after: object
+
+    def to_json(self) -> str:
+        return json.dumps({"time" : self.time.isoformat(), "kind" : self.kind, "member" : self.member, "before" : self.before, "after" : self.after})
+
+    @classmethod
+    def from_json(cls, line: str) -> "Event":
+        event = json.loads(line)
+        before, after = event["before"], event["after"]
+        if event["kind"] == "presence": before, after = [tuple(activity) for activity in before], [tuple(activity) for activity in after]
+        return cls(datetime.datetime.fromisoformat(event["time"]), event["kind"], event["member"], before, after)
+
+def get_member(name: str, activities: Iterable[tuple[str, str]]) -> FakeMember:
+    return FakeMember(name, tuple(discord.Activity(type=getattr(discord.ActivityType, type), name=activity_name) for type, activity_name in activities))
+
+def load_trace(path: str) -> list[Event]:
+    with open(path) as file:
+        return [Event.from_json(line) for line in file if line.strip()]
+
+def save_trace(path: str, events: Iterable[Event]) -> None:
+    with open(path, "w") as file:
+        for event in events: file.write(event.to_json() + "\n")
+
+def synthesise_trace(number_of_events: int, members: list[str], strangers: list[str], games: list[str], date: datetime.date, seed: int = 0) -> list[Event]:
+    """Generates a Friday evening of guild chatter: members joining, leaving and switching games, among
+    music, custom statuses and strangers that the bot should drop."""
+    rng = random.Random(seed)
+    start = datetime.datetime.combine(date, datetime.time(constants.SESSION_START_TIME))
+    step = datetime.timedelta(hours=6) / number_of_events
+    in_voice = {name: False for name in members}
+    playing = {name: [] for name in members + strangers}
+    events = []
+    for i in range(number_of_events):
+        current_datetime = start + step * i
+        name = rng.choice(members if rng.random() < 0.5 else strangers)
+        if name in in_voice and rng.random() < 0.2:
+            before, after = ("General", None) if in_voice[name] else (None, "General")
+            in_voice[name] = not in_voice[name]
+            events.append(Event(current_datetime, "voice", name, before, after))
+            continue
+
+        before = playing[name]
+        roll = rng.random()
+        if roll < 0.4: after = [("listening", "Spotify")]
+        elif roll < 0.5: after = [("custom", "brb")]
+        elif roll < 0.8: after = [("playing", rng.choice(games))]
+        else: after = []
+        playing[name] = after
+        events.append(Event(current_datetime, "presence", name, before, after))
+    return events
+
+def seed_database(members: list[str]) -> None:
+    Base.metadata.drop_all(data.get_engine())
+    Base.metadata.create_all(data.get_engine())
+    with data.get_engine().begin() as connection:
+        connection.execute(sqlalchemy.insert(Member), [{"guild_id" : constants.DISCORD_GUILD_ID, "discord_name" : name, "name" : name, "in_rotation" : True, "is_admin" : False} for name in members])
+
+async def replay(events: list[Event], compact: bool = True) -> tuple[np.ndarray, float]:
+    """Feeds the events to the handlers as fast as they are absorbed, returning each one's latency and the total time
+    including the final flush. If compact is set the log is then compacted, untimed, so the session tables can be checked."""
+    await bot.directory.load()
+    bot.writer.start()
+    latencies = np.zeros(len(events))
+    start = time.perf_counter()
+    for i, event in enumerate(events):
+        event_start = time.perf_counter()
+        if event.kind == "voice":
+            member = FakeMember(event.member)
+            await bot.handle_voice_state_update(member, FakeVoiceState(event.before), FakeVoiceState(event.after), event.time)
+        else:
+            await bot.handle_presence_update(get_member(event.member, event.before), get_member(event.member, event.after), event.time)
+        latencies[i] = time.perf_counter() - event_start
+        # let the writer run, as it would between gateway events
+        await asyncio.sleep(0)
+    await bot.writer.stop()
+    elapsed = time.perf_counter() - start
+    if compact: await bot.compactor.compact()
+    return latencies, elapsed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replays gateway events through the bot's handlers.")
+    parser.add_argument("--trace", help="JSON lines trace to replay, synthesised if not given")
+    parser.add_argument("--save", help="write the replayed trace to this path")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--strangers", type=int, default=500)
+    parser.add_argument("--games", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    if arguments.trace is not None:
+        events = load_trace(arguments.trace)
+        # a trace does not record who is a member, so treat everyone who joins voice as one
+        members = sorted({event.member for event in events if event.kind == "voice"})
+    else:
+        members = [f"discord-{i}" for i in range(arguments.members)]
+        strangers = [f"stranger-{i}" for i in range(arguments.strangers)]
+        games = [f"game-{i}" for i in range(arguments.games)]
+        events = synthesise_trace(arguments.events, members, strangers, games, datetime.date(2025, 10, 24), arguments.seed)
+    if arguments.save is not None: save_trace(arguments.save, events)
+    seed_database(members)
+
+    statements = {"INSERT" : 0, "UPDATE" : 0, "SELECT" : 0}
+    transactions = []
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(" ", 1)[0].upper()
+        if verb in statements: statements[verb] += 1
+    def on_commit(conn):
+        transactions.append(conn)
+    sqlalchemy.event.listen(data.get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+    sqlalchemy.event.listen(data.get_async_engine().sync_engine, "commit", on_commit)
+
+    latencies, elapsed = asyncio.run(replay(events, compact=False))
+    print(f"{len(events)} events in {elapsed:.2f}s ({len(events) / elapsed:,.0f} events/s)")
+    print(f"  handler latency: p50 {np.percentile(latencies, 50) * 1e6:.0f}us, p99 {np.percentile(latencies, 99) * 1e6:.0f}us, max {latencies.max() * 1e3:.2f}ms")
+    print(f"  writes: {statements['INSERT']} inserts, {statements['UPDATE']} updates, {statements['SELECT']} selects in {len(transactions)} transactions")
+    print(f"  {bot.event_filter.summary()}")
+
+    start = time.perf_counter()
+    sessions = asyncio.run(bot.compactor.compact())
+    print(f"  compacted into {sessions} sessions in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
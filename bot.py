@@ -1,38 +1,59 @@
-import os
+import signal
+import asyncio
 import datetime
 import discord
-from data import DataBaseSession
-import utils
+from data import AsyncDataBaseSession
+from writer import EventWriter
+from compaction import Compactor
+from sampler import Sampler
+from directory import MemberDirectory
+from event_filter import EventFilter
+from session_calendar import calendar
+import metrics
+import profiling
 import constants
 import functools
-from model import Member, Session
-from typing import Optional, Union
+from typing import Optional
 
 from rich import print, traceback
 traceback.install()
 
 intents = discord.Intents.default()
-intents.message_content = True
+intents.messages = False # slash commands arrive as interactions, so skip every guild message and typing event
+intents.typing = False
 intents.presences = True
 intents.members = True
-client = discord.Client(intents=intents)
+# shards split the guilds' gateway traffic between them, and SHARD_IDS splits the shards between processes
+client = discord.AutoShardedClient(intents=intents, shard_count=constants.SHARD_COUNT, shard_ids=constants.SHARD_IDS)
 tree = discord.app_commands.CommandTree(client)
 
+# every discord REST call goes through http.request, so time it as the discord phase of any running profile
+_request = client.http.request
+async def timed_request(*args, **kwargs):
+    with profiling.phase("discord"):
+        return await _request(*args, **kwargs)
+client.http.request = timed_request
+
 channel = client.get_channel(123456789)
 
-GUILD = discord.Object(id=constants.DISCORD_GUILD_ID)
+GUILDS = [discord.Object(id=guild_id) for guild_id in constants.DISCORD_GUILD_IDS]
+
+writer = EventWriter(constants.WRITE_BATCH_SIZE, constants.WRITE_FLUSH_INTERVAL)
+compactor = Compactor(constants.COMPACTION_INTERVAL)
+directory = MemberDirectory(constants.MEMBER_DIRECTORY_TTL, constants.DISCORD_GUILD_IDS or None)
+event_filter = EventFilter(directory)
 
 class AuthorisationError(Exception):
-    def __init__(self, message, errors):            
+    def __init__(self, message, errors=None):            
         super().__init__(message)
+        self.message = message
         self.errors = errors
 
-def enforce_admin(discord_name: str) -> None:
-    """Throws an authorisation error is the user is not an admin"""
-    with DataBaseSession() as db:
-        member = db.get_member_by_discord_name(discord_name)
-        if member is None: raise AuthorisationError(f"I can't do that if I don't know who you are ol' chap.")
-        if not member.is_admin: raise AuthorisationError(f"Naughty naughty, that command's not for you now is it...")                 
+def enforce_admin(guild_id: int, discord_name: str) -> None:
+    """Throws an authorisation error is the user is not an admin of the guild"""
+    member = directory.get(guild_id, discord_name)
+    if member is None: raise AuthorisationError(f"I can't do that if I don't know who you are ol' chap.")
+    if not member.is_admin: raise AuthorisationError(f"Naughty naughty, that command's not for you now is it...")                 
 
 def authorise():
     def wrapper(func):
@@ -41,49 +62,74 @@ def authorise():
             if len(args) < 1: raise Exception("Not enough arguments provided to function, cannot authorise.")
             if not isinstance(args[0], discord.Interaction): raise Exception("Interaction not provided, cannot authorise.")
             interaction = args[0]
-            try:
-                enforce_admin(interaction.user.name)        
-                return await func(*args)
-            except AuthorisationError as e:
-                await interaction.response.send_message(e.message)
+            with metrics.statement_scope() as scope, profiling.sample(f"command {func.__name__}", constants.PROFILE_EVENT_RATE, scope):
+                try:
+                    enforce_admin(interaction.guild_id, interaction.user.name)        
+                    return await func(*args, **kwargs)
+                except AuthorisationError as e:
+                    await interaction.response.send_message(e.message)
         return wrapped
     return wrapper
 
-async def get_guild_name() -> Optional[str]:
-    guild = await get_guild()
+async def get_guild_name(guild_id: int) -> Optional[str]:
+    guild = await get_guild(guild_id)
     if guild is None: return None
     return guild.name
 
-async def get_guild() -> Optional[discord.Guild]:
-    guild = client.get_guild(constants.DISCORD_GUILD_ID)
+async def get_guild(guild_id: int) -> Optional[discord.Guild]:
+    guild = client.get_guild(guild_id)
     if guild is not None: return guild
-    return await client.fetch_guild(constants.DISCORD_GUILD_ID)
+    return await client.fetch_guild(guild_id)
+
+def get_recorded_guilds() -> list[discord.Guild]:
+    """Gets the guilds on this process's shards that the bot records, every guild it is in if none are configured."""
+    return [guild for guild in client.guilds if not constants.DISCORD_GUILD_IDS or guild.id in constants.DISCORD_GUILD_IDS]
+
+# in sampling mode voice and presence updates are ignored, and the guilds are snapshot on a fixed interval instead
+sampler = Sampler(directory, get_recorded_guilds, constants.SAMPLE_INTERVAL) if constants.TRACKING_MODE == "sampling" else None
 
 # --- Commands ---
 
-@tree.command(name='adi-stats', description='Get the stats of a member', guild=GUILD)
+@tree.command(name='adi-stats', description='Get the stats of a member', guilds=GUILDS)
 @authorise()
-async def get_stats(discord_member: discord.Member):
-    with DataBaseSession() as db:
-        member = db.get_member_by_discord_name(member.name)
-
-@tree.command(name='adi-add-member', description='Adds a member', guild=GUILD)
+async def get_stats(interaction: discord.Interaction, user: discord.Member):
+    member = directory.get(interaction.guild_id, user.name)
+    if member is None:
+        await interaction.response.send_message(f"{user.name} isn't a member.")
+        return
+
+    async with AsyncDataBaseSession(guild_id=interaction.guild_id) as db:
+        stats = await db.get_member_stats(member.id)
+        number_of_sessions = await db.get_number_of_sessions()
+
+    proportion = stats.sessions_attended / number_of_sessions if number_of_sessions > 0 else 0
+    await interaction.response.send_message(
+        f"{user.name} has attended {stats.sessions_attended} of {number_of_sessions} sessions ({proportion:.0%}), "
+        f"played {stats.games_played} games and been games master {stats.games_mastered} times.")
+
+@tree.command(name='adi-add-member', description='Adds a member', guilds=GUILDS)
 @authorise()
 async def add_member(interaction: discord.Interaction, user: discord.Member, name: str):
-    with DataBaseSession() as db:
-        guild_name = await get_guild_name()
+    async with AsyncDataBaseSession(guild_id=interaction.guild_id) as db:
+        guild_name = await get_guild_name(interaction.guild_id)
         discord_name = user.name
-        db.add_member(name, discord_name)
+        member = await db.add_member(name, discord_name)
+        directory.add(member)
         await interaction.response.send_message(f"Added {discord_name} [{name}] to {guild_name}")
 
+@tree.command(name='adi-remove-member', description='Removes a member', guilds=GUILDS)
 @authorise()
-@tree.command(name='adi-remove-member', description='Removes a member', guild=GUILD)
-async def add_member(interaction: discord.Interaction, user: discord.Member, name: str):
-    with DataBaseSession() as db:
-        guild_name = await get_guild_name()
-        discord_name = user.name
-        db.add_member(name, discord_name)
-        await interaction.response.send_message(f"Removed {discord_name} [{name}] from {guild_name}")
+async def remove_member(interaction: discord.Interaction, user: discord.Member):
+    member = directory.get(interaction.guild_id, user.name)
+    if member is None:
+        await interaction.response.send_message(f"{user.name} isn't a member.")
+        return
+
+    async with AsyncDataBaseSession(guild_id=interaction.guild_id) as db:
+        guild_name = await get_guild_name(interaction.guild_id)
+        await db.remove_member_by_id(member.id)
+        directory.remove(interaction.guild_id, user.name)
+        await interaction.response.send_message(f"Removed {user.name} from {guild_name}")
 
 # --- Event Handlers ---
 
@@ -91,98 +137,83 @@ async def add_member(interaction: discord.Interaction, user: discord.Member, nam
 async def on_ready():
     print(f'Logged on as {client.user}!')
 
-    with DataBaseSession() as db:
-        member = db.get_member_by_discord_name(constants.ADMIN_DISCORD_NAME)
-        if member is None: db.add_member(constants.ADMIN_NAME, constants.ADMIN_DISCORD_NAME, is_admin=True)
+    guilds = get_recorded_guilds()
+    for guild in guilds:
+        async with AsyncDataBaseSession(guild_id=guild.id) as db:
+            member = await db.get_member_by_discord_name(constants.ADMIN_DISCORD_NAME)
+            if member is None: await db.add_member(constants.ADMIN_NAME, constants.ADMIN_DISCORD_NAME, is_admin=True)
 
-    synced = await tree.sync(guild=GUILD)
-    if len(synced) == 0: raise Exception("Unable to synchronise slash commands.")
+    await directory.load()
+    directory.start()
+    if sampler is not None: sampler.start()
 
-@client.event
-async def on_message(message):
-    print(f'Message from {message.author}: {message.content}')
+    # commands are registered per guild, or globally once if no guilds are configured
+    for guild in guilds if GUILDS else [None]:
+        synced = await tree.sync(guild=guild)
+        if len(synced) == 0: raise Exception(f"Unable to synchronise slash commands{'' if guild is None else f' for {guild.name}'}.")
 
 @client.event
 async def on_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
-    if before.channel is None and after.channel is not None:
-        print(f"{member.name} joined the '{after.channel.name}' channel!")
-        await on_user_joins_channel(member)
-    elif before.channel is not None and after.channel is None:
-        print(f"This prick ({member.name}) left the '{before.channel.name}' channel.")
-        await on_user_leaves_channel(member)
+    if sampler is not None: return
+    await handle_voice_state_update(member, before, after, calendar.now())
 
 @client.event
 async def on_presence_update(before: discord.Member, after: discord.Member):
-    if before.activity is None and after.activity is not None:
-        await on_user_starts_activity(after, after.activity)
-    elif after.activity is None and before.activity is not None:
-        await on_user_stops_activity(after, before.activity)
+    if sampler is not None: return
+    await handle_presence_update(before, after, calendar.now())
+
+# handlers take the event time so benchmarks.replay can drive them with recorded events
+async def handle_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState, current_datetime: datetime.datetime) -> None:
+    with metrics.track_event("voice") as scope, profiling.sample("voice", constants.PROFILE_EVENT_RATE, scope):
+        change = event_filter.voice(member, before, after, current_datetime)
+        if change is None: return
+
+        if change.joined: await on_user_joins_channel(change.guild_id, change.member_id, current_datetime)
+        else: await on_user_leaves_channel(change.guild_id, change.member_id, current_datetime)
+
+async def handle_presence_update(before: discord.Member, after: discord.Member, current_datetime: datetime.datetime) -> None:
+    with metrics.track_event("presence") as scope, profiling.sample("presence", constants.PROFILE_EVENT_RATE, scope):
+        change = event_filter.presence(before, after, current_datetime)
+        if change is None: return
+
+        if change.stopped is not None: await on_user_stops_activity(change.guild_id, change.member_id, change.stopped, current_datetime)
+        if change.started is not None: await on_user_starts_activity(change.guild_id, change.member_id, change.started, current_datetime)
 
 # -- Logic
 
-async def on_user_joins_channel(discord_member: discord.Member) -> None:
-    with DataBaseSession() as db:
-        current_datetime = datetime.datetime.today()
-        if not utils.is_valid_session_from_datetime(current_datetime): return False
-
-        member = db.get_member_by_discord_name(discord_member.name)
-        if member is None: return
-
-        session = db.get_or_create_session(current_datetime.date())
-        db.add_or_update_session_member(session.id, member.id, start=current_datetime)
-
-async def on_user_leaves_channel(discord_member: Member) -> None:
-    with DataBaseSession() as db:
-        current_datetime = datetime.datetime.today()
-        if not utils.is_valid_session_from_datetime(current_datetime): return False
-
-        member = db.get_member_by_discord_name(discord_member.name)
-        if member is None: return
-
-        session = db.get_or_create_session(current_datetime.date())
-        db.add_or_update_session_member(session.id, member.id, end=current_datetime)
-
-async def on_user_starts_activity(discord_member: discord.Member, activity: discord.Activity):
-    with DataBaseSession() as db:
-        print(activity.type)
-        print(type(activity.type))
-        if not activity.type == discord.ActivityType.playing:
-            print(f"FFS you can't play that! ({activity.name})")
-            return 
-        # print(type(discord_game))
-        # if not isinstance(discord_game, discord.Game): return
-
-        current_datetime = datetime.datetime.today()
-        if not utils.is_valid_session_from_datetime(current_datetime): return
-
-        member = db.get_member_by_discord_name(discord_member.name)
-        if member is None: return
-
-        session = db.get_or_create_session(current_datetime.date())
-        game = db.get_or_create_game(activity.name)
-        db.get_or_add_member_game(member.id, game.id)
-        db.add_or_update_session_member(session.id, member.id, start=current_datetime)
-        db.add_or_update_session_game(session.id, game.id, current_datetime)
-
-async def on_user_stops_activity(discord_member: discord.Member, activity: discord.Activity):
-    with DataBaseSession() as db:
-        if not activity.playing:
-            print(f"FFS you can't play that! ({activity.name})")
-            return 
-        # if not isinstance(discord_game, discord.Game): 
-        #     print(f"[{discord_game.name}] is not a game.")
-        #     return
-
-        current_datetime = datetime.datetime.today()
-        if not utils.is_valid_session_from_datetime(current_datetime): return
-
-        member = db.get_member_by_discord_name(discord_member.name)
-        if member is None: return
-
-        session = db.get_or_create_session(current_datetime.date())
-        game = db.get_or_create_game(activity.name)
-        db.get_or_add_member_game(member.id, game.id)
-        db.add_or_update_session_member(session.id, member.id, start=current_datetime)
-        db.add_or_update_session_game(session.id, game.id, start=current_datetime)
-    
-client.run(constants.DISCORD_TOKEN)
\ No newline at end of file
+async def on_user_joins_channel(guild_id: int, member_id: int, current_datetime: datetime.datetime) -> None:
+    writer.add_event(guild_id, member_id, "join", calendar.get_session_date(current_datetime), current_datetime)
+
+async def on_user_leaves_channel(guild_id: int, member_id: int, current_datetime: datetime.datetime) -> None:
+    writer.add_event(guild_id, member_id, "leave", calendar.get_session_date(current_datetime), current_datetime)
+
+async def on_user_starts_activity(guild_id: int, member_id: int, game_name: str, current_datetime: datetime.datetime) -> None:
+    writer.add_event(guild_id, member_id, "start", calendar.get_session_date(current_datetime), current_datetime, game_name)
+
+async def on_user_stops_activity(guild_id: int, member_id: int, game_name: str, current_datetime: datetime.datetime) -> None:
+    writer.add_event(guild_id, member_id, "stop", calendar.get_session_date(current_datetime), current_datetime, game_name)
+
+async def report_stats() -> None:
+    while True:
+        await asyncio.sleep(constants.STATS_REPORT_INTERVAL)
+        print(event_filter.summary())
+
+async def main():
+    discord.utils.setup_logging()
+    if constants.METRICS_PORT: metrics.serve(constants.METRICS_PORT)
+    async with client:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(client.close()))
+        writer.start()
+        compactor.start()
+        reporter = asyncio.create_task(report_stats())
+        try:
+            await client.start(constants.DISCORD_TOKEN)
+        finally:
+            reporter.cancel()
+            if sampler is not None: await sampler.stop()
+            await directory.stop()
+            await writer.stop()
+            await compactor.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+import hashlib
+import datetime
+import collections
+import dataclasses
+from typing import Optional
+
+@dataclasses.dataclass(frozen=True)
+class CachedResponse:
+    etag: str
+    last_modified: Optional[datetime.datetime]
+    body: bytes
+    headers: dict[str, str] = dataclasses.field(default_factory=dict)
+
+def get_etag(key: str, versions: dict[str, tuple[int, datetime.datetime]]) -> str:
+    """Gets a weak ETag for a response, which only changes when one of the tables it was built from is written to."""
+    state = key + "|" + ",".join(f"{name}:{versions[name][0]}" for name in sorted(versions))
+    return f'W/"{hashlib.blake2b(state.encode(), digest_size=12).hexdigest()}"'
+
+def get_last_modified(versions: dict[str, tuple[int, datetime.datetime]]) -> Optional[datetime.datetime]:
+    if len(versions) == 0: return None
+    return max(modified for _, modified in versions.values()).replace(tzinfo=datetime.timezone.utc, microsecond=0)
+
+class ResponseCache:
+    """Size-bounded LRU of serialised responses, keyed by route and parameters.
+
+    Each entry remembers the ETag it was built under. As the ETag is derived from the data versions of the
+    tables behind the route, an entry is only served while none of those tables have been written to."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: collections.OrderedDict[str, CachedResponse] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, etag: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.etag != etag:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: CachedResponse) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -0,0 +1,54 @@
+from typing import Optional
+from data import DataBaseSession
+import utils
+
+class GameCatalog:
+    """In-memory map of (guild id, normalized name) to game id, covering every game's name and alias, so the game
+    names in presence events are resolved without a query.
+
+    A guild's games are loaded the first time one of its names is resolved. Names the catalog doesn't know are
+    looked up, or the game created, in the database and remembered from then on. refresh forgets everything once
+    games or aliases have been written, e.g. merged by `manage.py merge-games` in another process."""
+
+    TABLES = ("games", "game_aliases")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._ids: dict[tuple[int, str], int] = {}
+        self._loaded: set[int] = set()
+        self._versions = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def refresh(self, db: DataBaseSession) -> None:
+        """Forgets every entry if the data versions of games or aliases changed since the last refresh."""
+        versions = db.get_data_versions(self.TABLES)
+        if versions == self._versions: return
+        self._ids.clear()
+        self._loaded.clear()
+        self._versions = versions
+
+    def load(self, db: DataBaseSession) -> None:
+        """Replaces the entries of the db's guild with its games and aliases currently in the database."""
+        self._ids = {key: id for key, id in self._ids.items() if key[0] != db.guild_id}
+        self._ids.update({(db.guild_id, normalized_name): id for normalized_name, id in db.get_game_names()})
+        self._loaded.add(db.guild_id)
+
+    def get(self, guild_id: int, name: str) -> Optional[int]:
+        """Gets the id of the game a name refers to, or None if the catalog doesn't know it."""
+        return self._ids.get((guild_id, utils.normalize_game_name(name)))
+
+    def get_or_create(self, db: DataBaseSession, name: str) -> int:
+        """Gets the id of the game a name refers to in the db's guild, creating the game if there is none."""
+        if db.guild_id not in self._loaded: self.load(db)
+        key = (db.guild_id, utils.normalize_game_name(name))
+        id = self._ids.get(key)
+        if id is not None:
+            self.hits += 1
+            return id
+
+        self.misses += 1
+        id = self._ids[key] = db.get_or_create_game(name).id
+        return id
@@ -0,0 +1,153 @@
+"""Compacts the append-only activity_events log into session_members and session_games.
+
+The bot only appends events, so its write path is a single INSERT per flush, which also marks the sessions the
+events belong to in pending_sessions. Compaction rebuilds the interval rows of every pending session from all of
+that session's events, so it can be rerun at any time, and `python manage.py rebuild-sessions` recomputes every
+session in the log.
+
+Pending sessions rather than an event id watermark are what make it safe for every bot process to compact: ids
+are allocated before they commit, so an event can commit after a higher id has been compacted, but it can't
+commit without marking its session. A session is only cleared if it wasn't marked again while being compacted,
+so concurrent compactions at worst rebuild a session twice.
+"""
+import asyncio
+import datetime
+import dataclasses
+from typing import Callable, Hashable, Iterable, Optional
+from data import DataBaseSession, AsyncDataBaseSession
+from catalog import GameCatalog
+from model import ActivityEvent
+
+from rich import print
+
+@dataclasses.dataclass
+class Presence:
+    """The span of a member or game's events in a session, and the intervals they were actually active for."""
+    start: datetime.datetime
+    end: datetime.datetime
+    intervals: list[tuple[datetime.datetime, datetime.datetime]] = dataclasses.field(default_factory=list)
+
+    def add(self, start: datetime.datetime, end: datetime.datetime) -> None:
+        self.intervals.append((start, end))
+        if end > self.end: self.end = end
+
+    def get_duration(self) -> datetime.timedelta:
+        """Gets the length of the union of the intervals, so overlapping intervals are only counted once."""
+        total = datetime.timedelta()
+        current_start = current_end = None
+        for start, end in sorted(self.intervals):
+            if current_end is None or start > current_end:
+                if current_end is not None: total += current_end - current_start
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        if current_end is not None: total += current_end - current_start
+        return total
+
+def get_presences(events: Iterable[ActivityEvent], get_game: Callable[[str], Hashable] = lambda name: name) -> tuple[dict[int, Presence], dict[Hashable, Presence]]:
+    """Replays a session's events, in order, into the presence of each member and each game, with games keyed by
+    get_game(game_name) so that names of the same game are merged.
+
+    A member is present while they are in voice or playing a game. Intervals still open at the end, e.g. because
+    the session is still going or a leave was missed, are closed at the session's last event."""
+    members: dict[int, Presence] = {}
+    games: dict[Hashable, Presence] = {}
+    in_voice: dict[int, datetime.datetime] = {}
+    playing: dict[tuple[int, Hashable], datetime.datetime] = {}
+
+    def close_game(member_id: int, game: Hashable, end: datetime.datetime) -> None:
+        start = playing.pop((member_id, game))
+        members[member_id].add(start, end)
+        games[game].add(start, end)
+
+    last = None
+    for event in events:
+        last = event.timestamp
+        member = members.setdefault(event.member_id, Presence(event.timestamp, event.timestamp))
+        if event.timestamp > member.end: member.end = event.timestamp
+
+        if event.kind == "join":
+            in_voice.setdefault(event.member_id, event.timestamp)
+        elif event.kind == "leave":
+            if event.member_id in in_voice: member.add(in_voice.pop(event.member_id), event.timestamp)
+        elif event.kind == "start":
+            game = get_game(event.game_name)
+            games.setdefault(game, Presence(event.timestamp, event.timestamp))
+            playing.setdefault((event.member_id, game), event.timestamp)
+        elif event.kind == "stop":
+            game = get_game(event.game_name)
+            if (event.member_id, game) in playing: close_game(event.member_id, game, event.timestamp)
+
+    for member_id, start in in_voice.items(): members[member_id].add(start, last)
+    for member_id, game in list(playing): close_game(member_id, game, last)
+    return members, games
+
+def compact_session(db: DataBaseSession, session_date: datetime.date, catalog: GameCatalog) -> None:
+    """Rebuilds a session of the db's guild from its events, resolving game names through the catalog."""
+    events = db.get_activity_events(session_date)
+    members, games = get_presences(events, lambda name: catalog.get_or_create(db, name))
+    session = db.get_or_create_session(session_date)
+    db.delete_session_timeline(session.id)
+    for member_id, presence in members.items():
+        db.set_session_member_interval(session.id, member_id, presence.start, presence.end, presence.get_duration().total_seconds())
+
+    for game_id, presence in games.items():
+        db.set_session_game_interval(session.id, game_id, presence.start, presence.end, presence.get_duration().total_seconds())
+
+    for member_id, game_id in {(event.member_id, catalog.get_or_create(db, event.game_name)) for event in events if event.kind == "start"}:
+        db.get_or_add_member_game(member_id, game_id)
+
+def compact(db: DataBaseSession, rebuild: bool = False, catalog: Optional[GameCatalog] = None) -> int:
+    """Rebuilds the pending sessions, or every session if rebuild is set, in every guild. Returns the number of
+    sessions rebuilt."""
+    if catalog is None: catalog = GameCatalog()
+    catalog.refresh(db)
+    pending = db.get_pending_sessions()
+    session_dates = db.get_activity_event_dates() if rebuild else [(guild_id, session_date) for guild_id, session_date, _ in pending]
+    for guild_id, session_date in session_dates: compact_session(db.for_guild(guild_id), session_date, catalog)
+    for guild_id, session_date, version in pending: db.clear_pending_session(guild_id, session_date, version)
+    return len(session_dates)
+
+class Compactor:
+    """Compacts the activity log every interval seconds in the background, in one transaction per run.
+    Game names are resolved through a catalog kept for the life of the process, refreshed at the start of each run
+    if games have been written since."""
+
+    def __init__(self, interval: float = 60.0):
+        self.interval = interval
+        self.catalog = GameCatalog()
+        self._task = None
+
+    def start(self) -> None:
+        """Starts compacting, must be called from within the running event loop."""
+        if self._task is None: self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the background task and compacts anything appended since its last run."""
+        if self._task is None: return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.compact()
+
+    async def compact(self, rebuild: bool = False) -> int:
+        async with AsyncDataBaseSession(autocommit=False) as db:
+            try:
+                sessions = await db.run_sync(lambda db: compact(db, rebuild, self.catalog))
+                await db.commit()
+            except Exception:
+                # games created in the rolled back transaction don't exist, so forget everything the catalog learnt
+                self.catalog = GameCatalog()
+                raise
+        return sessions
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.compact()
+            except Exception as e:
+                print(f"Failed to compact activity events: {e}")
@@ -0,0 +1,35 @@
+import os
+import pytest
+import datetime
+import tempfile
+
+# constants.py reads the environment at import time, so point it at a throwaway database first.
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "adibot.db")
+os.environ.setdefault("CONNECTION_STRING", f"sqlite:///{DATABASE_PATH}")
+
+@pytest.fixture
+def db():
+    import data
+    from model import Base
+    Base.metadata.drop_all(data.get_engine())
+    Base.metadata.create_all(data.get_engine())
+    with data.DataBaseSession() as db:
+        yield db
+
+SESSION_START = datetime.datetime(2025, 10, 24, 18) # a Friday, at the start of the default session window
+
+@pytest.fixture
+def session_date() -> datetime.date:
+    return SESSION_START.date()
+
+@pytest.fixture
+def at():
+    """Gets the time a number of minutes after SESSION_START."""
+    return lambda minutes: SESSION_START + datetime.timedelta(minutes=minutes)
+
+@pytest.fixture
+def event(at, session_date):
+    """Builds an activity_events row of session_date, a number of minutes after SESSION_START."""
+    def event(member_id: int, kind: str, minutes: int, game_name: str = None, guild_id: int = 0) -> dict:
+        return {"guild_id" : guild_id, "member_id" : member_id, "kind" : kind, "game_name" : game_name, "session_date" : session_date, "timestamp" : at(minutes)}
+    return event
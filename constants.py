@@ -4,10 +4,35 @@ SESSION_START_WEEKDAY = 4 # 0=Mon, 1=Tues ... 6=Sun
 SESSION_START_TIME = 18
 SESSION_END_WEEKDAY = 5 # 0=Mon, 1=Tues ... 6=Sun
 SESSION_END_TIME = 6
+SESSION_WINDOWS = os.environ.get("SESSION_WINDOWS") # e.g. "Fri 18:00-Sat 07:00,Tue 19:00-Tue 23:00", replaces the window above
+EXTRA_SESSIONS = os.environ.get("EXTRA_SESSIONS") # one-off sessions, e.g. "2025-12-27T18:00/2025-12-28T02:00"
+SESSION_TIMEZONE = os.environ.get("SESSION_TIMEZONE") # e.g. "Europe/London", defaults to the server's local time
 
 CONNECTION_STRING = os.environ.get("CONNECTION_STRING")
+SQL_ECHO = os.environ.get("SQL_ECHO", "").lower() in ("1", "true", "yes") # logs every SQL statement, for debugging only
+ASYNC_CONNECTION_STRING = os.environ.get("ASYNC_CONNECTION_STRING") # defaults to CONNECTION_STRING with its asyncio driver
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1)) # API worker processes, also read by uvicorn
+DATABASE_CONNECTIONS = int(os.environ["DATABASE_CONNECTIONS"]) if os.environ.get("DATABASE_CONNECTIONS") else None # connections a service may hold across all of its workers, sqlalchemy's pool defaults if unset
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", 100)) # pending rows before the bot flushes its writes
+WRITE_FLUSH_INTERVAL = float(os.environ.get("WRITE_FLUSH_INTERVAL", 5)) # seconds before the bot flushes its writes
+TRACKING_MODE = os.environ.get("TRACKING_MODE", "events") # "events" records every voice and presence update, "sampling" snapshots voice and activities every SAMPLE_INTERVAL
+SAMPLE_INTERVAL = float(os.environ.get("SAMPLE_INTERVAL", 60)) # seconds between snapshots in sampling mode
+COMPACTION_INTERVAL = float(os.environ.get("COMPACTION_INTERVAL", 60)) # seconds between the bot compacting its activity events into sessions
+MEMBER_DIRECTORY_TTL = float(os.environ.get("MEMBER_DIRECTORY_TTL", 3600)) # seconds between full reloads of the bot's member directory
+STATS_REPORT_INTERVAL = float(os.environ.get("STATS_REPORT_INTERVAL", 3600)) # seconds between the bot logging its event counters
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 1024)) # responses the API keeps in memory
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9100)) # port the bot serves its Prometheus metrics on, 0 to disable
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles") # directory cProfile profiles of requests and bot events are written to
+PROFILE_EVENT_RATE = float(os.environ.get("PROFILE_EVENT_RATE", 0)) # fraction of bot events to profile, e.g. 0.01
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 100)) # rows in a page of a list endpoint when no limit is given
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 1000)) # largest limit a list endpoint accepts
+HISTORY_LIMIT = int(os.environ.get("HISTORY_LIMIT", 50)) # sessions embedded in a member or game when no sessions_limit is given
+
 DISCORD_TOKEN = os.environ.get('DISCORD_TOKEN')
-DISCORD_GUILD_ID = os.environ.get('DISCORD_GUILD_ID')
+DISCORD_GUILD_ID = int(os.environ.get('DISCORD_GUILD_ID', 0)) # the guild the API serves when none is given, and that existing rows are migrated into
+DISCORD_GUILD_IDS = [int(id) for id in os.environ.get('DISCORD_GUILD_IDS', os.environ.get('DISCORD_GUILD_ID', '')).split(",") if id] # guilds the bot records, e.g. "123,456"
+SHARD_COUNT = int(os.environ['SHARD_COUNT']) if os.environ.get('SHARD_COUNT') else None # total gateway shards across every bot process, chosen by discord if unset
+SHARD_IDS = [int(id) for id in os.environ['SHARD_IDS'].split(",")] if os.environ.get('SHARD_IDS') else None # shards this process runs, e.g. "0,1", all of them if unset
 
 ADMIN_NAME = os.environ.get('ADMIN_NAME')
 ADMIN_DISCORD_NAME = os.environ.get('ADMIN_DISCORD_NAME')
@@ -0,0 +1,105 @@
+import heapq
+import datetime
+import collections
+import dataclasses
+from typing import Iterable, Optional
+from data import DataBaseSession
+
+Pair = tuple[int, int]
+
+def get_overlaps(intervals: Iterable[tuple[datetime.datetime, datetime.datetime, int]]) -> dict[Pair, datetime.timedelta]:
+    """Gets how long each pair of ids' (start, end, id) intervals overlap, summed over all their intervals.
+
+    Sweeps the intervals in start order, keeping the ones still open in a heap by end. Each interval is only
+    compared with those open when it starts, so the cost is O(n log n) plus one step per overlapping pair,
+    rather than comparing every pair of intervals."""
+    overlaps = collections.defaultdict(datetime.timedelta)
+    active: list[tuple[datetime.datetime, int]] = []
+    for start, end, id in sorted(intervals):
+        if end <= start: continue
+        while len(active) > 0 and active[0][0] <= start: heapq.heappop(active)
+        for other_end, other in active:
+            if other != id: overlaps[(min(id, other), max(id, other))] += min(end, other_end) - start
+        heapq.heappush(active, (end, id))
+    return overlaps
+
+@dataclasses.dataclass
+class SessionCoPlay:
+    """How long each pair of members spent in a session together, and playing the same game."""
+    together: dict[Pair, datetime.timedelta]
+    same_game: dict[Pair, datetime.timedelta]
+
+def get_session_coplay(members: list[tuple[datetime.datetime, datetime.datetime, int]], games: list[tuple[datetime.datetime, datetime.datetime, int]], players: dict[int, set[int]]) -> SessionCoPlay:
+    """Overlaps a session's member intervals, then for each game the intervals of the members who play it,
+    clipped to when the game was being played. Time playing several games at once counts for each of them."""
+    same_game = collections.defaultdict(datetime.timedelta)
+    for game_start, game_end, game_id in games:
+        game_players = players.get(game_id, set())
+        clipped = [(max(start, game_start), min(end, game_end), member_id) for start, end, member_id in members if member_id in game_players]
+        for pair, overlap in get_overlaps(clipped).items(): same_game[pair] += overlap
+    return SessionCoPlay(get_overlaps(members), same_game)
+
+@dataclasses.dataclass
+class PairTotals:
+    sessions: int = 0
+    together: datetime.timedelta = datetime.timedelta()
+    same_game: datetime.timedelta = datetime.timedelta()
+
+class CoPlayGraph:
+    """Per-session co-play keyed by session date, with running totals for each pair of members.
+
+    Replacing a session takes its old contribution off the totals, so refreshing only costs the sessions that changed."""
+
+    def __init__(self, players: Optional[dict[int, set[int]]] = None):
+        self.players = players or {}
+        self.sessions: dict[datetime.date, SessionCoPlay] = {}
+        self.totals: dict[Pair, PairTotals] = collections.defaultdict(PairTotals)
+
+    @property
+    def last(self) -> Optional[datetime.date]:
+        return max(self.sessions, default=None)
+
+    def _add(self, coplay: SessionCoPlay, sign: int) -> None:
+        for pair, overlap in coplay.together.items():
+            totals = self.totals[pair]
+            totals.sessions += sign
+            totals.together += sign * overlap
+        for pair, overlap in coplay.same_game.items():
+            self.totals[pair].same_game += sign * overlap
+
+    def set_session(self, date: datetime.date, coplay: SessionCoPlay) -> None:
+        if date in self.sessions: self._add(self.sessions[date], -1)
+        self.sessions[date] = coplay
+        self._add(coplay, 1)
+
+    def to_dicts(self, member_id: Optional[int] = None) -> list[dict]:
+        """Gets every pair that has shared a session, most time together first, optionally only the pairs including member_id."""
+        pairs = [(pair, totals) for pair, totals in self.totals.items() if totals.sessions > 0 and (member_id is None or member_id in pair)]
+        pairs.sort(key=lambda item: (-item[1].together, item[0]))
+        return [{
+            "member_ids" : list(pair),
+            "sessions" : totals.sessions,
+            "together" : totals.together,
+            "same_game" : totals.same_game,
+        } for pair, totals in pairs]
+
+def refresh(db: DataBaseSession, graph: Optional[CoPlayGraph]) -> CoPlayGraph:
+    """Brings a graph up to date with the database, computing only the sessions on or after its last one.
+
+    The last known session is recomputed as it may still have been in progress. The graph is rebuilt from scratch
+    if a session has been added before it, or if any member has started playing a new game."""
+    players = collections.defaultdict(set)
+    for member_id, game_id in db.get_member_game_pairs(): players[game_id].add(member_id)
+
+    last = None if graph is None else graph.last
+    if last is None or graph.players != players or db.get_number_of_sessions(until=last) != len(graph.sessions):
+        graph, after = CoPlayGraph(players), None
+    else:
+        after = last - datetime.timedelta(days=1)
+
+    members = {date: [] for date in db.get_session_dates(after=after)}
+    games = {date: [] for date in members}
+    for date, member_id, start, end in db.get_session_member_intervals(after=after): members[date].append((start, end, member_id))
+    for date, game_id, start, end in db.get_session_game_intervals(after=after): games[date].append((start, end, game_id))
+    for date in members: graph.set_session(date, get_session_coplay(members[date], games[date], players))
+    return graph
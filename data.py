@@ -1,20 +1,139 @@
+import io
 import os
+import csv
 import datetime
+import threading
+import collections
 import constants
 import sqlalchemy
 import utils
+import metrics
 import sqlalchemy.orm
-from sqlalchemy import select
-from typing import Optional
-from model import Base, Member, Session, SessionMember, Game, SessionGame, MemberGame
+import sqlalchemy.ext.asyncio
+import sqlalchemy.dialects.sqlite
+import sqlalchemy.dialects.postgresql
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import joinedload, contains_eager
+from typing import Iterable, Optional
+from model import Member, Session, SessionMember, Game, SessionGame, MemberGame, MemberStats, GameStats, DataVersion, ActivityEvent, PendingSession, SessionTimeline, GameAlias
 
-engine = sqlalchemy.create_engine(constants.CONNECTION_STRING, echo=True)
-Base.metadata.create_all(engine)
+ASYNC_DRIVERS = {
+    "postgresql" : "postgresql+asyncpg",
+    "sqlite" : "sqlite+aiosqlite",
+}
+
+def get_async_connection_string(connection_string: str) -> str:
+    """Maps a synchronous connection string onto the equivalent asyncio driver."""
+    url = sqlalchemy.make_url(connection_string)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS: raise Exception(f"No asyncio driver known for [{backend}] databases, set ASYNC_CONNECTION_STRING.")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+# --- Engines ---
+# Engines are created on first use in each process rather than at import, so importing this module costs no
+# database round trip and forked workers never share their parent's connections. Each worker's pools are sized
+# from its share of DATABASE_CONNECTIONS. The schema is created and upgraded by `python manage.py migrate` at
+# deploy time.
+
+_engines: dict[int, tuple[sqlalchemy.Engine, sqlalchemy.ext.asyncio.AsyncEngine]] = {}
+_engines_lock = threading.Lock()
+
+def get_pool_options(connections: Optional[int], workers: int) -> tuple[dict, dict]:
+    """Splits a budget of connections between the sync and async engines of each of a service's worker processes.
+
+    Requests, bot events and compaction all go through the async engine, so it gets all but one of a worker's
+    share, half kept open and half as overflow opened under load. The sync engine keeps a single connection."""
+    if connections is None: return {}, {}
+    share = connections // workers
+    if share < 2: raise Exception(f"DATABASE_CONNECTIONS [{connections}] leaves fewer than 2 connections for each of [{workers}] workers.")
+    pool_size = max((share - 1) // 2, 1)
+    return {"pool_size" : 1, "max_overflow" : 0}, {"pool_size" : pool_size, "max_overflow" : share - 1 - pool_size}
+
+def create_engines() -> tuple[sqlalchemy.Engine, sqlalchemy.ext.asyncio.AsyncEngine]:
+    pool, async_pool = get_pool_options(constants.DATABASE_CONNECTIONS, constants.WEB_CONCURRENCY)
+    engine = sqlalchemy.create_engine(constants.CONNECTION_STRING, echo=constants.SQL_ECHO, poolclass=metrics.TimedQueuePool, **pool)
+    async_engine = sqlalchemy.ext.asyncio.create_async_engine(constants.ASYNC_CONNECTION_STRING or get_async_connection_string(constants.CONNECTION_STRING), echo=constants.SQL_ECHO, poolclass=metrics.TimedAsyncQueuePool, **async_pool)
+    metrics.instrument(engine, "sync")
+    metrics.instrument(async_engine.sync_engine, "async")
+    return engine, async_engine
+
+def _get_engines() -> tuple[sqlalchemy.Engine, sqlalchemy.ext.asyncio.AsyncEngine]:
+    pid = os.getpid()
+    engines = _engines.get(pid)
+    if engines is not None: return engines
+    with _engines_lock:
+        if pid not in _engines:
+            # engines inherited from a parent process, drop their pools without closing the parent's connections
+            for engine, async_engine in _engines.values():
+                engine.dispose(close=False)
+                async_engine.sync_engine.dispose(close=False)
+            _engines.clear()
+            _engines[pid] = create_engines()
+        return _engines[pid]
+
+def get_engine() -> sqlalchemy.Engine:
+    """Gets this process's engine, creating it on first use."""
+    return _get_engines()[0]
+
+def get_async_engine() -> sqlalchemy.ext.asyncio.AsyncEngine:
+    """Gets this process's asyncio engine, creating it on first use."""
+    return _get_engines()[1]
+
+# --- Queries ---
+
+def filter_sessions(statement, after: Optional[int] = None, limit: Optional[int] = None, from_date: Optional[datetime.date] = None, to_date: Optional[datetime.date] = None):
+    """Pages a statement ordered by Session.date, continuing after the session with id `after` and within the dates."""
+    if after is not None: statement = statement.where(Session.date > select(Session.date).where(Session.id == after).scalar_subquery())
+    if from_date is not None: statement = statement.where(Session.date >= from_date)
+    if to_date is not None: statement = statement.where(Session.date <= to_date)
+    if limit is not None: statement = statement.limit(limit)
+    return statement
+
+def select_sessions(guild_id: int, after: Optional[int] = None, limit: Optional[int] = None, from_date: Optional[datetime.date] = None, to_date: Optional[datetime.date] = None):
+    return filter_sessions(select(Session).where(Session.guild_id == guild_id).order_by(Session.date), after, limit, from_date, to_date)
+
+def select_members(guild_id: int, after: Optional[int] = None, limit: Optional[int] = None):
+    statement = select(Member).where(Member.guild_id == guild_id).order_by(Member.id)
+    if after is not None: statement = statement.where(Member.id > after)
+    if limit is not None: statement = statement.limit(limit)
+    return statement
+
+def select_games(guild_id: int, after: Optional[int] = None, limit: Optional[int] = None):
+    statement = select(Game).where(Game.guild_id == guild_id).order_by(Game.id)
+    if after is not None: statement = statement.where(Game.id > after)
+    if limit is not None: statement = statement.limit(limit)
+    return statement
+
+def select_session_members_for_member(guild_id: int, member_id: int, after: Optional[int] = None, limit: Optional[int] = None, from_date: Optional[datetime.date] = None, to_date: Optional[datetime.date] = None):
+    statement = (select(SessionMember)
+        .join(SessionMember.session)
+        .options(contains_eager(SessionMember.session))
+        .where(Session.guild_id == guild_id)
+        .where(SessionMember.member_id == member_id)
+        .order_by(Session.date))
+    return filter_sessions(statement, after, limit, from_date, to_date)
+
+def select_session_games_for_game(guild_id: int, game_id: int, after: Optional[int] = None, limit: Optional[int] = None, from_date: Optional[datetime.date] = None, to_date: Optional[datetime.date] = None):
+    statement = (select(SessionGame)
+        .join(SessionGame.session)
+        .options(contains_eager(SessionGame.session))
+        .where(Session.guild_id == guild_id)
+        .where(SessionGame.game_id == game_id)
+        .order_by(Session.date))
+    return filter_sessions(statement, after, limit, from_date, to_date)
 
 class DataBaseSession:
+    """Reads and writes the members, sessions and games of one guild, DISCORD_GUILD_ID unless guild_id is given.
+    Rows hanging off those, e.g. session members, are reached through their ids and need no guild of their own."""
+
+    def __init__(self, session: Optional[sqlalchemy.orm.Session] = None, autocommit: bool = True, guild_id: Optional[int] = None):
+        self._session = session if session is not None else sqlalchemy.orm.Session(get_engine())
+        self._autocommit = autocommit
+        self.guild_id = constants.DISCORD_GUILD_ID if guild_id is None else guild_id
 
-    def __init__(self):
-        self._session = sqlalchemy.orm.Session(engine)
+    def for_guild(self, guild_id: int) -> "DataBaseSession":
+        """Gets a DataBaseSession for another guild, sharing this one's transaction."""
+        return DataBaseSession(self._session, self._autocommit, guild_id)
 
     def __enter__(self):
         self._session.__enter__()
@@ -23,66 +142,216 @@ class DataBaseSession:
     def __exit__(self, exception_type, exception_value, exception_traceback):
         self._session.__exit__(exception_type, exception_value, exception_traceback)
 
+    def commit(self) -> None:
+        """Commits any writes made while autocommit is off, bumping the data version of every table they touched."""
+        modified = self._session.info.pop("modified", set())
+        if len(modified) > 0:
+            now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            statement = self._insert(DataVersion).values([{"name" : name, "version" : 1, "modified" : now} for name in sorted(modified)])
+            self._session.execute(statement.on_conflict_do_update(
+                index_elements=[DataVersion.name],
+                set_={"version" : DataVersion.version + 1, "modified" : statement.excluded.modified}))
+        self._session.commit()
+
+    def _commit(self, *tables: str) -> None:
+        """Commits after a write, or only flushes it when the caller is batching writes into one transaction."""
+        self._touch(*tables)
+        if self._autocommit: self.commit()
+        else: self._session.flush()
+
+    def _touch(self, *tables: str) -> None:
+        """Records that tables were written to, kept on the underlying session so it survives AsyncDataBaseSession calls."""
+        self._session.info.setdefault("modified", set()).update(tables)
+
+    def ping(self) -> None:
+        """Runs a trivial query, raising if the database can't be reached."""
+        self._session.execute(select(1))
+
+    def get_data_versions(self, tables: Iterable[str]) -> dict[str, tuple[int, datetime.datetime]]:
+        """Gets the (version, modified) of each table, bumped whenever a write to the table is committed."""
+        rows = self._session.execute(select(DataVersion.name, DataVersion.version, DataVersion.modified)
+            .where(DataVersion.name.in_(tables))).all()
+        return {name: (version, modified) for name, version, modified in rows}
+
+    def _insert(self, entity):
+        """Creates an INSERT for the session's dialect, which supports ON CONFLICT on both Postgres and SQLite."""
+        if self._session.get_bind().dialect.name == "postgresql": return sqlalchemy.dialects.postgresql.insert(entity)
+        return sqlalchemy.dialects.sqlite.insert(entity)
+
+    def _get_or_create(self, entity, index_elements: list, **values):
+        """Returns the row matching a unique index, inserting it if missing.
+
+        An existing row costs a single SELECT and no write, so it doesn't invalidate cached reads of the table.
+        A missing row is inserted with ON CONFLICT DO NOTHING and re-read if another writer got there first."""
+        statement = select(entity).where(*[element == values[element.key] for element in index_elements])
+        row = self._session.scalars(statement).first()
+        if row is not None: return row
+
+        row = self._insert_if_missing(entity, index_elements, **values)
+        if row is None: return self._session.scalars(statement).one()
+        self._commit()
+        return row
+
+    def _insert_if_missing(self, entity, index_elements: list, **values):
+        """Inserts a row unless one already matches its unique index, returning the new row or None.
+
+        Only the writer that actually inserts the row gets it back, so it alone updates any running totals."""
+        statement = self._insert(entity).values(**values).on_conflict_do_nothing(index_elements=index_elements)
+        row = self._session.scalars(statement.returning(entity), execution_options={"populate_existing": True}).first()
+        if row is not None: self._touch(entity.__tablename__)
+        return row
+
+    def _add_or_update_interval(self, entity, start: datetime.datetime, end: datetime.datetime, **keys) -> bool:
+        """Moves the end of the interval row matching keys, or inserts it. Returns whether the row was inserted.
+
+        The usual case of an existing row is a single UPDATE."""
+        matches = [getattr(entity, key) == value for key, value in keys.items()]
+        self._touch(entity.__tablename__)
+        if self._session.execute(update(entity).where(*matches).values(end=end)).rowcount > 0: return False
+        if self._insert_if_missing(entity, [getattr(entity, key) for key in keys], start=start, end=end, **keys) is not None: return True
+        self._session.execute(update(entity).where(*matches).values(end=end))
+        return False
+
+    def _set_interval(self, entity, start: datetime.datetime, end: datetime.datetime, duration: float, **keys) -> bool:
+        """Replaces the interval of the row matching keys, or inserts it. Returns whether the row was inserted."""
+        matches = [getattr(entity, key) == value for key, value in keys.items()]
+        values = {"start" : start, "end" : end, "duration" : duration}
+        self._touch(entity.__tablename__)
+        if self._session.execute(update(entity).where(*matches).values(values)).rowcount > 0: return False
+        if self._insert_if_missing(entity, [getattr(entity, key) for key in keys], **values, **keys) is not None: return True
+        self._session.execute(update(entity).where(*matches).values(values))
+        return False
+
+    def _increment(self, entity, key: str, id: int, **deltas: int) -> None:
+        """Adds deltas to the running totals in an aggregate row, creating the row if needed."""
+        statement = self._insert(entity).values({key: id, **deltas})
+        self._touch(entity.__tablename__)
+        self._session.execute(statement.on_conflict_do_update(
+            index_elements=[key],
+            set_={name: getattr(entity, name) + statement.excluded[name] for name in deltas}))
+
 # --- Session ---
 
-    def get_sessions(self) -> list[Session]:
-        """Gets all sessions from the database."""
-        return self._session.scalars(select(Session)).all()
+    def get_sessions(self, after: Optional[int] = None, limit: Optional[int] = None, from_date: Optional[datetime.date] = None, to_date: Optional[datetime.date] = None) -> list[Session]:
+        """Gets sessions in date order, optionally a page of them after the session with id `after`."""
+        return self._session.scalars(select_sessions(self.guild_id, after, limit, from_date, to_date)).all()
 
     def get_session_by_id(self, id: int) -> Optional[Session]:
         return self._session.scalars(select(Session)
-            .where(Session.id == id)).first()
+            .options(joinedload(Session.games_master))
+            .where(Session.id == id)
+            .where(Session.guild_id == self.guild_id)).first()
     
     def get_session_by_date(self, date: datetime.date) -> Session:
         """Checks the database for a session which matches the datetime."""
         return self._session.scalars(select(Session)
+            .where(Session.guild_id == self.guild_id)
             .where(Session.date == date)).first()
     
     def get_or_create_session(self, current_date: datetime.date) -> Session:
         """Gets or creates a session for the provided date"""
-        session = self.get_session_by_date(current_date)
-        if session is None: session = self.add_session(current_date)
-        return session
+        return self._get_or_create(Session, [Session.guild_id, Session.date], guild_id=self.guild_id, date=current_date)
 
     def add_session(self, date: datetime.date):
         """Adds a new session to the database."""
-        session = Session(date=date)
+        session = Session(guild_id=self.guild_id, date=date)
         self._session.add(session)
-        self._session.commit()
+        self._commit("sessions")
         return session
+
+    def get_number_of_sessions(self, until: Optional[datetime.date] = None) -> int:
+        """Counts the sessions, optionally only those on or before a date."""
+        statement = select(func.count()).select_from(Session).where(Session.guild_id == self.guild_id)
+        if until is not None: statement = statement.where(Session.date <= until)
+        return self._session.scalar(statement)
+
+    def get_session_dates(self, after: Optional[datetime.date] = None) -> list[datetime.date]:
+        """Gets the date of every session in order, optionally only those after a date."""
+        statement = select(Session.date).where(Session.guild_id == self.guild_id).order_by(Session.date)
+        if after is not None: statement = statement.where(Session.date > after)
+        return self._session.scalars(statement).all()
+
+    def set_session_games_master(self, session_id: int, member_id: Optional[int]) -> bool:
+        """Sets who ran the session, moving the games mastered count from any previous games master."""
+        session = self.get_session_by_id(session_id)
+        if session is None: return False
+        if session.games_master_id == member_id: return True
+
+        if session.games_master_id is not None: self._increment(MemberStats, "member_id", session.games_master_id, games_mastered=-1)
+        if member_id is not None: self._increment(MemberStats, "member_id", member_id, games_mastered=1)
+        session.games_master_id = member_id
+        self._commit("sessions")
+        return True
+    
+    def get_session_timeline(self, session_id: int) -> Optional[dict]:
+        timeline = self._session.get(SessionTimeline, session_id)
+        return None if timeline is None else timeline.timeline
+
+    def set_session_timeline(self, session_id: int, timeline: dict) -> None:
+        """Stores a closed session's timeline, replacing any stored before."""
+        statement = self._insert(SessionTimeline).values(session_id=session_id, timeline=timeline)
+        self._session.execute(statement.on_conflict_do_update(index_elements=[SessionTimeline.session_id], set_={"timeline" : statement.excluded.timeline}))
+        self._commit("session_timelines")
+
+    def delete_session_timeline(self, session_id: int) -> None:
+        """Drops a session's stored timeline, e.g. after its intervals have been rebuilt."""
+        if self._session.execute(delete(SessionTimeline).where(SessionTimeline.session_id == session_id)).rowcount > 0: self._commit("session_timelines")
     
 # --- Member ---
 
-    def get_members(self) -> list[Member]:
-        """Gets all members from the database."""
-        return self._session.scalars(select(Member)).all()
+    def get_members(self, after: Optional[int] = None, limit: Optional[int] = None) -> list[Member]:
+        """Gets members in id order, optionally a page of them after the member with id `after`."""
+        return self._session.scalars(select_members(self.guild_id, after, limit)).all()
+
+    def get_members_in_guilds(self, guild_ids: Optional[Iterable[int]] = None) -> list[Member]:
+        """Gets the members of several guilds at once, or of every guild if guild_ids is None."""
+        statement = select(Member)
+        if guild_ids is not None: statement = statement.where(Member.guild_id.in_(list(guild_ids)))
+        return self._session.scalars(statement).all()
     
     def get_member_by_id(self, id: int) -> Optional[Member]:
         return self._session.scalars(select(Member)
-            .where(Member.id == id)).first()
+            .where(Member.id == id)
+            .where(Member.guild_id == self.guild_id)).first()
     
     def get_member_by_name(self, name: str) -> Optional[Member]:
         return self._session.scalars(select(Member)
+            .where(Member.guild_id == self.guild_id)
             .where(Member.name == name)).first()
     
     def get_member_by_discord_name(self, discord_name: str) -> Optional[Member]:
         return self._session.scalars(select(Member)
+            .where(Member.guild_id == self.guild_id)
             .where(Member.discord_name == discord_name)).first()
 
     def add_member(self, name: str, discord_name: str, is_admin: bool=False):
-        member = Member(name=name,
+        member = Member(guild_id=self.guild_id,
+                        name=name,
                         discord_name=discord_name,
                         is_admin=is_admin)
         self._session.add(member)
-        self._session.commit()
+        self._commit("members")
         return member
     
     def remove_member_by_id(self, id: int):
+        """Removes a member and their history: attendance, games played, events and totals. Sessions they ran are
+        left without a games master, and the games they played each lose one from members_played."""
         member = self.get_member_by_id(id)
-        if member is None: return False 
+        if member is None: return False
 
-        self._session.remove(member)
-        self._session.commit()
+        game_ids = self._session.scalars(select(MemberGame.game_id).where(MemberGame.member_id == id)).all()
+        session_ids = self._session.scalars(select(SessionMember.session_id).where(SessionMember.member_id == id)).all()
+        if len(game_ids) > 0:
+            self._session.execute(update(GameStats).where(GameStats.game_id.in_(game_ids)).values(members_played=GameStats.members_played - 1))
+        if len(session_ids) > 0:
+            self._session.execute(delete(SessionTimeline).where(SessionTimeline.session_id.in_(session_ids)))
+        self._session.execute(update(Session).where(Session.games_master_id == id).values(games_master_id=None))
+        self._session.execute(delete(SessionMember).where(SessionMember.member_id == id))
+        self._session.execute(delete(MemberGame).where(MemberGame.member_id == id))
+        self._session.execute(delete(MemberStats).where(MemberStats.member_id == id))
+        self._session.execute(delete(ActivityEvent).where(ActivityEvent.member_id == id))
+        self._session.execute(delete(Member).where(Member.id == id))
+        self._commit("members", "member_stats", "game_stats", "sessions", "session_members", "member_games", "session_timelines")
         return True
         
 # --- SessionMember ---
@@ -93,13 +362,29 @@ class DataBaseSession:
             .where(SessionMember.session_id == session_id)).first()
         
     def get_session_members_for_session(self, session_id: int):
+        """Gets the session members for a session, with each member loaded in the same statement."""
         return self._session.scalars(select(SessionMember)
+            .options(joinedload(SessionMember.member))
             .where(SessionMember.session_id == session_id)).all()
     
-    def get_session_members_for_member(self, member_id: int):
-        return self._session.scalars(select(SessionMember)
-            .where(SessionMember.member_id == member_id)).all()
+    def get_session_members_for_member(self, member_id: int, after: Optional[int] = None, limit: Optional[int] = None, from_date: Optional[datetime.date] = None, to_date: Optional[datetime.date] = None):
+        """Gets the session members for a member in session date order, with each session loaded in the same statement."""
+        return self._session.scalars(select_session_members_for_member(self.guild_id, member_id, after, limit, from_date, to_date)).all()
     
+    def get_session_member_dates(self, after: Optional[datetime.date] = None) -> list[tuple[datetime.date, int]]:
+        """Gets (session date, member id) for every attendance, optionally only for sessions after a date."""
+        statement = select(Session.date, SessionMember.member_id).join(SessionMember.session).where(Session.guild_id == self.guild_id)
+        if after is not None: statement = statement.where(Session.date > after)
+        return self._session.execute(statement).all()
+
+    def get_session_member_intervals(self, after: Optional[datetime.date] = None) -> list[tuple[datetime.date, int, datetime.datetime, datetime.datetime]]:
+        """Gets (session date, member id, start, end) for every attendance, optionally only for sessions after a date."""
+        statement = (select(Session.date, SessionMember.member_id, SessionMember.start, SessionMember.end)
+            .join(SessionMember.session)
+            .where(Session.guild_id == self.guild_id))
+        if after is not None: statement = statement.where(Session.date > after)
+        return self._session.execute(statement).all()
+
     def get_session_member_by_id(self, session_member_id: int) -> Optional[SessionMember]:
         return self._session.scalars(select(SessionMember)
             .where(SessionMember.id == session_member_id)).first()
@@ -112,46 +397,140 @@ class DataBaseSession:
             end = end 
         )
         self._session.add(session_member)
-        self._session.commit()
+        self._increment(MemberStats, "member_id", member_id, sessions_attended=1)
+        self._commit("session_members")
         return session_member
 
     def add_or_update_session_member(self, session_id: int, member_id: int, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None):
+        """Adds the session member, or moves the end of the existing one, counting new attendance in member_stats."""
         if start is None and end is None: raise Exception("Cannot add or update session member if both start and end times are None.")
-        session_member = self.get_session_member(member_id=member_id, session_id=session_id)
         if start is None: start = utils.get_current_or_last_session_start_date(end.date())
         if end is None: end = start
-        if session_member is None:
-            self.add_session_member(member_id, session_id, start=start, end=end)
-        else:
-            session_member.end = end
-            self._session.commit()
+        if self._add_or_update_interval(SessionMember, start, end, session_id=session_id, member_id=member_id):
+            self._increment(MemberStats, "member_id", member_id, sessions_attended=1)
+        self._commit()
+
+    def set_session_member_interval(self, session_id: int, member_id: int, start: datetime.datetime, end: datetime.datetime, duration: float) -> None:
+        """Replaces the session member's interval with one compacted from activity_events, counting new attendance in member_stats."""
+        if self._set_interval(SessionMember, start, end, duration, session_id=session_id, member_id=member_id):
+            self._increment(MemberStats, "member_id", member_id, sessions_attended=1)
+        self._commit()
 
 # --- Game ---
 
-    def get_games(self) -> list[Game]:
-        """Gets all games from the database."""
-        return self._session.scalars(select(Game)).all()
+    def get_games(self, after: Optional[int] = None, limit: Optional[int] = None) -> list[Game]:
+        """Gets games in id order, optionally a page of them after the game with id `after`."""
+        return self._session.scalars(select_games(self.guild_id, after, limit)).all()
 
     def get_game_by_id(self, id: int) -> Optional[Game]:
         return self._session.scalars(select(Game)
-            .where(Game.id == id)).first()
+            .where(Game.id == id)
+            .where(Game.guild_id == self.guild_id)).first()
     
     def get_game_by_name(self, name: str) -> Game:
         """Checks the database for a game which matches the name."""
         return self._session.scalars(select(Game)
+            .where(Game.guild_id == self.guild_id)
             .where(Game.name == name)).first()
     
+    def find_game(self, name: str) -> Optional[Game]:
+        """Finds the game a name refers to, by its normalized name or one of its aliases."""
+        normalized_name = utils.normalize_game_name(name)
+        game = self._session.scalars(select(Game)
+            .where(Game.guild_id == self.guild_id)
+            .where(Game.normalized_name == normalized_name)).first()
+        if game is not None: return game
+        return self._session.scalars(select(Game)
+            .join(GameAlias, GameAlias.game_id == Game.id)
+            .where(GameAlias.guild_id == self.guild_id)
+            .where(GameAlias.normalized_name == normalized_name)).first()
+
     def get_or_create_game(self, name: str) -> Game:
-        """Gets or creates a session for the provided date"""
-        game = self.get_game_by_name(name)
-        if game is None: game = self.add_game(name)
-        return game
+        """Gets the game a name refers to, or creates one under that name if there is none."""
+        game = self.find_game(name)
+        if game is not None: return game
+        return self._get_or_create(Game, [Game.guild_id, Game.normalized_name], guild_id=self.guild_id, normalized_name=utils.normalize_game_name(name), name=name)
+
+    def get_game_names(self) -> list[tuple[str, int]]:
+        """Gets (normalized name, game id) for every game of the guild and every alias."""
+        games = select(Game.normalized_name, Game.id).where(Game.guild_id == self.guild_id).where(Game.normalized_name.is_not(None))
+        aliases = select(GameAlias.normalized_name, GameAlias.game_id).where(GameAlias.guild_id == self.guild_id)
+        return self._session.execute(games.union_all(aliases)).all()
+
+    def add_game_alias(self, game_id: int, name: str) -> bool:
+        """Makes name resolve to the game. Returns False if the name already refers to a game."""
+        if self.find_game(name) is not None: return False
+        alias = self._insert_if_missing(GameAlias, [GameAlias.guild_id, GameAlias.normalized_name], guild_id=self.guild_id, normalized_name=utils.normalize_game_name(name), game_id=game_id)
+        self._commit("game_aliases")
+        return alias is not None
     
+    def merge_games(self, keep_id: int, ids: list[int]) -> None:
+        """Folds the games in ids into keep_id in a fixed number of statements, however much history they have.
+
+        Their session games become one per session spanning all of them, their member games one per member, and
+        their names aliases of the kept game. Running totals are left to rebuild_stats."""
+        all_ids = [keep_id, *ids]
+        spans = self._session.execute(select(SessionGame.session_id, func.min(SessionGame.start), func.max(SessionGame.end), func.max(SessionGame.duration), func.count())
+            .where(SessionGame.game_id.in_(all_ids))
+            .group_by(SessionGame.session_id)).all()
+        member_ids = self._session.scalars(select(MemberGame.member_id).distinct().where(MemberGame.game_id.in_(all_ids))).all()
+        keep_name = self._session.scalar(select(Game.normalized_name).where(Game.id == keep_id))
+        names = self._session.execute(select(Game.guild_id, Game.normalized_name).distinct().where(Game.id.in_(ids))).all()
+
+        self._session.execute(delete(SessionGame).where(SessionGame.game_id.in_(all_ids)))
+        self._session.execute(delete(MemberGame).where(MemberGame.game_id.in_(all_ids)))
+        self._session.execute(delete(GameStats).where(GameStats.game_id.in_(ids)))
+        self._session.execute(delete(SessionTimeline).where(SessionTimeline.session_id.in_([session_id for session_id, *_ in spans])))
+        self._session.execute(update(GameAlias).where(GameAlias.game_id.in_(ids)).values(game_id=keep_id))
+        self._session.execute(delete(Game).where(Game.id.in_(ids)))
+
+        if len(spans) > 0:
+            # a merged interval's duration is unknown until the session is compacted again, so it falls back to end - start
+            self._session.execute(sqlalchemy.insert(SessionGame), [{
+                "session_id" : session_id,
+                "game_id" : keep_id,
+                "start" : start,
+                "end" : end,
+                "duration" : duration if count == 1 else None,
+            } for session_id, start, end, duration, count in spans], execution_options={"render_nulls" : True})
+        if len(member_ids) > 0:
+            self._session.execute(sqlalchemy.insert(MemberGame), [{"member_id" : member_id, "game_id" : keep_id} for member_id in member_ids])
+        aliases = [{"guild_id" : guild_id, "normalized_name" : normalized_name, "game_id" : keep_id} for guild_id, normalized_name in names if normalized_name is not None and normalized_name != keep_name]
+        if len(aliases) > 0:
+            self._session.execute(self._insert(GameAlias).on_conflict_do_nothing(index_elements=[GameAlias.guild_id, GameAlias.normalized_name]), aliases)
+        self._commit("games", "game_aliases", "session_games", "member_games", "session_timelines")
+
+    def get_duplicate_games(self) -> dict[int, list[int]]:
+        """Gets the games, in every guild, that share a normalized name with an earlier game of their guild or whose
+        normalized name is an alias of another game, as {id of the game to keep: ids of the games to merge into it}."""
+        games = self._session.execute(select(Game.id, Game.guild_id, Game.normalized_name).order_by(Game.id)).all()
+        aliases = {(guild_id, normalized_name): game_id for guild_id, normalized_name, game_id in self._session.execute(select(GameAlias.guild_id, GameAlias.normalized_name, GameAlias.game_id))}
+        keys = {id: (guild_id, normalized_name) for id, guild_id, normalized_name in games}
+        firsts = {}
+        for id, key in keys.items(): firsts.setdefault(key, id)
+
+        merges = collections.defaultdict(list)
+        for id, key in keys.items():
+            target = aliases.get(key)
+            keep_id = firsts[keys[target]] if target in keys else firsts[key]
+            if keep_id != id: merges[keep_id].append(id)
+        return dict(merges)
+
+    def get_game_names_by_id(self, ids: Iterable[int]) -> dict[int, str]:
+        """Gets the name of each game in ids, whatever its guild."""
+        return dict(self._session.execute(select(Game.id, Game.name).where(Game.id.in_(list(ids)))).all())
+
+    def merge_duplicate_games(self) -> int:
+        """Merges every group from get_duplicate_games. Returns the number of games merged away."""
+        merges = self.get_duplicate_games()
+        for keep_id, ids in merges.items(): self.merge_games(keep_id, ids)
+        return sum(len(ids) for ids in merges.values())
+
     def add_game(self, name: str) -> Game:
         """Adds a new game to the database."""
-        game = Game(name=name)
+        game = Game(guild_id=self.guild_id, name=name, normalized_name=utils.normalize_game_name(name))
         self._session.add(game)
-        self._session.commit()
+        self._commit("games")
         return game
     
 # --- SessionGame ---
@@ -162,13 +541,29 @@ class DataBaseSession:
             .where(SessionGame.session_id == session_id)).first()
         
     def get_session_games_for_session(self, session_id: int):
+        """Gets the session games for a session, with each game loaded in the same statement."""
         return self._session.scalars(select(SessionGame)
+            .options(joinedload(SessionGame.game))
             .where(SessionGame.session_id == session_id)).all()
     
-    def get_session_games_for_game(self, game_id: int):
-        return self._session.scalars(select(SessionGame)
-            .where(SessionGame.game_id == game_id)).all()
+    def get_session_games_for_game(self, game_id: int, after: Optional[int] = None, limit: Optional[int] = None, from_date: Optional[datetime.date] = None, to_date: Optional[datetime.date] = None):
+        """Gets the session games for a game in session date order, with each session loaded in the same statement."""
+        return self._session.scalars(select_session_games_for_game(self.guild_id, game_id, after, limit, from_date, to_date)).all()
     
+    def get_session_game_dates(self, after: Optional[datetime.date] = None) -> list[tuple[datetime.date, int]]:
+        """Gets (session date, game id) for every game played, optionally only for sessions after a date."""
+        statement = select(Session.date, SessionGame.game_id).join(SessionGame.session).where(Session.guild_id == self.guild_id)
+        if after is not None: statement = statement.where(Session.date > after)
+        return self._session.execute(statement).all()
+
+    def get_session_game_intervals(self, after: Optional[datetime.date] = None) -> list[tuple[datetime.date, int, datetime.datetime, datetime.datetime]]:
+        """Gets (session date, game id, start, end) for every game played, optionally only for sessions after a date."""
+        statement = (select(Session.date, SessionGame.game_id, SessionGame.start, SessionGame.end)
+            .join(SessionGame.session)
+            .where(Session.guild_id == self.guild_id))
+        if after is not None: statement = statement.where(Session.date > after)
+        return self._session.execute(statement).all()
+
     def get_session_game_by_id(self, session_game_id: int) -> Optional[SessionGame]:
         return self._session.scalars(select(SessionGame)
             .where(SessionGame.id == session_game_id)).first()
@@ -181,19 +576,24 @@ class DataBaseSession:
             end = end 
         )
         self._session.add(session_game)
-        self._session.commit()
+        self._increment(GameStats, "game_id", game_id, sessions_played=1)
+        self._commit("session_games")
         return session_game
 
     def add_or_update_session_game(self, session_id: int, game_id: int, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None):
+        """Adds the session game, or moves the end of the existing one, counting new sessions in game_stats."""
         if start is None and end is None: raise Exception("Cannot add or update session member if both start and end times are None.")
-        session_game = self.get_session_game(game_id=game_id, session_id=session_id)
         if start is None: start = utils.get_current_or_last_session_start_date(end.date())
         if end is None: end = start
-        if session_game is None:
-            self.add_session_game(session_id, game_id, start=start, end=end)
-        else:
-            session_game.end = end
-            self._session.commit()
+        if self._add_or_update_interval(SessionGame, start, end, session_id=session_id, game_id=game_id):
+            self._increment(GameStats, "game_id", game_id, sessions_played=1)
+        self._commit()
+
+    def set_session_game_interval(self, session_id: int, game_id: int, start: datetime.datetime, end: datetime.datetime, duration: float) -> None:
+        """Replaces the session game's interval with one compacted from activity_events, counting new sessions in game_stats."""
+        if self._set_interval(SessionGame, start, end, duration, session_id=session_id, game_id=game_id):
+            self._increment(GameStats, "game_id", game_id, sessions_played=1)
+        self._commit()
 
 # -- MemberGame --
 
@@ -203,23 +603,261 @@ class DataBaseSession:
             .where(MemberGame.member_id == member_id)).first()
     
     def get_member_games_for_game(self, game_id: int):
+        """Gets the member games for a game, with each member loaded in the same statement."""
         return self._session.scalars(select(MemberGame)
+            .options(joinedload(MemberGame.member))
             .where(MemberGame.game_id == game_id)).all()
     
     def get_member_games_for_member(self, member_id: int):
+        """Gets the member games for a member, with each game loaded in the same statement."""
         return self._session.scalars(select(MemberGame)
+            .options(joinedload(MemberGame.game))
             .where(MemberGame.member_id == member_id)).all()
     
+    def get_member_game_pairs(self) -> list[tuple[int, int]]:
+        """Gets (member id, game id) for every game each member of the guild has played."""
+        return self._session.execute(select(MemberGame.member_id, MemberGame.game_id)
+            .join(MemberGame.member)
+            .where(Member.guild_id == self.guild_id)).all()
+
     def add_member_game(self, member_id: int, game_id: int):
         member_game = MemberGame(
             member_id = member_id,
             game_id = game_id,
         )
         self._session.add(member_game)
-        self._session.commit()
+        self._increment(MemberStats, "member_id", member_id, games_played=1)
+        self._increment(GameStats, "game_id", game_id, members_played=1)
+        self._commit("member_games")
         return member_game
     
-    def get_or_add_member_game(self, member_id: int, game_id: int) -> Game:
-        member_game = self.get_member_game_by_member_and_game(member_id, game_id)
-        if member_game is None: member_game = self.add_member_game(member_id, game_id)
+    def get_or_add_member_game(self, member_id: int, game_id: int) -> MemberGame:
+        member_game = self._insert_if_missing(MemberGame, [MemberGame.member_id, MemberGame.game_id], member_id=member_id, game_id=game_id)
+        if member_game is None: return self.get_member_game_by_member_and_game(member_id, game_id)
+
+        self._increment(MemberStats, "member_id", member_id, games_played=1)
+        self._increment(GameStats, "game_id", game_id, members_played=1)
+        self._commit()
         return member_game
+
+# -- ActivityEvent --
+
+    def add_activity_events(self, events: list[dict]) -> None:
+        """Appends raw events in a single INSERT and marks their sessions pending in the same transaction. Nothing
+        reads the log directly, so no data versions are bumped."""
+        # render_nulls keeps the rows with and without a game_name in the same executemany
+        self._session.execute(sqlalchemy.insert(ActivityEvent), events, execution_options={"render_nulls" : True})
+        # in a fixed order, so writers marking the same sessions can't deadlock
+        keys = sorted({(event["guild_id"], event["session_date"]) for event in events})
+        statement = self._insert(PendingSession)
+        self._session.execute(statement.on_conflict_do_update(
+            index_elements=[PendingSession.guild_id, PendingSession.session_date],
+            set_={"version" : PendingSession.version + 1}), [{"guild_id" : guild_id, "session_date" : session_date, "version" : 1} for guild_id, session_date in keys])
+        self._commit()
+
+    def get_activity_events(self, session_date: datetime.date) -> list[ActivityEvent]:
+        """Gets every event of a session in the order they happened."""
+        return self._session.scalars(select(ActivityEvent)
+            .where(ActivityEvent.guild_id == self.guild_id)
+            .where(ActivityEvent.session_date == session_date)
+            .order_by(ActivityEvent.timestamp, ActivityEvent.id)).all()
+
+    def get_activity_event_dates(self) -> list[tuple[int, datetime.date]]:
+        """Gets the (guild id, session date) of every session in the log, across every guild."""
+        return self._session.execute(select(ActivityEvent.guild_id, ActivityEvent.session_date).distinct()
+            .order_by(ActivityEvent.guild_id, ActivityEvent.session_date)).all()
+
+    def get_pending_sessions(self) -> list[tuple[int, datetime.date, int]]:
+        """Gets the (guild id, session date, version) of every session with events not compacted yet, across every guild."""
+        return self._session.execute(select(PendingSession.guild_id, PendingSession.session_date, PendingSession.version)
+            .order_by(PendingSession.guild_id, PendingSession.session_date)).all()
+
+    def clear_pending_session(self, guild_id: int, session_date: datetime.date, version: int) -> bool:
+        """Marks a session compacted, unless events were added to it since version was read. Returns whether it was."""
+        cleared = self._session.execute(delete(PendingSession)
+            .where(PendingSession.guild_id == guild_id)
+            .where(PendingSession.session_date == session_date)
+            .where(PendingSession.version == version)).rowcount > 0
+        self._commit()
+        return cleared
+
+# -- Bulk import --
+
+    def get_or_create_sessions(self, dates: Iterable[datetime.date]) -> dict[datetime.date, int]:
+        """Gets the id of the session on each date, creating the missing ones in a single executemany."""
+        dates = list(set(dates))
+        if len(dates) == 0: return {}
+        self._session.execute(self._insert(Session.__table__).on_conflict_do_nothing(index_elements=[Session.guild_id, Session.date]),
+            [{"guild_id" : self.guild_id, "date" : date} for date in dates])
+        self._touch("sessions")
+        return dict(self._session.execute(select(Session.date, Session.id)
+            .where(Session.guild_id == self.guild_id)
+            .where(Session.date.in_(dates))).all())
+
+    def get_or_create_members(self, names: dict[str, str]) -> dict[str, int]:
+        """Gets the id of the member with each discord name, creating the missing ones under the given names in a single executemany."""
+        if len(names) == 0: return {}
+        self._session.execute(self._insert(Member.__table__).on_conflict_do_nothing(index_elements=[Member.guild_id, Member.discord_name]),
+            [{"guild_id" : self.guild_id, "discord_name" : discord_name, "name" : name, "in_rotation" : True, "is_admin" : False} for discord_name, name in names.items()])
+        self._touch("members")
+        return dict(self._session.execute(select(Member.discord_name, Member.id)
+            .where(Member.guild_id == self.guild_id)
+            .where(Member.discord_name.in_(list(names)))).all())
+
+    def merge_session_member_intervals(self, rows: list[dict]) -> None:
+        """Upserts (session_id, member_id, start, end) rows, widening existing intervals to cover them."""
+        self._bulk_upsert(SessionMember, rows, [SessionMember.session_id, SessionMember.member_id], widen=True)
+        self._touch("session_members")
+
+    def merge_session_game_intervals(self, rows: list[dict]) -> None:
+        """Upserts (session_id, game_id, start, end) rows, widening existing intervals to cover them."""
+        self._bulk_upsert(SessionGame, rows, [SessionGame.session_id, SessionGame.game_id], widen=True)
+        self._touch("session_games")
+
+    def add_member_games(self, rows: list[dict]) -> None:
+        """Inserts (member_id, game_id) rows that don't already exist."""
+        self._bulk_upsert(MemberGame, rows, [MemberGame.member_id, MemberGame.game_id])
+        self._touch("member_games")
+
+    def delete_session_timelines(self, session_ids: Iterable[int]) -> None:
+        if self._session.execute(delete(SessionTimeline).where(SessionTimeline.session_id.in_(list(session_ids)))).rowcount > 0: self._touch("session_timelines")
+
+    def _bulk_upsert(self, entity, rows: list[dict], index_elements: list, widen: bool = False) -> None:
+        """Inserts rows, which must not repeat a key, skipping the ones that conflict on index_elements or, if widen is set,
+        stretching the existing row's start and end to cover them.
+
+        On Postgres with psycopg2 the rows are COPYed into a temporary table and upserted with one INSERT ... SELECT,
+        otherwise they are upserted in a single executemany."""
+        if len(rows) == 0: return
+        table = entity.__table__
+        columns = list(rows[0])
+        source = rows
+        dialect = self._session.get_bind().dialect
+        if dialect.name == "postgresql" and dialect.driver == "psycopg2":
+            staging = self._copy_to_staging(table, columns, rows)
+            source = None
+            statement = self._insert(table).from_select(columns, select(*[staging.c[column] for column in columns]))
+        else:
+            statement = self._insert(table)
+
+        if widen:
+            least, greatest = (func.least, func.greatest) if dialect.name == "postgresql" else (func.min, func.max)
+            statement = statement.on_conflict_do_update(index_elements=index_elements, set_={
+                "start" : least(table.c.start, statement.excluded.start),
+                "end" : greatest(table.c.end, statement.excluded.end),
+            })
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+
+        if source is None: self._session.execute(statement)
+        else: self._session.execute(statement, source)
+
+    def _copy_to_staging(self, table: sqlalchemy.Table, columns: list[str], rows: list[dict]) -> sqlalchemy.TableClause:
+        """COPYs rows into an empty temporary table with the given columns of table, created on first use."""
+        staging = f"import_{table.name}"
+        names = ", ".join(f'"{column}"' for column in columns)
+        connection = self._session.connection()
+        connection.exec_driver_sql(f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} AS SELECT {names} FROM {table.name} WITH NO DATA")
+        connection.exec_driver_sql(f"TRUNCATE {staging}")
+
+        # unquoted empty fields are NULL in csv COPY
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([row[column] for column in columns] for row in rows)
+        buffer.seek(0)
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {staging} ({names}) FROM STDIN WITH (FORMAT csv)", buffer)
+        return sqlalchemy.table(staging, *[sqlalchemy.column(column) for column in columns])
+
+# -- Stats --
+
+    def get_member_stats(self, member_id: int) -> MemberStats:
+        """Gets the running totals for a member, which are all zero until they first attend."""
+        stats = self._session.get(MemberStats, member_id)
+        if stats is None: return MemberStats(member_id=member_id, sessions_attended=0, games_played=0, games_mastered=0)
+        return stats
+
+    def get_game_stats(self, game_id: int) -> GameStats:
+        """Gets the running totals for a game, which are all zero until it is first played."""
+        stats = self._session.get(GameStats, game_id)
+        if stats is None: return GameStats(game_id=game_id, sessions_played=0, members_played=0)
+        return stats
+
+    def get_all_member_stats(self) -> list[tuple[Member, Optional[MemberStats]]]:
+        return self._session.execute(select(Member, MemberStats)
+            .outerjoin(MemberStats, MemberStats.member_id == Member.id)
+            .where(Member.guild_id == self.guild_id)).all()
+
+    def get_all_game_stats(self) -> list[tuple[Game, Optional[GameStats]]]:
+        return self._session.execute(select(Game, GameStats)
+            .outerjoin(GameStats, GameStats.game_id == Game.id)
+            .where(Game.guild_id == self.guild_id)).all()
+
+    def rebuild_stats(self) -> None:
+        """Recomputes every member_stats and game_stats row from the full history, e.g. after a backfill."""
+        def count_by(column, *where):
+            return dict(self._session.execute(select(column, func.count()).where(*where).group_by(column)).all())
+
+        sessions_attended = count_by(SessionMember.member_id)
+        games_played = count_by(MemberGame.member_id)
+        games_mastered = count_by(Session.games_master_id, Session.games_master_id.is_not(None))
+        sessions_played = count_by(SessionGame.game_id)
+        members_played = count_by(MemberGame.game_id)
+
+        self._session.execute(delete(MemberStats))
+        self._session.execute(delete(GameStats))
+        member_ids = self._session.scalars(select(Member.id)).all()
+        game_ids = self._session.scalars(select(Game.id)).all()
+        if len(member_ids) > 0:
+            self._session.execute(sqlalchemy.insert(MemberStats), [{
+                "member_id" : id,
+                "sessions_attended" : sessions_attended.get(id, 0),
+                "games_played" : games_played.get(id, 0),
+                "games_mastered" : games_mastered.get(id, 0),
+            } for id in member_ids])
+        if len(game_ids) > 0:
+            self._session.execute(sqlalchemy.insert(GameStats), [{
+                "game_id" : id,
+                "sessions_played" : sessions_played.get(id, 0),
+                "members_played" : members_played.get(id, 0),
+            } for id in game_ids])
+        self._commit("member_stats", "game_stats")
+
+class AsyncDataBaseSession:
+    """Asyncio counterpart to DataBaseSession.
+
+    Every DataBaseSession method is available here as a coroutine with the same arguments. Each call runs on the
+    async engine, so awaiting a query yields the event loop rather than blocking it. Objects are not expired on
+    commit and must only have their eagerly loaded relationships accessed once returned."""
+
+    def __init__(self, autocommit: bool = True, guild_id: Optional[int] = None):
+        self._session = sqlalchemy.ext.asyncio.AsyncSession(get_async_engine(), expire_on_commit=False)
+        self._autocommit = autocommit
+        self.guild_id = guild_id
+
+    async def __aenter__(self):
+        await self._session.__aenter__()
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, exception_traceback):
+        await self._session.__aexit__(exception_type, exception_value, exception_traceback)
+
+    async def rollback(self) -> None:
+        """Rolls back after a failed write, so the session can be used again."""
+        self._session.info.pop("modified", None)
+        await self._session.rollback()
+
+    async def stream_scalars(self, statement, batch_size: int = 500):
+        """Streams the rows of a statement through a server-side cursor, holding at most batch_size of them in memory."""
+        result = await self._session.stream_scalars(statement.execution_options(yield_per=batch_size))
+        async for row in result:
+            yield row
+
+    async def run_sync(self, func, *args, **kwargs):
+        """Runs func(db, *args, **kwargs) against a DataBaseSession in a single hop onto the async engine."""
+        return await self._session.run_sync(lambda session: func(DataBaseSession(session, self._autocommit, self.guild_id), *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        method = getattr(DataBaseSession, name)
+        async def wrapped(*args, **kwargs):
+            return await self.run_sync(method, *args, **kwargs)
+        return wrapped
@@ -0,0 +1,75 @@
+import asyncio
+import dataclasses
+from typing import Iterable, Optional
+from data import AsyncDataBaseSession
+from model import Member
+
+from rich import print
+
+@dataclasses.dataclass(frozen=True)
+class DirectoryEntry:
+    id: int
+    is_admin: bool
+
+class MemberDirectory:
+    """In-memory map of (guild id, discord_name) to member, so the bot can resolve and authorise users without a query.
+
+    The bot keeps it in step with its own add and remove commands. Members added elsewhere, e.g. through
+    the API, are picked up by a full reload every ttl seconds. Only the members of guild_ids are loaded,
+    or of every guild if it is None."""
+
+    def __init__(self, ttl: float = 3600, guild_ids: Optional[Iterable[int]] = None):
+        self.ttl = ttl
+        self.guild_ids = None if guild_ids is None else list(guild_ids)
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[tuple[int, str], DirectoryEntry] = {}
+        self._task = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, guild_id: int, discord_name: str) -> Optional[DirectoryEntry]:
+        """Gets the entry for a tracked member, or None if the user is not a member of the guild."""
+        entry = self._entries.get((guild_id, discord_name))
+        if entry is None: self.misses += 1
+        else: self.hits += 1
+        return entry
+
+    def peek(self, guild_id: int, discord_name: str) -> Optional[DirectoryEntry]:
+        """Gets an entry like get, without counting a hit or miss, for bulk scans such as the sampler's."""
+        return self._entries.get((guild_id, discord_name))
+
+    def add(self, member: Member) -> None:
+        self._entries[(member.guild_id, member.discord_name)] = DirectoryEntry(member.id, member.is_admin)
+
+    def remove(self, guild_id: int, discord_name: str) -> None:
+        self._entries.pop((guild_id, discord_name), None)
+
+    async def load(self) -> None:
+        """Replaces every entry with the members currently in the database."""
+        async with AsyncDataBaseSession() as db:
+            members = await db.get_members_in_guilds(self.guild_ids)
+        self._entries = {(member.guild_id, member.discord_name): DirectoryEntry(member.id, member.is_admin) for member in members}
+
+    def start(self) -> None:
+        """Starts reloading the directory every ttl seconds, must be called from within the running event loop."""
+        if self._task is None: self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None: return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl)
+            try:
+                await self.load()
+            except Exception as e:
+                print(f"Failed to reload the member directory: {e}")
+            print(f"Member directory: {len(self)} members, {self.hits} hits, {self.misses} misses")
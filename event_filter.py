@@ -0,0 +1,85 @@
+import datetime
+import collections
+import dataclasses
+from typing import Optional, Callable
+import discord
+import utils
+import metrics
+from directory import MemberDirectory
+from model import ActivityEvent
+
+GAME_NAME_LENGTH = ActivityEvent.game_name.type.length
+
+@dataclasses.dataclass(frozen=True)
+class VoiceChange:
+    guild_id: int
+    member_id: int
+    joined: bool
+
+@dataclasses.dataclass(frozen=True)
+class PresenceChange:
+    guild_id: int
+    member_id: int
+    stopped: Optional[str]
+    started: Optional[str]
+
+def get_game_name(member: discord.Member) -> Optional[str]:
+    """Gets the name of the game the member is playing, ignoring custom statuses, music, streams etc. Names are cut
+    to the length activity_events can hold, so the start and stop of a long name still match."""
+    for activity in member.activities:
+        if activity.type == discord.ActivityType.playing: return activity.name[:GAME_NAME_LENGTH]
+    return None
+
+class EventFilter:
+    """Drops gateway events that cannot change any data, cheapest check first, before they reach the data layer.
+
+    Each stage counts the events it drops, so drops[stage] shows where guild chatter is being discarded. The same
+    counts are exported as metrics.EVENTS, by handler and outcome."""
+
+    STAGES = ("window", "activity_type", "member", "unchanged")
+
+    def __init__(self, directory: MemberDirectory, is_valid_session: Callable[[datetime.datetime], bool] = utils.is_valid_session_from_datetime):
+        self.directory = directory
+        self.is_valid_session = is_valid_session
+        self.drops = collections.Counter({stage: 0 for stage in self.STAGES})
+        self.passed = 0
+
+    def _drop(self, handler: str, stage: str) -> None:
+        self.drops[stage] += 1
+        metrics.EVENTS.labels(handler, stage).inc()
+
+    def _pass(self, handler: str) -> None:
+        self.passed += 1
+        metrics.EVENTS.labels(handler, "passed").inc()
+
+    def voice(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState, current_datetime: datetime.datetime) -> Optional[VoiceChange]:
+        """Gets the join or leave a voice state update represents, or None if it should be dropped."""
+        if not self.is_valid_session(current_datetime): return self._drop("voice", "window")
+
+        entry = self.directory.get(member.guild.id, member.name)
+        if entry is None: return self._drop("voice", "member")
+
+        if (before.channel is None) == (after.channel is None): return self._drop("voice", "unchanged")
+
+        self._pass("voice")
+        return VoiceChange(member.guild.id, entry.id, joined=after.channel is not None)
+
+    def presence(self, before: discord.Member, after: discord.Member, current_datetime: datetime.datetime) -> Optional[PresenceChange]:
+        """Gets the game a presence update stops and starts, or None if it should be dropped."""
+        if not self.is_valid_session(current_datetime): return self._drop("presence", "window")
+
+        stopped = get_game_name(before)
+        started = get_game_name(after)
+        if stopped is None and started is None: return self._drop("presence", "activity_type")
+
+        entry = self.directory.get(after.guild.id, after.name)
+        if entry is None: return self._drop("presence", "member")
+
+        if stopped == started: return self._drop("presence", "unchanged")
+
+        self._pass("presence")
+        return PresenceChange(after.guild.id, entry.id, stopped, started)
+
+    def summary(self) -> str:
+        drops = ", ".join(f"{stage}={self.drops[stage]}" for stage in self.STAGES)
+        return f"Event filter: {self.passed} passed, dropped {drops}"
@@ -0,0 +1,110 @@
+"""Bulk imports attendance recorded before the bot, from CSV or JSON.
+
+Each row is one member's attendance of a session, and optionally a game they played in it:
+
+    date,member,name,start,end,game
+    2019-03-01,tom,Tom,2019-03-01T18:30,2019-03-01T23:00,Factorio
+
+Only member (their discord name), start and end are required. date defaults to the session the start falls in, name to
+the discord name, and a row without a game is attendance only. A .csv file is read with a header row, a .jsonl or
+.ndjson file as one object per line, and a .json file as an array of objects.
+
+Rows are written in batches, one transaction each, with members, sessions and games resolved against in-memory
+maps so only new ones are queried for. Intervals are upserted, widening any already recorded, so importing the
+same file again changes nothing.
+"""
+import csv
+import json
+import time
+import datetime
+import itertools
+from typing import Callable, Iterable, Iterator, Optional
+from data import DataBaseSession
+from catalog import GameCatalog
+from session_calendar import calendar
+
+def read_rows(path: str) -> Iterator[dict]:
+    """Streams the rows of a .csv, .jsonl/.ndjson or .json file as dicts."""
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(file)
+        elif path.endswith((".jsonl", ".ndjson")):
+            for line in file:
+                if line.strip() != "": yield json.loads(line)
+        elif path.endswith(".json"):
+            yield from json.load(file)
+        else:
+            raise Exception(f"Can't import [{path}], expected a .csv, .jsonl, .ndjson or .json file.")
+
+def parse_datetime(value) -> datetime.datetime:
+    return value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(value)
+
+def parse_row(number: int, row: dict) -> tuple[datetime.date, str, Optional[str], datetime.datetime, datetime.datetime, Optional[str]]:
+    """Gets the (date, discord name, name, start, end, game) of a row, numbered from 1 for errors."""
+    try:
+        member = row["member"].strip()
+        start, end = parse_datetime(row["start"]), parse_datetime(row["end"])
+    except (KeyError, ValueError, AttributeError) as e:
+        raise Exception(f"Row [{number}] needs a member, start and end: {e}")
+    if end < start: raise Exception(f"Row [{number}] ends before it starts.")
+
+    date = row.get("date") or calendar.get_session_date(start)
+    if date is None: raise Exception(f"Row [{number}] has no date and doesn't start in a session window.")
+    if isinstance(date, str): date = datetime.date.fromisoformat(date)
+    return date, member, row.get("name") or None, start, end, row.get("game") or None
+
+class Importer:
+    """Writes imported rows to one guild in batches of batch_size, keeping the ids of every member, session and game
+    seen so far in memory."""
+
+    def __init__(self, db: DataBaseSession, batch_size: int = 5000, catalog: Optional[GameCatalog] = None):
+        self.db = db
+        self.batch_size = batch_size
+        self.catalog = catalog or GameCatalog()
+        self.members: dict[str, int] = {member.discord_name: member.id for member in db.get_members()}
+        self.sessions: dict[datetime.date, int] = {}
+        self.rows = 0
+
+    def run(self, rows: Iterable[dict], on_progress: Optional[Callable[[int, float], None]] = None) -> int:
+        """Imports every row, calling on_progress(rows, seconds) after each batch is committed. Returns the number of rows."""
+        started = time.perf_counter()
+        numbered = enumerate(rows, start=self.rows + 1)
+        while True:
+            batch = [parse_row(number, row) for number, row in itertools.islice(numbered, self.batch_size)]
+            if len(batch) == 0: return self.rows
+            self.write(batch)
+            self.rows += len(batch)
+            if on_progress is not None: on_progress(self.rows, time.perf_counter() - started)
+
+    def write(self, batch: list[tuple]) -> None:
+        """Writes a batch of parsed rows in one transaction."""
+        new_members = {}
+        for _, member, name, _, _, _ in batch:
+            if member in self.members: continue
+            if name is not None or member not in new_members: new_members[member] = name or member
+        self.members.update(self.db.get_or_create_members(new_members))
+        new_dates = {date for date, *_ in batch if date not in self.sessions}
+        self.sessions.update(self.db.get_or_create_sessions(new_dates))
+
+        # rows repeating a key are merged here, as one upsert can't touch the same row twice
+        session_members: dict[tuple[int, int], list] = {}
+        session_games: dict[tuple[int, int], list] = {}
+        member_games = set()
+        for date, member, _, start, end, game in batch:
+            session_id, member_id = self.sessions[date], self.members[member]
+            widen(session_members, (session_id, member_id), start, end)
+            if game is None: continue
+            game_id = self.catalog.get_or_create(self.db, game)
+            widen(session_games, (session_id, game_id), start, end)
+            member_games.add((member_id, game_id))
+
+        self.db.merge_session_member_intervals([{"session_id" : session_id, "member_id" : member_id, "start" : start, "end" : end} for (session_id, member_id), (start, end) in session_members.items()])
+        self.db.merge_session_game_intervals([{"session_id" : session_id, "game_id" : game_id, "start" : start, "end" : end} for (session_id, game_id), (start, end) in session_games.items()])
+        self.db.add_member_games([{"member_id" : member_id, "game_id" : game_id} for member_id, game_id in member_games])
+        self.db.delete_session_timelines({session_id for session_id, _ in session_members})
+        self.db.commit()
+
+def widen(intervals: dict[tuple[int, int], list], key: tuple[int, int], start: datetime.datetime, end: datetime.datetime) -> None:
+    interval = intervals.setdefault(key, [start, end])
+    if start < interval[0]: interval[0] = start
+    if end > interval[1]: interval[1] = end
@@ -0,0 +1,75 @@
+"""Maintenance commands, run once at deploy time or by hand.
+
+    python manage.py migrate
+    python manage.py rebuild-stats
+    python manage.py compact
+    python manage.py rebuild-sessions
+    python manage.py merge-games [--dry-run]
+    python manage.py import history.csv [--guild <id>] [--batch-size <rows>]
+"""
+import argparse
+import constants
+import data
+import migrate
+import importer
+import compaction
+
+from rich import print
+
+def rebuild_stats() -> None:
+    with data.DataBaseSession() as db:
+        db.rebuild_stats()
+    print("Rebuilt member and game stats.")
+
+def compact(rebuild: bool) -> None:
+    with data.DataBaseSession(autocommit=False) as db:
+        sessions = compaction.compact(db, rebuild)
+        db.commit()
+    print(f"Compacted activity events into {sessions} sessions.")
+
+def merge_games(dry_run: bool) -> None:
+    """Lists the games that share a normalized name or alias, and merges them unless dry_run is set."""
+    with data.DataBaseSession(autocommit=False) as db:
+        merges = db.get_duplicate_games()
+        names = db.get_game_names_by_id([id for keep_id, ids in merges.items() for id in [keep_id, *ids]])
+        for keep_id, ids in merges.items():
+            print(f"{names[keep_id]} [{keep_id}] <- " + ", ".join(f"{names[id]} [{id}]" for id in ids))
+        if dry_run: return
+        merged = db.merge_duplicate_games()
+        db.rebuild_stats()
+        db.commit()
+    print(f"Merged {merged} duplicated games.")
+    migrate.create_indexes(data.get_engine())
+
+def import_history(paths: list[str], guild_id: int, batch_size: int) -> None:
+    if len(paths) == 0: raise SystemExit("import needs at least one file.")
+    with data.DataBaseSession(autocommit=False, guild_id=guild_id) as db:
+        history = importer.Importer(db, batch_size)
+        for path in paths:
+            history.run(importer.read_rows(path), lambda rows, seconds: print(f"Imported {rows} rows ({rows / seconds if seconds > 0 else 0:.0f} rows/sec)."))
+        print(f"Imported {history.rows} rows: {len(history.members)} members, {len(history.sessions)} sessions, {len(history.catalog)} game names.")
+        db.rebuild_stats()
+        db.commit()
+    print("Rebuilt member and game stats.")
+
+COMMANDS = {
+    "migrate" : lambda arguments: migrate.upgrade(data.get_engine()),
+    "rebuild-stats" : lambda arguments: rebuild_stats(),
+    "compact" : lambda arguments: compact(rebuild=False),
+    "rebuild-sessions" : lambda arguments: compact(rebuild=True),
+    "merge-games" : lambda arguments: merge_games(arguments.dry_run),
+    "import" : lambda arguments: import_history(arguments.paths, arguments.guild, arguments.batch_size),
+}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="adibot maintenance commands")
+    parser.add_argument("command", choices=COMMANDS.keys())
+    parser.add_argument("paths", nargs="*", help="files to import")
+    parser.add_argument("--guild", type=int, default=constants.DISCORD_GUILD_ID, help="guild to import into")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows written per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="list the games merge-games would merge without merging them")
+    arguments = parser.parse_args()
+    COMMANDS[arguments.command](arguments)
+
+if __name__ == "__main__":
+    main()
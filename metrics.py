@@ -0,0 +1,103 @@
+"""Prometheus metrics shared by the API and the bot.
+
+The API serves them from /metrics and the bot from its own exporter on METRICS_PORT. With several API workers,
+PROMETHEUS_MULTIPROC_DIR must be set so each worker's metrics are kept in files there and /metrics reports the sum
+of every worker rather than whichever one answered. Statements are attributed to the request or bot event that ran
+them through a context variable, which follows the work into the async engine's greenlets and into the tasks it
+starts."""
+import os
+import time
+import contextlib
+import contextvars
+import dataclasses
+import sqlalchemy
+import sqlalchemy.pool
+import prometheus_client
+import prometheus_client.multiprocess
+from typing import Optional
+
+STATEMENT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21, 34, 55, 89)
+
+REQUEST_SECONDS = prometheus_client.Histogram("adibot_request_seconds", "Time taken to answer an API request.", ["method", "route", "status"])
+REQUEST_STATEMENTS = prometheus_client.Histogram("adibot_request_statements", "SQL statements executed by an API request.", ["method", "route"], buckets=STATEMENT_BUCKETS)
+REQUEST_STATEMENT_SECONDS = prometheus_client.Histogram("adibot_request_statement_seconds", "Time an API request spent executing SQL statements.", ["method", "route"])
+
+EVENT_SECONDS = prometheus_client.Histogram("adibot_event_seconds", "Time taken to handle a bot event.", ["handler"])
+EVENT_STATEMENTS = prometheus_client.Histogram("adibot_event_statements", "SQL statements executed handling a bot event.", ["handler"], buckets=STATEMENT_BUCKETS)
+EVENT_STATEMENT_SECONDS = prometheus_client.Histogram("adibot_event_statement_seconds", "Time a bot event spent executing SQL statements.", ["handler"])
+EVENTS = prometheus_client.Counter("adibot_events", "Bot events handled, by whether the event filter passed or dropped them.", ["handler", "outcome"])
+
+STATEMENTS = prometheus_client.Counter("adibot_statements", "SQL statements executed.", ["engine"])
+POOL_WAIT_SECONDS = prometheus_client.Histogram("adibot_pool_wait_seconds", "Time spent waiting to check a connection out of the pool.", ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+@dataclasses.dataclass
+class StatementScope:
+    count: int = 0
+    seconds: float = 0.0
+
+_scope: contextvars.ContextVar[Optional[StatementScope]] = contextvars.ContextVar("statement_scope", default=None)
+
+@contextlib.contextmanager
+def statement_scope():
+    """Collects the statements executed within the block, and any tasks it starts, into a StatementScope."""
+    scope = StatementScope()
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+@contextlib.contextmanager
+def track_event(handler: str):
+    """Records the latency and statements of a bot event handler."""
+    start = time.perf_counter()
+    with statement_scope() as scope:
+        try:
+            yield scope
+        finally:
+            EVENT_SECONDS.labels(handler).observe(time.perf_counter() - start)
+            EVENT_STATEMENTS.labels(handler).observe(scope.count)
+            EVENT_STATEMENT_SECONDS.labels(handler).observe(scope.seconds)
+
+def instrument(engine: sqlalchemy.Engine, name: str) -> None:
+    """Counts and times the statements an engine executes, adding them to the current StatementScope.
+    The start time is kept on the statement's execution context, so a statement that fails leaves nothing behind."""
+    @sqlalchemy.event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        context.statement_start = time.perf_counter()
+
+    @sqlalchemy.event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context.statement_start
+        STATEMENTS.labels(name).inc()
+        scope = _scope.get()
+        if scope is None: return
+        scope.count += 1
+        scope.seconds += seconds
+
+class TimedPool:
+    """Pool mixin timing how long each checkout waits for a connection, including opening a new one."""
+    engine_name = None
+
+    def connect(self):
+        with POOL_WAIT_SECONDS.labels(self.engine_name).time():
+            return super().connect()
+
+class TimedQueuePool(TimedPool, sqlalchemy.pool.QueuePool):
+    engine_name = "sync"
+
+class TimedAsyncQueuePool(TimedPool, sqlalchemy.pool.AsyncAdaptedQueuePool):
+    engine_name = "async"
+
+def serve(port: int) -> None:
+    """Serves the metrics from a background thread, for processes without a web server of their own."""
+    prometheus_client.start_http_server(port)
+
+def generate() -> bytes:
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ: return prometheus_client.generate_latest()
+    registry = prometheus_client.CollectorRegistry()
+    prometheus_client.multiprocess.MultiProcessCollector(registry)
+    return prometheus_client.generate_latest(registry)
+
+CONTENT_TYPE = prometheus_client.CONTENT_TYPE_LATEST
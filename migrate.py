@@ -0,0 +1,143 @@
+"""Brings an existing database up to date with model.py.
+
+`Base.metadata.create_all` only creates missing tables, so columns and indexes added to existing tables
+have to be created here. Rows that would violate the new unique indexes are merged first, except games, which are
+only merged by `python manage.py merge-games`.
+
+Rows recorded before guild_id was added are assigned to DISCORD_GUILD_ID, and the old unique indexes on
+discord_name, date and name alone are replaced by ones leading with guild_id.
+
+    python manage.py migrate
+"""
+import sqlalchemy
+import sqlalchemy.orm
+import constants
+from sqlalchemy import select, update, delete, func
+from typing import Optional
+from data import DataBaseSession
+from model import Base, Member, Session, Game, SessionMember, SessionGame, MemberGame, MemberStats, ActivityEvent
+import utils
+
+from rich import print
+
+# indexes that model.py no longer declares, by table
+OBSOLETE_INDEXES = {
+    "members" : ["ix_members_discord_name"],
+    "sessions" : ["ix_sessions_date"],
+    "games" : ["ix_games_name", "ix_games_guild_id_name"],
+    "activity_events" : ["ix_activity_events_session_date"],
+}
+
+def merge_duplicates(connection: sqlalchemy.Connection, entity, keys: list, references: list) -> int:
+    """Folds rows sharing the same keys into the oldest one, repointing any foreign keys at it."""
+    duplicates = connection.execute(select(*keys, func.min(entity.id))
+        .group_by(*keys)
+        .having(func.count() > 1)).all()
+
+    for *values, keep_id in duplicates:
+        matches = [key == value for key, value in zip(keys, values)]
+        ids = connection.scalars(select(entity.id).where(*matches).where(entity.id != keep_id)).all()
+        for reference in references:
+            connection.execute(update(reference.class_).where(reference.in_(ids)).values({reference.key: keep_id}))
+        connection.execute(delete(entity).where(entity.id.in_(ids)))
+    return len(duplicates)
+
+def merge_duplicate_intervals(connection: sqlalchemy.Connection, entity, keys: list) -> int:
+    """Folds interval rows sharing the same keys into the oldest one, spanning the earliest start to the latest end."""
+    duplicates = connection.execute(select(*keys, func.min(entity.id), func.min(entity.start), func.max(entity.end))
+        .group_by(*keys)
+        .having(func.count() > 1)).all()
+
+    for *values, keep_id, start, end in duplicates:
+        matches = [key == value for key, value in zip(keys, values)]
+        connection.execute(update(entity).where(entity.id == keep_id).values(start=start, end=end))
+        connection.execute(delete(entity).where(*matches).where(entity.id != keep_id))
+    return len(duplicates)
+
+def merge_duplicates_by_keys(connection: sqlalchemy.Connection, entity, keys: list) -> int:
+    """Deletes all but the oldest of the rows sharing the same keys."""
+    duplicates = connection.execute(select(*keys, func.min(entity.id))
+        .group_by(*keys)
+        .having(func.count() > 1)).all()
+
+    for *values, keep_id in duplicates:
+        matches = [key == value for key, value in zip(keys, values)]
+        connection.execute(delete(entity).where(*matches).where(entity.id != keep_id))
+    return len(duplicates)
+
+def add_missing_columns(connection: sqlalchemy.Connection) -> None:
+    """Adds columns declared in model.py that an existing table does not have yet."""
+    inspector = sqlalchemy.inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing: continue
+            definition = sqlalchemy.schema.CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(sqlalchemy.text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+            print(f"Added {table.name}.{column.name}.")
+
+def drop_obsolete_indexes(connection: sqlalchemy.Connection) -> None:
+    inspector = sqlalchemy.inspect(connection)
+    for table, names in OBSOLETE_INDEXES.items():
+        existing = {index["name"] for index in inspector.get_indexes(table)}
+        for name in names:
+            if name not in existing: continue
+            connection.execute(sqlalchemy.text(f"DROP INDEX {name}"))
+            print(f"Dropped {name}.")
+
+def assign_guild(connection: sqlalchemy.Connection, guild_id: int) -> None:
+    """Moves rows recorded before guild_id was added, which default to 0, into guild_id."""
+    if guild_id == 0: return
+    for entity in (Member, Session, Game, ActivityEvent):
+        assigned = connection.execute(update(entity).where(entity.guild_id == 0).values(guild_id=guild_id)).rowcount
+        if assigned > 0: print(f"Assigned {assigned} {entity.__tablename__} to guild {guild_id}.")
+
+def fill_normalized_names(connection: sqlalchemy.Connection) -> None:
+    """Sets Game.normalized_name on games created before it was added."""
+    games = connection.execute(select(Game.id, Game.name).where(Game.normalized_name.is_(None))).all()
+    if len(games) == 0: return
+    connection.execute(update(Game).where(Game.id == sqlalchemy.bindparam("game_id")).values(normalized_name=sqlalchemy.bindparam("normalized_name")),
+        [{"game_id" : id, "normalized_name" : utils.normalize_game_name(name)} for id, name in games])
+    print(f"Normalized the names of {len(games)} games.")
+
+def upgrade(engine: sqlalchemy.Engine, guild_id: Optional[int] = None) -> None:
+    """Creates any missing tables, columns and indexes, merging duplicate rows that would block unique indexes.
+    Rows without a guild are assigned to guild_id, DISCORD_GUILD_ID if not given."""
+    inspector = sqlalchemy.inspect(engine)
+    has_stats = inspector.has_table(MemberStats.__tablename__)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        add_missing_columns(connection)
+        drop_obsolete_indexes(connection)
+        assign_guild(connection, constants.DISCORD_GUILD_ID if guild_id is None else guild_id)
+        fill_normalized_names(connection)
+        merged = {
+            "sessions" : merge_duplicates(connection, Session, [Session.guild_id, Session.date], [SessionMember.session_id, SessionGame.session_id]),
+            "members" : merge_duplicates(connection, Member, [Member.guild_id, Member.discord_name], [SessionMember.member_id, MemberGame.member_id]),
+            "session_members" : merge_duplicate_intervals(connection, SessionMember, [SessionMember.session_id, SessionMember.member_id]),
+            "session_games" : merge_duplicate_intervals(connection, SessionGame, [SessionGame.session_id, SessionGame.game_id]),
+            "member_games" : merge_duplicates_by_keys(connection, MemberGame, [MemberGame.member_id, MemberGame.game_id]),
+        }
+        for table, count in merged.items():
+            if count > 0: print(f"Merged {count} duplicated {table}.")
+
+    if not has_stats:
+        with sqlalchemy.orm.Session(engine) as session:
+            db = DataBaseSession(session, autocommit=False)
+            db.rebuild_stats()
+            db.commit()
+
+    create_indexes(engine)
+
+def create_indexes(engine: sqlalchemy.Engine) -> None:
+    """Creates the indexes model.py declares, except the unique normalized name index on games while games still
+    share a normalized name. Those are only merged by `python manage.py merge-games`, once someone has reviewed them."""
+    with sqlalchemy.orm.Session(engine) as session:
+        duplicates = DataBaseSession(session).get_duplicate_games()
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name == "ix_games_guild_id_normalized_name" and len(duplicates) > 0:
+                    print(f"Skipped {index.name}: {sum(len(ids) for ids in duplicates.values())} games share a normalized name or alias with another, review them with `python manage.py merge-games --dry-run` and merge them with `python manage.py merge-games`.")
+                    continue
+                index.create(connection, checkfirst=True)
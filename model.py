@@ -1,14 +1,23 @@
 from datetime import datetime, date, timedelta
-from sqlalchemy import Column, Boolean, Integer, String, Float, Date, DateTime, ForeignKey
+from typing import Optional
+from sqlalchemy import Column, Boolean, Integer, BigInteger, String, Float, Date, DateTime, ForeignKey, Index, JSON
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 class Base(DeclarativeBase):
     pass
 
+# Members, sessions and games belong to the discord guild they were recorded in. Their indexes lead with guild_id,
+# so every guild's rows are a contiguous range and listing one guild never reads another's.
+
 class Member(Base):
     __tablename__ = "members"
+    __table_args__ = (
+        Index("ix_members_guild_id_discord_name", "guild_id", "discord_name", unique=True),
+        Index("ix_members_guild_id_id", "guild_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    guild_id: Mapped[int] = mapped_column(BigInteger, server_default="0")
     discord_name: Mapped[str] = mapped_column(String(32))
     name: Mapped[str] = mapped_column(String(32))
     in_rotation: Mapped[bool] = mapped_column(Boolean, default=True)
@@ -19,60 +28,156 @@ class Member(Base):
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        Index("ix_sessions_guild_id_date", "guild_id", "date", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    guild_id: Mapped[int] = mapped_column(BigInteger, server_default="0")
     date: Mapped[date] = mapped_column(Date)
+    games_master_id: Mapped[Optional[int]] = mapped_column(ForeignKey("members.id"), nullable=True)
 
+    games_master: Mapped[Optional["Member"]] = relationship()
     session_games: Mapped[list["SessionGame"]] = relationship(back_populates="session")
     session_members: Mapped[list["SessionMember"]] = relationship(back_populates="session")
 
 class Game(Base):
     __tablename__ = "games"
+    __table_args__ = (
+        Index("ix_games_guild_id_normalized_name", "guild_id", "normalized_name", unique=True),
+        Index("ix_games_guild_id_id", "guild_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    guild_id: Mapped[int] = mapped_column(BigInteger, server_default="0")
     name: Mapped[str] = mapped_column(String(32))
+    normalized_name: Mapped[Optional[str]] = mapped_column(String(64), nullable=True) # utils.normalize_game_name(name), filled in by migrate for older rows
 
     session_games: Mapped[list["SessionGame"]] = relationship(back_populates="game")
     member_games: Mapped[list["MemberGame"]] = relationship(back_populates="game")
 
+class GameAlias(Base):
+    """Another name a game goes by, e.g. an abbreviation, resolved to the game like its own name."""
+    __tablename__ = "game_aliases"
+    __table_args__ = (
+        Index("ix_game_aliases_guild_id_normalized_name", "guild_id", "normalized_name", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    guild_id: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    normalized_name: Mapped[str] = mapped_column(String(64))
+    game_id: Mapped[int] = mapped_column(ForeignKey("games.id"))
+
 class SessionMember(Base):
     __tablename__ = "session_members"
+    __table_args__ = (
+        Index("ix_session_members_session_id_member_id", "session_id", "member_id", unique=True),
+        Index("ix_session_members_member_id", "member_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     member_id: Mapped[int] = mapped_column(ForeignKey("members.id"))
     session_id: Mapped[int] = mapped_column(ForeignKey("sessions.id"))
     start: Mapped[datetime] = mapped_column(DateTime)
     end: Mapped[datetime] = mapped_column(DateTime)
+    duration: Mapped[Optional[float]] = mapped_column(Float, nullable=True) # seconds present, when compacted from activity_events
 
     member: Mapped["Member"] = relationship(back_populates="session_members")
     session: Mapped["Session"] = relationship(back_populates="session_members")
 
     def get_duration(self) -> timedelta:
+        if self.duration is not None: return timedelta(seconds=self.duration)
         if self.start is None or self.end is None: return None
         return self.end - self.start
 
 class SessionGame(Base):
     __tablename__ = "session_games"
+    __table_args__ = (
+        Index("ix_session_games_session_id_game_id", "session_id", "game_id", unique=True),
+        Index("ix_session_games_game_id", "game_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     game_id: Mapped[int] = mapped_column(ForeignKey("games.id"))
     session_id: Mapped[int] = mapped_column(ForeignKey("sessions.id"))
     start: Mapped[datetime] = mapped_column(DateTime)
     end: Mapped[datetime] = mapped_column(DateTime)
+    duration: Mapped[Optional[float]] = mapped_column(Float, nullable=True) # seconds played, when compacted from activity_events
 
     game: Mapped["Game"] = relationship(back_populates="session_games")
     session: Mapped["Session"] = relationship(back_populates="session_games")
 
     def get_duration(self) -> timedelta:
+        if self.duration is not None: return timedelta(seconds=self.duration)
         if self.start is None or self.end is None: return None
         return self.end - self.start
 
 class MemberGame(Base):
     __tablename__ = "member_games"
+    __table_args__ = (
+        Index("ix_member_games_member_id_game_id", "member_id", "game_id", unique=True),
+        Index("ix_member_games_game_id", "game_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     game_id: Mapped[int] = mapped_column(ForeignKey("games.id"))
     member_id: Mapped[int] = mapped_column(ForeignKey("members.id"))
 
     member: Mapped["Member"] = relationship(back_populates="member_games")
-    game: Mapped["Game"] = relationship(back_populates="member_games")
\ No newline at end of file
+    game: Mapped["Game"] = relationship(back_populates="member_games")
+
+class MemberStats(Base):
+    """Running totals for a member, kept up to date by the DataBaseSession write methods."""
+    __tablename__ = "member_stats"
+
+    member_id: Mapped[int] = mapped_column(ForeignKey("members.id"), primary_key=True)
+    sessions_attended: Mapped[int] = mapped_column(Integer, default=0)
+    games_played: Mapped[int] = mapped_column(Integer, default=0)
+    games_mastered: Mapped[int] = mapped_column(Integer, default=0)
+
+class GameStats(Base):
+    """Running totals for a game, kept up to date by the DataBaseSession write methods."""
+    __tablename__ = "game_stats"
+
+    game_id: Mapped[int] = mapped_column(ForeignKey("games.id"), primary_key=True)
+    sessions_played: Mapped[int] = mapped_column(Integer, default=0)
+    members_played: Mapped[int] = mapped_column(Integer, default=0)
+
+class SessionTimeline(Base):
+    """The encoded /sessions/{id}/timeline response of a closed session, so it is only computed once."""
+    __tablename__ = "session_timelines"
+
+    session_id: Mapped[int] = mapped_column(ForeignKey("sessions.id"), primary_key=True)
+    timeline: Mapped[dict] = mapped_column(JSON)
+
+class ActivityEvent(Base):
+    """A raw gateway event, appended by the bot and compacted into session_members and session_games."""
+    __tablename__ = "activity_events"
+    __table_args__ = (
+        Index("ix_activity_events_guild_id_session_date", "guild_id", "session_date"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    guild_id: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    member_id: Mapped[int] = mapped_column(ForeignKey("members.id"))
+    kind: Mapped[str] = mapped_column(String(16)) # join, leave, start or stop
+    game_name: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    session_date: Mapped[date] = mapped_column(Date)
+    timestamp: Mapped[datetime] = mapped_column(DateTime)
+
+class PendingSession(Base):
+    """A session with events that haven't been compacted yet, marked in the same transaction as the events.
+    version counts the writes since it was marked, so compaction only clears it if nothing was added meanwhile."""
+    __tablename__ = "pending_sessions"
+
+    guild_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    session_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=1)
+
+class DataVersion(Base):
+    """Counts the committed writes to each table, so readers can tell whether anything they cached has changed."""
+    __tablename__ = "data_versions"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+    modified: Mapped[datetime] = mapped_column(DateTime)
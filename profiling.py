@@ -0,0 +1,98 @@
+"""Opt-in cProfile profiles of single API requests and sampled bot events.
+
+Each profile is written to PROFILE_DIR as <time>-<name>.prof, in the pstats format that snakeviz, tuna or
+flameprof draw as a flame graph, next to <time>-<name>.json holding the total time, the time spent in each phase
+(db, serialization, discord) and the number of SQL statements. cProfile sees the whole thread, so work of other
+requests or events interleaved at an await is included, and only one profile runs at a time per process.
+"""
+import os
+import re
+import json
+import time
+import random
+import cProfile
+import datetime
+import contextlib
+import contextvars
+import collections
+import dataclasses
+import constants
+import metrics
+from typing import Optional
+
+@dataclasses.dataclass
+class Profile:
+    name: str
+    started: datetime.datetime
+    seconds: float = 0.0
+    statements: int = 0
+    phases: dict[str, float] = dataclasses.field(default_factory=lambda: collections.defaultdict(float))
+    path: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "name" : self.name,
+            "started" : self.started.isoformat(),
+            "seconds" : self.seconds,
+            "statements" : self.statements,
+            "phases" : dict(self.phases),
+        }
+
+    def get_server_timing(self) -> str:
+        """Gets the phases as a Server-Timing header, which browser dev tools show alongside the request."""
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in [*self.phases.items(), ("total", self.seconds)])
+
+_profile: contextvars.ContextVar[Optional[Profile]] = contextvars.ContextVar("profile", default=None)
+_running = False
+
+@contextlib.contextmanager
+def phase(name: str):
+    """Adds the time spent in the block to a phase of the profile running, if any."""
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.phases[name] += time.perf_counter() - start
+
+@contextlib.contextmanager
+def profile(name: str, scope: metrics.StatementScope, directory: Optional[str] = None):
+    """Profiles the block and writes the profile to directory, PROFILE_DIR if not given. The db phase is the time
+    the block adds to scope. Yields the Profile, or None if another profile is already running."""
+    global _running
+    if _running:
+        yield None
+        return
+
+    _running = True
+    current = Profile(name, datetime.datetime.now(datetime.timezone.utc))
+    token = _profile.set(current)
+    profiler = cProfile.Profile()
+    statements, seconds, start = scope.count, scope.seconds, time.perf_counter()
+    profiler.enable()
+    try:
+        yield current
+    finally:
+        profiler.disable()
+        current.seconds = time.perf_counter() - start
+        current.statements = scope.count - statements
+        current.phases["db"] += scope.seconds - seconds
+        _profile.reset(token)
+        _running = False
+        save(current, profiler, directory or constants.PROFILE_DIR)
+
+def sample(name: str, rate: float, scope: metrics.StatementScope):
+    """Profiles the block with probability rate, e.g. a sampled fraction of bot events."""
+    if rate <= 0 or random.random() >= rate: return contextlib.nullcontext()
+    return profile(name, scope)
+
+def save(current: Profile, profiler: cProfile.Profile, directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r"[^\w]+", "_", current.name).strip("_")
+    current.path = os.path.join(directory, f"{current.started:%Y%m%dT%H%M%S%f}-{slug}")
+    profiler.dump_stats(current.path + ".prof")
+    with open(current.path + ".json", "w") as file:
+        json.dump(current.to_dict(), file, indent=2)
@@ -0,0 +1,128 @@
+"""Samples who is in voice and what they are playing on a fixed interval, as an alternative to tracking each gateway event.
+
+Each tick scans the voice channels and member activities of every recorded guild that is in a session window,
+diffs them with the previous tick and appends the differences to activity_events in one INSERT. However much
+members churn between ticks, a tick writes at most one event per member and game they changed, and nothing
+at all if no one did. Compaction turns the events into sessions exactly as it does with per-event tracking.
+
+On startup the previous state is rebuilt from the session's events in the log, so the first tick closes
+intervals of anyone who left while the bot was down and opens them for anyone who joined.
+"""
+import asyncio
+import datetime
+import dataclasses
+from typing import Callable, Iterable, Optional
+import discord
+from data import AsyncDataBaseSession
+from directory import MemberDirectory
+from event_filter import get_game_name
+from model import ActivityEvent
+from session_calendar import calendar
+
+from rich import print
+
+@dataclasses.dataclass(frozen=True)
+class Snapshot:
+    """The members of a guild in voice, and the game each member playing one is playing, during a session."""
+    session_date: Optional[datetime.date] = None
+    voice: frozenset[int] = frozenset()
+    games: dict[int, str] = dataclasses.field(default_factory=dict)
+
+def get_open_snapshot(session_date: datetime.date, events: Iterable[ActivityEvent]) -> Snapshot:
+    """Replays a session's events into who was left in voice and playing what after the last of them."""
+    voice, games = set(), {}
+    for event in events:
+        if event.kind == "join": voice.add(event.member_id)
+        elif event.kind == "leave": voice.discard(event.member_id)
+        elif event.kind == "start": games[event.member_id] = event.game_name
+        elif event.kind == "stop" and games.get(event.member_id) == event.game_name: del games[event.member_id]
+    return Snapshot(session_date, frozenset(voice), games)
+
+def get_events(guild_id: int, before: Snapshot, after: Snapshot, timestamp: datetime.datetime) -> list[dict]:
+    """Gets the events that take a guild from one snapshot to the next. Intervals of a session that has ended are
+    closed under its own date."""
+    if before.session_date != after.session_date:
+        return get_events(guild_id, before, Snapshot(before.session_date), timestamp) + get_events(guild_id, Snapshot(after.session_date), after, timestamp)
+    if after.session_date is None: return []
+
+    def event(member_id: int, kind: str, game_name: Optional[str] = None) -> dict:
+        return {"guild_id" : guild_id, "member_id" : member_id, "kind" : kind, "game_name" : game_name, "session_date" : after.session_date, "timestamp" : timestamp}
+
+    events = [event(member_id, "leave") for member_id in sorted(before.voice - after.voice)]
+    events += [event(member_id, "stop", game) for member_id, game in sorted(before.games.items()) if after.games.get(member_id) != game]
+    events += [event(member_id, "join") for member_id in sorted(after.voice - before.voice)]
+    events += [event(member_id, "start", game) for member_id, game in sorted(after.games.items()) if before.games.get(member_id) != game]
+    return events
+
+def take_snapshot(guild: discord.Guild, directory: MemberDirectory, session_date: Optional[datetime.date]) -> Snapshot:
+    """Scans a guild's voice channels and its members' activities, ignoring anyone who isn't a member. Only the
+    users in voice or playing are looked up, with peek so the directory's hit rate still reflects real lookups."""
+    if session_date is None: return Snapshot()
+    voice = set()
+    for channel in guild.voice_channels:
+        for member in channel.members:
+            entry = directory.peek(guild.id, member.name)
+            if entry is not None: voice.add(entry.id)
+
+    games = {}
+    for member in guild.members:
+        game_name = get_game_name(member)
+        if game_name is None: continue
+        entry = directory.peek(guild.id, member.name)
+        if entry is not None: games[entry.id] = game_name
+    return Snapshot(session_date, frozenset(voice), games)
+
+class Sampler:
+    """Snapshots the guilds from get_guilds every interval seconds in the background."""
+
+    def __init__(self, directory: MemberDirectory, get_guilds: Callable[[], Iterable[discord.Guild]], interval: float = 60.0):
+        self.directory = directory
+        self.get_guilds = get_guilds
+        self.interval = interval
+        self.snapshots: dict[int, Snapshot] = {}
+        self._task = None
+
+    def start(self) -> None:
+        """Starts sampling, must be called from within the running event loop."""
+        if self._task is None: self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops sampling. Open intervals are left open, to be closed by the next process's first tick or compaction."""
+        if self._task is None: return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def restore(self, guild_id: int, timestamp: datetime.datetime) -> None:
+        """Rebuilds a guild's previous snapshot from the log of the session in progress, if there is one."""
+        session_date = calendar.get_session_date(timestamp)
+        if session_date is None: return
+        async with AsyncDataBaseSession(guild_id=guild_id) as db:
+            events = await db.get_activity_events(session_date)
+        self.snapshots[guild_id] = get_open_snapshot(session_date, events)
+
+    async def tick(self, timestamp: datetime.datetime) -> int:
+        """Snapshots every guild and appends the changes since the last tick in one INSERT. Returns the number of events."""
+        session_date = calendar.get_session_date(timestamp)
+        events, snapshots = [], {}
+        for guild in self.get_guilds():
+            if guild.id not in self.snapshots: await self.restore(guild.id, timestamp)
+            snapshots[guild.id] = take_snapshot(guild, self.directory, session_date)
+            events += get_events(guild.id, self.snapshots.get(guild.id, Snapshot()), snapshots[guild.id], timestamp)
+
+        if len(events) > 0:
+            async with AsyncDataBaseSession() as db:
+                await db.add_activity_events(events)
+        self.snapshots.update(snapshots)
+        return len(events)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick(calendar.now())
+            except Exception as e:
+                print(f"Failed to sample voice states: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,111 @@
+"""Response models for the API.
+
+Routes build plain dicts, which app.py validates against these models and serializes in pydantic's compiled
+encoder rather than walking them with fastapi's jsonable_encoder. Durations are serialized as seconds, as
+jsonable_encoder did.
+"""
+import datetime
+import functools
+import pydantic
+import profiling
+from typing import Optional
+
+class Response(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(ser_json_timedelta="float")
+
+@functools.cache
+def get_adapter(model) -> pydantic.TypeAdapter:
+    """Gets a cached TypeAdapter for a model or a type built from models, e.g. list[Session]."""
+    return pydantic.TypeAdapter(model)
+
+def to_json(model, content) -> bytes:
+    """Validates content, dicts or models, as model and serializes it."""
+    with profiling.phase("serialization"):
+        adapter = get_adapter(model)
+        return adapter.dump_json(adapter.validate_python(content))
+
+# -- sessions
+
+class Session(Response):
+    id: int
+    date: datetime.date
+
+class Named(Response):
+    id: int
+    name: str
+
+class Interval(Named):
+    start: datetime.datetime
+    end: datetime.datetime
+
+class SessionDetail(Session):
+    games_master: Optional[Named]
+    members: list[Interval]
+    games: list[Interval]
+
+class TimelineStep(Response):
+    time: datetime.datetime
+    members: int
+    game_ids: list[int]
+
+class SessionTimeline(Session):
+    peak_members: int
+    peak_time: Optional[datetime.datetime]
+    steps: list[TimelineStep]
+    games: list[Named]
+
+# -- members
+
+class Member(Response):
+    id: int
+    name: str
+    discord_name: str
+
+class Attendance(Session):
+    """A session a member attended or a game was played in."""
+    start: datetime.datetime
+    end: datetime.datetime
+    duration: Optional[datetime.timedelta]
+
+class MemberDetail(Member):
+    number_of_games: int
+    number_of_sessions: int
+    games: list[Named]
+    sessions: list[Attendance]
+
+# -- games
+
+class Game(Named):
+    pass
+
+class GameDetail(Game):
+    number_of_members: int
+    number_of_sessions: int
+    members: list[Named]
+    sessions: list[Attendance]
+
+# -- stats
+
+class MemberStats(Named):
+    sessions_attended: int
+    games_played: int
+    games_mastered: int
+    attendance_proportion: float
+
+class GameStats(Named):
+    sessions_played: int
+    members_played: int
+    session_proportion: float
+
+class Streak(Response):
+    id: int
+    current_streak: int
+    longest_streak: int
+    total: int
+    proportion: float
+
+class CoPlay(Response):
+    member_ids: list[int]
+    sessions: int
+    together: datetime.timedelta
+    same_game: datetime.timedelta
@@ -0,0 +1,158 @@
+"""When sessions happen, and which session a timestamp belongs to.
+
+A session is dated by the day its window starts, so 02:00 on a Saturday belongs to Friday's session. Timestamps
+are wall clock times in the calendar's timezone, as stored in the database, unless they are timezone-aware.
+"""
+import bisect
+import datetime
+import zoneinfo
+import dataclasses
+import numpy as np
+import constants
+from typing import Iterable, Optional
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+NO_SESSION = -1
+
+def get_minute_of_week(weekday: int, hour: int, minute: int = 0) -> int:
+    return weekday * MINUTES_PER_DAY + hour * 60 + minute
+
+@dataclasses.dataclass(frozen=True)
+class Window:
+    """A weekly session window from start to end, in minutes since Monday 00:00. The end is exclusive and may wrap past Sunday."""
+    start: int
+    end: int
+
+    @classmethod
+    def parse(cls, text: str) -> "Window":
+        """Parses a window such as "Fri 18:00-Sat 07:00"."""
+        def parse_minute(text: str) -> int:
+            weekday, time = text.split()
+            hour, minute = time.split(":")
+            return get_minute_of_week(WEEKDAYS.index(weekday.capitalize()[:3]), int(hour), int(minute))
+        start, end = text.split("-")
+        return cls(parse_minute(start), parse_minute(end))
+
+    @property
+    def length(self) -> int:
+        return (self.end - self.start) % MINUTES_PER_WEEK
+
+@dataclasses.dataclass(frozen=True)
+class ExtraSession:
+    """A one-off session outside the weekly windows, dated by the day it starts."""
+    start: datetime.datetime
+    end: datetime.datetime
+
+    @classmethod
+    def parse(cls, text: str) -> "ExtraSession":
+        """Parses a session such as "2025-12-27T18:00/2025-12-28T02:00"."""
+        start, end = text.split("/")
+        return cls(datetime.datetime.fromisoformat(start), datetime.datetime.fromisoformat(end))
+
+class SessionCalendar:
+    """Weekly session windows plus one-off extra sessions, in one timezone.
+
+    Every minute of the week is mapped up front to the number of days back to the start of the session it belongs
+    to, so finding the session for a timestamp is a table lookup, for one timestamp or a whole array at once."""
+
+    def __init__(self, windows: Iterable[Window], extra_sessions: Iterable[ExtraSession] = (), timezone: Optional[datetime.tzinfo] = None):
+        self.windows = list(windows)
+        self.extra_sessions = sorted(extra_sessions, key=lambda session: session.start)
+        self.timezone = timezone
+
+        self._days_back = np.full(MINUTES_PER_WEEK, NO_SESSION, dtype=np.int8)
+        for window in self.windows:
+            if window.length == 0: raise Exception(f"Session window [{window}] is empty.")
+            minutes = (window.start + np.arange(window.length)) % MINUTES_PER_WEEK
+            if (self._days_back[minutes] != NO_SESSION).any(): raise Exception(f"Session window [{window}] overlaps another window.")
+            self._days_back[minutes] = (minutes // MINUTES_PER_DAY - window.start // MINUTES_PER_DAY) % 7
+        self._days_back_list = self._days_back.tolist()
+
+        # days back from each weekday to the last weekday a window starts on
+        start_weekdays = {window.start // MINUTES_PER_DAY for window in self.windows}
+        self._days_since_start = [min(((weekday - start) % 7 for start in start_weekdays), default=None) for weekday in range(7)]
+
+        self._extra_starts = [session.start for session in self.extra_sessions]
+        self._extra_dates = [session.start.date() for session in self.extra_sessions]
+
+    @classmethod
+    def from_constants(cls) -> "SessionCalendar":
+        """Builds the calendar from SESSION_WINDOWS, EXTRA_SESSIONS and SESSION_TIMEZONE, falling back to the single
+        window from SESSION_START_WEEKDAY/TIME to the end of the SESSION_END_TIME hour on SESSION_END_WEEKDAY."""
+        if constants.SESSION_WINDOWS:
+            windows = [Window.parse(window) for window in constants.SESSION_WINDOWS.split(",")]
+        else:
+            windows = [Window(get_minute_of_week(constants.SESSION_START_WEEKDAY, constants.SESSION_START_TIME), get_minute_of_week(constants.SESSION_END_WEEKDAY, constants.SESSION_END_TIME + 1) % MINUTES_PER_WEEK)]
+        extra_sessions = [ExtraSession.parse(session) for session in constants.EXTRA_SESSIONS.split(",")] if constants.EXTRA_SESSIONS else []
+        timezone = zoneinfo.ZoneInfo(constants.SESSION_TIMEZONE) if constants.SESSION_TIMEZONE else None
+        return cls(windows, extra_sessions, timezone)
+
+    def now(self) -> datetime.datetime:
+        """Gets the current wall clock time in the calendar's timezone, as stored in the database."""
+        return datetime.datetime.now(self.timezone).replace(tzinfo=None)
+
+    def to_wall_clock(self, timestamp: datetime.datetime) -> datetime.datetime:
+        if timestamp.tzinfo is None: return timestamp
+        return timestamp.astimezone(self.timezone).replace(tzinfo=None)
+
+    def contains(self, weekday: int, hour: int, minute: int = 0) -> bool:
+        """Checks whether a minute of the week is inside one of the weekly windows."""
+        return self._days_back_list[get_minute_of_week(weekday, hour, minute)] != NO_SESSION
+
+    def get_session_date(self, timestamp: datetime.datetime) -> Optional[datetime.date]:
+        """Gets the date of the session a timestamp belongs to, or None if it is outside every session."""
+        timestamp = self.to_wall_clock(timestamp)
+        days_back = self._days_back_list[get_minute_of_week(timestamp.weekday(), timestamp.hour, timestamp.minute)]
+        if days_back != NO_SESSION: return timestamp.date() - datetime.timedelta(days=days_back)
+
+        # extra sessions are few and sorted, so only the latest one starting before the timestamp can contain it
+        index = bisect.bisect_right(self._extra_starts, timestamp) - 1
+        if index >= 0 and timestamp < self.extra_sessions[index].end: return self._extra_dates[index]
+        return None
+
+    def is_in_session(self, timestamp: datetime.datetime) -> bool:
+        return self.get_session_date(timestamp) is not None
+
+    def is_closed(self, session_date: datetime.date, timestamp: datetime.datetime) -> bool:
+        """Checks whether a session has finished by the given time, i.e. the time is past its date and outside its window."""
+        timestamp = self.to_wall_clock(timestamp)
+        return timestamp.date() > session_date and self.get_session_date(timestamp) != session_date
+
+    def get_current_or_last_session_date(self, date: datetime.date) -> Optional[datetime.date]:
+        """Gets the latest date on or before the given one that a session starts on."""
+        days_back = self._days_since_start[date.weekday()]
+        weekly = None if days_back is None else date - datetime.timedelta(days=days_back)
+        index = bisect.bisect_right(self._extra_dates, date) - 1
+        extra = self._extra_dates[index] if index >= 0 else None
+        if weekly is None or extra is None: return weekly or extra
+        return max(weekly, extra)
+
+    def classify(self, timestamps: np.ndarray, utc: bool = False) -> np.ndarray:
+        """Gets the session date of every timestamp in an array as datetime64[D], with NaT for those outside every session.
+
+        Timestamps are wall clock times in the calendar's timezone, or UTC if utc is set."""
+        timestamps = np.asarray(timestamps, dtype="datetime64[m]")
+        if utc: timestamps = self._utc_to_wall_clock(timestamps)
+        valid = ~np.isnat(timestamps)
+        days = timestamps.astype("datetime64[D]")
+        # 1970-01-01 was a Thursday
+        weekdays = (days.astype(np.int64) + 3) % 7
+        minutes = (timestamps - days).astype(np.int64)
+        days_back = np.where(valid, self._days_back[np.where(valid, weekdays * MINUTES_PER_DAY + minutes, 0)], NO_SESSION)
+        dates = np.where(days_back != NO_SESSION, days - days_back.astype("timedelta64[D]"), np.datetime64("NaT", "D"))
+
+        for session in self.extra_sessions:
+            inside = np.isnat(dates) & (timestamps >= np.datetime64(session.start, "m")) & (timestamps < np.datetime64(session.end, "m"))
+            dates[inside] = np.datetime64(session.start.date(), "D")
+        return dates
+
+    def _utc_to_wall_clock(self, timestamps: np.ndarray) -> np.ndarray:
+        # offsets only change on the hour, so look them up once per distinct hour rather than per timestamp
+        if self.timezone is None: return timestamps
+        hours, inverse = np.unique(timestamps.astype("datetime64[h]"), return_inverse=True)
+        offsets = np.array([0 if np.isnat(hour) else hour.astype(datetime.datetime).replace(tzinfo=datetime.timezone.utc).astimezone(self.timezone).utcoffset() // datetime.timedelta(minutes=1) for hour in hours], dtype=np.int64)
+        return timestamps + offsets[inverse].astype("timedelta64[m]")
+
+calendar = SessionCalendar.from_constants()
@@ -0,0 +1,116 @@
+import datetime
+import numpy as np
+from typing import Callable, Iterable, Optional
+from data import DataBaseSession
+
+def get_longest_streaks(attended: np.ndarray) -> np.ndarray:
+    """Gets the longest run of consecutive True values in each row of a 2D boolean matrix."""
+    rows, columns = attended.shape
+    padded = np.zeros((rows, columns + 2), dtype=np.int8)
+    padded[:, 1:-1] = attended
+    edges = np.diff(padded, axis=1)
+    # every run starts at a +1 edge and ends at the next -1 edge in the same row, and nonzero walks rows in order
+    start_rows, start_columns = np.nonzero(edges == 1)
+    _, end_columns = np.nonzero(edges == -1)
+    longest = np.zeros(rows, dtype=np.int64)
+    np.maximum.at(longest, start_rows, end_columns - start_columns)
+    return longest
+
+def get_current_streaks(attended: np.ndarray) -> np.ndarray:
+    """Gets the run of consecutive True values ending at the last column of each row of a 2D boolean matrix."""
+    rows, columns = attended.shape
+    if columns == 0: return np.zeros(rows, dtype=np.int64)
+    missed = ~attended[:, ::-1]
+    return np.where(missed.any(axis=1), np.argmax(missed, axis=1), columns).astype(np.int64)
+
+class StreakMatrix:
+    """Entities × sessions attendance bitmap, with columns in session date order, and per-entity streaks and totals.
+
+    Sessions can be appended one at a time, which updates the streaks in O(entities) rather than recomputing them."""
+
+    def __init__(self, ids: Iterable[int] = (), dates: Iterable[datetime.date] = (), attended: Optional[np.ndarray] = None):
+        self.ids = np.array(list(ids), dtype=np.int64)
+        self.dates = list(dates)
+        self._rows = {id: row for row, id in enumerate(self.ids.tolist())}
+        if attended is None: attended = np.zeros((len(self.ids), len(self.dates)), dtype=bool)
+        self._attended = np.zeros((len(self.ids), max(len(self.dates), 16)), dtype=bool)
+        self._attended[:, :len(self.dates)] = attended
+        self.totals = attended.sum(axis=1).astype(np.int64)
+        self.current_streaks = get_current_streaks(attended)
+        self.longest_streaks = get_longest_streaks(attended)
+
+    @classmethod
+    def from_pairs(cls, dates: list[datetime.date], pairs: list[tuple[datetime.date, int]]) -> "StreakMatrix":
+        """Builds the matrix from the ordered session dates and the (session date, entity id) attendance pairs."""
+        if len(pairs) == 0: return cls([], dates)
+        columns_by_date = {date: column for column, date in enumerate(dates)}
+        columns = np.fromiter((columns_by_date[date] for date, _ in pairs), dtype=np.int64, count=len(pairs))
+        ids, rows = np.unique(np.fromiter((id for _, id in pairs), dtype=np.int64, count=len(pairs)), return_inverse=True)
+        attended = np.zeros((len(ids), len(dates)), dtype=bool)
+        attended[rows, columns] = True
+        return cls(ids, dates, attended)
+
+    @property
+    def attended(self) -> np.ndarray:
+        return self._attended[:, :len(self.dates)]
+
+    @property
+    def proportions(self) -> np.ndarray:
+        if len(self.dates) == 0: return np.zeros(len(self.ids))
+        return self.totals / len(self.dates)
+
+    def _add_rows(self, ids: list[int]) -> None:
+        for id in ids: self._rows[id] = len(self._rows)
+        self.ids = np.concatenate([self.ids, np.array(ids, dtype=np.int64)])
+        self._attended = np.concatenate([self._attended, np.zeros((len(ids), self._attended.shape[1]), dtype=bool)])
+        zeros = np.zeros(len(ids), dtype=np.int64)
+        self.totals = np.concatenate([self.totals, zeros])
+        self.current_streaks = np.concatenate([self.current_streaks, zeros])
+        self.longest_streaks = np.concatenate([self.longest_streaks, zeros])
+
+    def append(self, date: datetime.date, ids: Iterable[int]) -> None:
+        """Adds a session after every existing one, attended by the entities in ids."""
+        if len(self.dates) > 0 and date <= self.dates[-1]: raise Exception(f"Cannot append session [{date}], it is not after the last session [{self.dates[-1]}].")
+        ids = list(ids)
+        new_ids = [id for id in dict.fromkeys(ids) if id not in self._rows]
+        if len(new_ids) > 0: self._add_rows(new_ids)
+
+        column = len(self.dates)
+        if column == self._attended.shape[1]:
+            self._attended = np.concatenate([self._attended, np.zeros_like(self._attended)], axis=1)
+        attended = np.zeros(len(self.ids), dtype=bool)
+        attended[[self._rows[id] for id in ids]] = True
+        self._attended[:, column] = attended
+        self.dates.append(date)
+
+        self.totals += attended
+        self.current_streaks = np.where(attended, self.current_streaks + 1, 0)
+        np.maximum(self.longest_streaks, self.current_streaks, out=self.longest_streaks)
+
+    def to_dicts(self) -> list[dict]:
+        proportions = self.proportions
+        return [{
+            "id" : id,
+            "current_streak" : int(self.current_streaks[row]),
+            "longest_streak" : int(self.longest_streaks[row]),
+            "total" : int(self.totals[row]),
+            "proportion" : float(proportions[row]),
+        } for row, id in enumerate(self.ids.tolist())]
+
+def refresh(db: DataBaseSession, matrix: Optional[StreakMatrix], get_pairs: Callable[..., list[tuple[datetime.date, int]]]) -> StreakMatrix:
+    """Brings a matrix up to date with the database, appending any sessions after its last one.
+
+    The last known session is re-read as it may still have been in progress when it was loaded. The matrix is
+    rebuilt from scratch if that session has changed or a session has been added before it."""
+    if matrix is None or len(matrix.dates) < 2 or db.get_number_of_sessions(until=matrix.dates[-1]) != len(matrix.dates):
+        return StreakMatrix.from_pairs(db.get_session_dates(), get_pairs())
+
+    last = matrix.dates[-1]
+    dates = db.get_session_dates(after=last)
+    ids_by_date = {date: set() for date in [last, *dates]}
+    for date, id in get_pairs(after=matrix.dates[-2]): ids_by_date[date].add(id)
+    if ids_by_date[last] != set(matrix.ids[matrix.attended[:, -1]].tolist()):
+        return StreakMatrix.from_pairs(db.get_session_dates(), get_pairs())
+
+    for date in dates: matrix.append(date, ids_by_date[date])
+    return matrix
@@ -0,0 +1,48 @@
+import sqlalchemy
+import data
+import compaction
+from catalog import GameCatalog
+from model import SessionGame
+
+def test_catalog_resolves_variants_to_one_game(db: data.DataBaseSession) -> None:
+    factorio = db.add_game("Factorio").id
+    catalog = GameCatalog()
+    assert catalog.get_or_create(db, "factorio") == factorio
+    assert catalog.get_or_create(db, "FACTORIO™") == factorio
+    assert (catalog.hits, catalog.misses) == (2, 0)
+
+    satisfactory = catalog.get_or_create(db, "Satisfactory")
+    assert catalog.get_or_create(db, "satisfactory") == satisfactory
+    assert (catalog.hits, catalog.misses) == (3, 1)
+    assert len(db.get_games()) == 2
+
+def test_aliases_resolve_to_their_game(db: data.DataBaseSession) -> None:
+    wow = db.add_game("World of Warcraft").id
+    assert db.add_game_alias(wow, "WoW")
+    assert not db.add_game_alias(wow, "wow")
+    assert not db.add_game_alias(wow, "World of Warcraft")
+    assert db.get_or_create_game("WOW").id == wow
+    assert GameCatalog().get_or_create(db, "wow") == wow
+
+def test_catalog_forgets_merged_games(db: data.DataBaseSession) -> None:
+    factorio = db.add_game("Factorio").id
+    catalog = GameCatalog()
+    catalog.refresh(db)
+    assert catalog.get_or_create(db, "Factorio") == factorio
+
+    # merged by another process, which only the data version of games tells this one about
+    satisfactory = db.add_game("Satisfactory").id
+    db.merge_games(satisfactory, [factorio])
+    catalog.refresh(db)
+    assert len(catalog) == 0
+    assert catalog.get_or_create(db, "Factorio") == satisfactory
+    catalog.refresh(db)
+    assert len(catalog) > 0
+
+def test_compaction_merges_names_of_the_same_game(db: data.DataBaseSession, event) -> None:
+    tom = db.add_member("Tom", "tom").id
+    db.add_activity_events([event(tom, "start", 0, "Factorio"), event(tom, "stop", 30, "FACTORIO")])
+    compaction.compact(db)
+    [game] = db.get_games()
+    [session_game] = db._session.scalars(sqlalchemy.select(SessionGame)).all()
+    assert (session_game.game_id, session_game.duration) == (game.id, 30 * 60)
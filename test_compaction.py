@@ -0,0 +1,78 @@
+import datetime
+import data
+import compaction
+from model import ActivityEvent
+
+def test_presence_duration_counts_overlaps_once(at) -> None:
+    presence = compaction.Presence(at(0), at(0))
+    presence.add(at(0), at(30))
+    presence.add(at(20), at(60))
+    presence.add(at(90), at(100))
+    assert presence.get_duration() == datetime.timedelta(minutes=70)
+    assert presence.end == at(100)
+
+def test_get_presences_closes_open_intervals_at_the_last_event(at, event) -> None:
+    events = [ActivityEvent(**event(1, "join", 0)),
+              ActivityEvent(**event(1, "start", 10, "Factorio")),
+              ActivityEvent(**event(1, "stop", 40, "Factorio")),
+              ActivityEvent(**event(2, "start", 30, "Factorio")),
+              ActivityEvent(**event(2, "leave", 50))]
+    members, games = compaction.get_presences(events)
+    assert members[1].get_duration() == datetime.timedelta(minutes=50)
+    assert members[2].get_duration() == datetime.timedelta(minutes=20)
+    assert (games["Factorio"].start, games["Factorio"].end) == (at(10), at(50))
+    assert games["Factorio"].get_duration() == datetime.timedelta(minutes=40)
+
+def test_compact_writes_sessions_and_is_idempotent(db: data.DataBaseSession, at, session_date: datetime.date, event) -> None:
+    tom = db.add_member("Tom", "tom").id
+    jack = db.add_member("Jack", "jack").id
+    db.add_activity_events([event(tom, "join", 0), event(tom, "start", 10, "Factorio"), event(jack, "start", 20, "Factorio")])
+    assert compaction.compact(db) == 1
+    assert compaction.compact(db) == 0
+
+    db.add_activity_events([event(tom, "stop", 60, "Factorio"), event(tom, "leave", 90), event(jack, "stop", 30, "Factorio")])
+    assert compaction.compact(db) == 1
+    assert compaction.compact(db, rebuild=True) == 1
+
+    session = db.get_session_by_date(session_date)
+    session_members = {session_member.member_id: session_member for session_member in db.get_session_members_for_session(session.id)}
+    assert (session_members[tom].start, session_members[tom].end) == (at(0), at(90))
+    assert session_members[tom].get_duration() == datetime.timedelta(minutes=90)
+    assert session_members[jack].get_duration() == datetime.timedelta(minutes=10)
+    (session_game,) = db.get_session_games_for_session(session.id)
+    assert session_game.get_duration() == datetime.timedelta(minutes=50)
+
+    # compacting the same session again must not count it twice
+    assert db.get_member_stats(tom).sessions_attended == 1
+    assert db.get_game_stats(session_game.game_id).sessions_played == 1
+    assert db.get_game_stats(session_game.game_id).members_played == 2
+    assert len(db.get_member_games_for_game(session_game.game_id)) == 2
+
+def test_compact_drops_the_stored_timeline(db: data.DataBaseSession, session_date: datetime.date, event) -> None:
+    tom = db.add_member("Tom", "tom").id
+    session = db.get_or_create_session(session_date)
+    db.set_session_timeline(session.id, {"peak_members" : 0})
+    db.add_activity_events([event(tom, "join", 0), event(tom, "leave", 30)])
+    compaction.compact(db)
+    assert db.get_session_timeline(session.id) is None
+
+def test_compact_includes_events_committed_out_of_id_order(db: data.DataBaseSession, session_date: datetime.date, event) -> None:
+    tom = db.add_member("Tom", "tom").id
+    jack = db.add_member("Jack", "jack").id
+    # a writer in another process allocated id 5 first but committed after id 10 had been compacted
+    db.add_activity_events([{"id" : 10, **event(tom, "join", 0)}])
+    assert compaction.compact(db) == 1
+    db.add_activity_events([{"id" : 5, **event(jack, "join", 10)}])
+    assert compaction.compact(db) == 1
+
+    session = db.get_session_by_date(session_date)
+    assert {session_member.member_id for session_member in db.get_session_members_for_session(session.id)} == {tom, jack}
+    assert db.get_pending_sessions() == []
+
+def test_pending_session_is_kept_if_marked_again_while_compacting(db: data.DataBaseSession, event) -> None:
+    tom = db.add_member("Tom", "tom").id
+    db.add_activity_events([event(tom, "join", 0)])
+    ((guild_id, session_date, version),) = db.get_pending_sessions()
+    db.add_activity_events([event(tom, "leave", 30)])
+    assert not db.clear_pending_session(guild_id, session_date, version)
+    assert db.clear_pending_session(guild_id, session_date, version + 1)
@@ -0,0 +1,67 @@
+import random
+import datetime
+import fastapi.testclient
+import data
+import app
+import coplay
+
+def get_overlaps_naively(intervals) -> dict:
+    overlaps = {}
+    for i, (start, end, id) in enumerate(intervals):
+        for other_start, other_end, other in intervals[i + 1:]:
+            overlap = min(end, other_end) - max(start, other_start)
+            if id == other or overlap <= datetime.timedelta(): continue
+            pair = (min(id, other), max(id, other))
+            overlaps[pair] = overlaps.get(pair, datetime.timedelta()) + overlap
+    return overlaps
+
+def test_sweep_matches_comparing_every_pair(at) -> None:
+    rng = random.Random(0)
+    for _ in range(20):
+        intervals = []
+        for id in range(30):
+            start = rng.randrange(0, 600)
+            intervals.append((at(start), at(start + rng.randrange(0, 240)), id))
+        assert dict(coplay.get_overlaps(intervals)) == get_overlaps_naively(intervals)
+
+def test_touching_intervals_do_not_overlap(at) -> None:
+    assert dict(coplay.get_overlaps([(at(0), at(10), 1), (at(10), at(20), 2)])) == {}
+
+def test_same_game_time_is_clipped_to_the_game(at) -> None:
+    members = [(at(0), at(120), 1), (at(30), at(150), 2), (at(0), at(150), 3)]
+    games = [(at(60), at(100), 7)]
+    session = coplay.get_session_coplay(members, games, {7: {1, 2}})
+    assert session.together[(1, 2)] == datetime.timedelta(minutes=90)
+    assert session.same_game == {(1, 2): datetime.timedelta(minutes=40)}
+
+def test_refresh_only_recomputes_new_sessions(db: data.DataBaseSession) -> None:
+    tom = db.add_member("Tom", "tom").id
+    jack = db.add_member("Jack", "jack").id
+    factorio = db.get_or_create_game("Factorio").id
+    for member_id in (tom, jack): db.get_or_add_member_game(member_id, factorio)
+
+    def play(date: datetime.date, jack_end: int) -> None:
+        session = db.get_or_create_session(date)
+        start = datetime.datetime.combine(date, datetime.time(18))
+        db.add_or_update_session_member(session.id, tom, start, start + datetime.timedelta(minutes=120))
+        db.add_or_update_session_member(session.id, jack, start, start + datetime.timedelta(minutes=jack_end))
+        db.add_or_update_session_game(session.id, factorio, start, start + datetime.timedelta(minutes=60))
+
+    play(datetime.date(2025, 10, 24), 30)
+    graph = coplay.refresh(db, None)
+    first = graph.sessions[datetime.date(2025, 10, 24)]
+
+    play(datetime.date(2025, 10, 24), 90)
+    play(datetime.date(2025, 10, 31), 60)
+    graph = coplay.refresh(db, graph)
+    assert graph.sessions[datetime.date(2025, 10, 24)] is not first
+    assert graph.to_dicts() == coplay.refresh(db, None).to_dicts() == [{
+        "member_ids" : [tom, jack],
+        "sessions" : 2,
+        "together" : datetime.timedelta(minutes=150),
+        "same_game" : datetime.timedelta(minutes=120),
+    }]
+
+    client = fastapi.testclient.TestClient(app.app)
+    app.response_cache.clear()
+    assert client.get("/api/v1/stats/coplay", params={"member" : jack}).json() == [{"member_ids" : [tom, jack], "sessions" : 2, "together" : 9000.0, "same_game" : 7200.0}]
@@ -0,0 +1,235 @@
+import json
+import pytest
+import datetime
+import contextlib
+import sqlalchemy
+import fastapi.testclient
+import data
+import constants
+import app
+from model import Base
+
+@pytest.fixture
+def client():
+    return fastapi.testclient.TestClient(app.app)
+
+@contextlib.contextmanager
+def count_statements():
+    statements = []
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    engines = [data.get_engine(), data.get_async_engine().sync_engine]
+    for engine in engines: sqlalchemy.event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        yield statements
+    finally:
+        for engine in engines: sqlalchemy.event.remove(engine, "before_cursor_execute", on_execute)
+
+def populate(db: data.DataBaseSession, number_of_sessions: int, number_of_members: int, number_of_games: int) -> None:
+    members = [db.add_member(f"member-{i}", f"discord-{i}") for i in range(number_of_members)]
+    games = [db.add_game(f"game-{i}") for i in range(number_of_games)]
+    for member in members:
+        for game in games:
+            db.add_member_game(member.id, game.id)
+    for i in range(number_of_sessions):
+        date = datetime.date(2025, 1, 3) + datetime.timedelta(weeks=i)
+        start = datetime.datetime.combine(date, datetime.time(18))
+        session = db.add_session(date)
+        for member in members:
+            db.add_session_member(member.id, session.id, start, start + datetime.timedelta(hours=4))
+        for game in games:
+            db.add_session_game(session.id, game.id, start, start + datetime.timedelta(hours=2))
+
+def count_statements_for(client: fastapi.testclient.TestClient, url: str) -> int:
+    app.response_cache.clear()
+    with count_statements() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+@pytest.mark.parametrize("url", ["/api/v1/sessions/1", "/api/v1/members/1", "/api/v1/games/1"])
+def test_detail_statement_count_is_independent_of_data_size(db: data.DataBaseSession, client: fastapi.testclient.TestClient, url: str) -> None:
+    populate(db, number_of_sessions=1, number_of_members=1, number_of_games=1)
+    small = count_statements_for(client, url)
+
+    Base.metadata.drop_all(data.get_engine())
+    Base.metadata.create_all(data.get_engine())
+    populate(db, number_of_sessions=20, number_of_members=8, number_of_games=5)
+    large = count_statements_for(client, url)
+
+    assert small == large
+    assert large <= 5
+
+def test_stats_are_maintained_by_writes(db: data.DataBaseSession, client: fastapi.testclient.TestClient) -> None:
+    populate(db, number_of_sessions=3, number_of_members=2, number_of_games=2)
+    session = db.get_or_create_session(datetime.date(2025, 10, 24))
+    start = datetime.datetime(2025, 10, 24, 18)
+    db.add_or_update_session_member(session.id, 1, start=start)
+    db.add_or_update_session_member(session.id, 1, end=start + datetime.timedelta(hours=2))
+    db.add_or_update_session_game(session.id, 1, start=start)
+    db.get_or_add_member_game(1, 1)
+    db.set_session_games_master(session.id, 1)
+
+    expected = client.get("/api/v1/members/1/stats").json()
+    assert expected == {
+        "id" : 1,
+        "name" : "member-0",
+        "sessions_attended" : 4,
+        "games_played" : 2,
+        "games_mastered" : 1,
+        "attendance_proportion" : 1.0,
+    }
+    assert client.get("/api/v1/games/1/stats").json()["sessions_played"] == 4
+    assert client.get("/api/v1/games/2/stats").json()["session_proportion"] == 0.75
+
+    db.rebuild_stats()
+    assert client.get("/api/v1/members/1/stats").json() == expected
+    assert client.get("/api/v1/stats/members").json()[0] == expected
+
+def test_removing_a_member_removes_their_history(db: data.DataBaseSession, client: fastapi.testclient.TestClient) -> None:
+    populate(db, number_of_sessions=3, number_of_members=2, number_of_games=2)
+    db.set_session_games_master(1, 1)
+    db.set_session_timeline(1, {"steps" : []})
+    app.response_cache.clear()
+
+    assert db.remove_member_by_id(1)
+    assert db.get_member_by_id(1) is None
+    assert [session_member.member_id for session_member in db.get_session_members_for_session(1)] == [2]
+    assert [member_game.member_id for member_game in db.get_member_games_for_game(1)] == [2]
+    assert db.get_session_by_id(1).games_master_id is None
+    assert db.get_session_timeline(1) is None
+    assert db.get_game_stats(1).members_played == 1
+    assert client.get("/api/v1/members/1").json() is None
+    assert client.get("/api/v1/games/1/stats").json()["members_played"] == 1
+
+    expected = [(game.id, stats.members_played) for game, stats in db.get_all_game_stats()]
+    db.rebuild_stats()
+    assert [(game.id, stats.members_played) for game, stats in db.get_all_game_stats()] == expected
+    assert not db.remove_member_by_id(1)
+
+def test_cached_responses_are_invalidated_by_writes(db: data.DataBaseSession, client: fastapi.testclient.TestClient) -> None:
+    populate(db, number_of_sessions=2, number_of_members=2, number_of_games=1)
+    app.response_cache.clear()
+
+    first = client.get("/api/v1/members")
+    etag = first.headers["etag"]
+    assert "last-modified" in first.headers
+
+    with count_statements() as statements:
+        second = client.get("/api/v1/members")
+    assert second.json() == first.json()
+    assert len(statements) == 1
+
+    assert client.get("/api/v1/members", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/v1/members", headers={"If-Modified-Since": first.headers["last-modified"]}).status_code == 304
+
+    db.add_session(datetime.date(2030, 1, 4))
+    assert client.get("/api/v1/members", headers={"If-None-Match": etag}).status_code == 304
+
+    db.add_member("New", "new")
+    third = client.get("/api/v1/members", headers={"If-None-Match": etag})
+    assert third.status_code == 200
+    assert third.headers["etag"] != etag
+    assert len(third.json()) == 3
+
+def get_pages(client: fastapi.testclient.TestClient, url: str) -> list[list[dict]]:
+    pages = []
+    while url is not None:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append(response.json())
+        url = response.links.get("next", {}).get("url")
+    return pages
+
+def test_list_endpoints_are_paged_by_keyset(db: data.DataBaseSession, client: fastapi.testclient.TestClient) -> None:
+    populate(db, number_of_sessions=7, number_of_members=5, number_of_games=1)
+    app.response_cache.clear()
+
+    pages = get_pages(client, "/api/v1/members?limit=2")
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [member["id"] for page in pages for member in page] == [1, 2, 3, 4, 5]
+
+    # sessions added out of date order are still paged by date
+    db.add_session(datetime.date(2024, 12, 27))
+    dates = [session["date"] for page in get_pages(client, "/api/v1/sessions?limit=3") for session in page]
+    assert dates == sorted(dates)
+    assert len(dates) == 8
+
+    filtered = client.get("/api/v1/members/1/sessions", params={"from" : "2025-01-10", "to" : "2025-01-24", "limit" : 2})
+    assert [session["date"] for session in filtered.json()] == ["2025-01-10", "2025-01-17"]
+    assert [session["date"] for session in client.get(filtered.links["next"]["url"]).json()] == ["2025-01-24"]
+
+    assert client.get("/api/v1/members", params={"limit" : constants.MAX_PAGE_SIZE + 1}).status_code == 422
+
+def test_detail_history_is_limited(db: data.DataBaseSession, client: fastapi.testclient.TestClient) -> None:
+    populate(db, number_of_sessions=4, number_of_members=1, number_of_games=1)
+    app.response_cache.clear()
+
+    member = client.get("/api/v1/members/1", params={"sessions_limit" : 2}).json()
+    assert len(member["sessions"]) == 2
+    assert member["number_of_sessions"] == 4
+
+    game = client.get("/api/v1/games/1", params={"sessions_limit" : 3}).json()
+    assert len(game["sessions"]) == 3
+    assert game["number_of_sessions"] == 4
+
+def test_list_endpoints_stream_ndjson(db: data.DataBaseSession, client: fastapi.testclient.TestClient) -> None:
+    populate(db, number_of_sessions=3, number_of_members=constants.PAGE_SIZE + 1, number_of_games=1)
+    app.response_cache.clear()
+
+    response = client.get("/api/v1/members", params={"format" : "ndjson"})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "etag" in response.headers
+    members = [json.loads(line) for line in response.text.splitlines()]
+    assert len(members) == constants.PAGE_SIZE + 1
+    assert members[0] == {"id" : 1, "name" : "member-0", "discord_name" : "discord-0"}
+
+    sessions = client.get("/api/v1/games/1/sessions", params={"format" : "ndjson", "after" : 1}).text.splitlines()
+    assert [json.loads(line)["id"] for line in sessions] == [2, 3]
+
+def test_guilds_are_kept_apart(db: data.DataBaseSession, client: fastapi.testclient.TestClient) -> None:
+    date = datetime.date(2025, 10, 24)
+    other = db.for_guild(2)
+    tom = db.add_member("Tom", "tom")
+    other_tom = other.add_member("Tom", "tom")
+    assert db.get_or_create_session(date).id != other.get_or_create_session(date).id
+    assert db.get_or_create_game("Factorio").id != other.get_or_create_game("Factorio").id
+    app.response_cache.clear()
+
+    assert [member["id"] for member in client.get("/api/v1/members").json()] == [tom.id]
+    assert [member["id"] for member in client.get("/api/v1/members", params={"guild" : 2}).json()] == [other_tom.id]
+    assert len(client.get("/api/v1/sessions", params={"guild" : 2}).json()) == 1
+    assert client.get(f"/api/v1/members/{other_tom.id}").json() is None
+    assert client.get("/api/v1/members", params={"guild" : 3}).json() == []
+
+@pytest.mark.parametrize("format", ["json", "ndjson"])
+def test_session_histories_are_kept_apart(db: data.DataBaseSession, client: fastapi.testclient.TestClient, format: str) -> None:
+    date = datetime.date(2025, 10, 24)
+    start = datetime.datetime(2025, 10, 24, 18)
+    other = db.for_guild(2)
+    member = other.add_member("Tom", "tom")
+    game = other.get_or_create_game("Factorio")
+    session = other.get_or_create_session(date)
+    other.add_session_member(member.id, session.id, start, start + datetime.timedelta(hours=4))
+    other.add_session_game(session.id, game.id, start, start + datetime.timedelta(hours=2))
+    app.response_cache.clear()
+
+    def get_ids(url: str, **params) -> list[int]:
+        response = client.get(url, params={"format" : format, **params})
+        assert response.status_code == 200
+        if format == "ndjson": return [json.loads(line)["id"] for line in response.text.splitlines()]
+        return [row["id"] for row in response.json()]
+
+    for url in [f"/api/v1/members/{member.id}/sessions", f"/api/v1/games/{game.id}/sessions"]:
+        assert get_ids(url) == []
+        assert get_ids(url, guild=2) == [session.id]
+
+def test_pool_options_split_the_connection_budget() -> None:
+    assert data.get_pool_options(None, 4) == ({}, {})
+    pool, async_pool = data.get_pool_options(40, 4)
+    assert pool == {"pool_size" : 1, "max_overflow" : 0}
+    assert async_pool == {"pool_size" : 4, "max_overflow" : 5}
+    assert 4 * (pool["pool_size"] + pool["max_overflow"] + async_pool["pool_size"] + async_pool["max_overflow"]) <= 40
+    assert data.get_pool_options(2, 1) == ({"pool_size" : 1, "max_overflow" : 0}, {"pool_size" : 1, "max_overflow" : 0})
+    with pytest.raises(Exception):
+        data.get_pool_options(6, 4)
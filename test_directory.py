@@ -0,0 +1,40 @@
+import asyncio
+import data
+from directory import MemberDirectory
+
+def test_directory_resolves_members_and_counts_lookups(db: data.DataBaseSession) -> None:
+    admin = db.add_member("Tom", "tom", is_admin=True)
+    db.add_member("Jack", "jack")
+
+    directory = MemberDirectory()
+    asyncio.run(directory.load())
+
+    assert directory.get(db.guild_id, "tom").id == admin.id
+    assert directory.get(db.guild_id, "tom").is_admin
+    assert not directory.get(db.guild_id, "jack").is_admin
+    assert directory.get(db.guild_id, "stranger") is None
+    assert (directory.hits, directory.misses) == (3, 1)
+
+def test_directory_is_updated_in_place(db: data.DataBaseSession) -> None:
+    directory = MemberDirectory()
+    asyncio.run(directory.load())
+    assert directory.get(db.guild_id, "tom") is None
+
+    member = db.add_member("Tom", "tom")
+    directory.add(member)
+    assert directory.get(db.guild_id, "tom").id == member.id
+
+    directory.remove(db.guild_id, "tom")
+    assert directory.get(db.guild_id, "tom") is None
+
+def test_directory_keeps_guilds_apart(db: data.DataBaseSession) -> None:
+    tom = db.add_member("Tom", "tom")
+    other_tom = db.for_guild(2).add_member("Tom", "tom")
+    db.for_guild(3).add_member("Jack", "jack")
+
+    directory = MemberDirectory(guild_ids=[db.guild_id, 2])
+    asyncio.run(directory.load())
+
+    assert directory.get(db.guild_id, "tom").id == tom.id
+    assert directory.get(2, "tom").id == other_tom.id
+    assert directory.get(3, "jack") is None
@@ -0,0 +1,56 @@
+import pytest
+import datetime
+import discord
+from types import SimpleNamespace
+from directory import MemberDirectory, DirectoryEntry
+from event_filter import EventFilter, PresenceChange, VoiceChange
+
+IN_SESSION = datetime.datetime(2025, 10, 24, 20)
+OUT_OF_SESSION = datetime.datetime(2025, 10, 22, 20)
+GUILD = 7
+OTHER_GUILD = 8
+
+@pytest.fixture
+def event_filter() -> EventFilter:
+    directory = MemberDirectory()
+    directory._entries = {(GUILD, "tom"): DirectoryEntry(1, False)}
+    return EventFilter(directory)
+
+def member(name: str, *activities: tuple[discord.ActivityType, str], guild_id: int = GUILD) -> SimpleNamespace:
+    return SimpleNamespace(name=name, guild=SimpleNamespace(id=guild_id), activities=[SimpleNamespace(type=type, name=activity_name) for type, activity_name in activities])
+
+def voice(channel: str | None) -> SimpleNamespace:
+    return SimpleNamespace(channel=channel)
+
+PLAYING = discord.ActivityType.playing
+LISTENING = discord.ActivityType.listening
+
+testdata = [
+    (member("tom"), member("tom", (PLAYING, "Factorio")), OUT_OF_SESSION, "window"),
+    (member("tom"), member("tom", (LISTENING, "Spotify")), IN_SESSION, "activity_type"),
+    (member("jack"), member("jack", (PLAYING, "Factorio")), IN_SESSION, "member"),
+    (member("tom", guild_id=OTHER_GUILD), member("tom", (PLAYING, "Factorio"), guild_id=OTHER_GUILD), IN_SESSION, "member"),
+    (member("tom", (PLAYING, "Factorio")), member("tom", (LISTENING, "Spotify"), (PLAYING, "Factorio")), IN_SESSION, "unchanged"),
+]
+
+@pytest.mark.parametrize("before, after, current_datetime, stage", testdata)
+def test_presence_is_dropped_at_stage(event_filter: EventFilter, before, after, current_datetime: datetime.datetime, stage: str) -> None:
+    assert event_filter.presence(before, after, current_datetime) is None
+    assert event_filter.drops[stage] == 1
+    assert sum(event_filter.drops.values()) == 1
+
+def test_presence_reports_game_switch(event_filter: EventFilter) -> None:
+    change = event_filter.presence(member("tom", (PLAYING, "Factorio")), member("tom", (PLAYING, "Satisfactory")), IN_SESSION)
+    assert change == PresenceChange(GUILD, 1, "Factorio", "Satisfactory")
+    assert event_filter.passed == 1
+
+def test_presence_cuts_long_game_names(event_filter: EventFilter) -> None:
+    name = "Warhammer 40,000: Rogue Trader - Lex Imperialis"
+    change = event_filter.presence(member("tom"), member("tom", (PLAYING, name)), IN_SESSION)
+    assert change.started == name[:32]
+
+def test_voice_drops_channel_moves(event_filter: EventFilter) -> None:
+    assert event_filter.voice(member("tom"), voice("general"), voice("afk"), IN_SESSION) is None
+    assert event_filter.drops["unchanged"] == 1
+    assert event_filter.voice(member("tom"), voice(None), voice("general"), IN_SESSION) == VoiceChange(GUILD, 1, joined=True)
+    assert event_filter.voice(member("tom"), voice("general"), voice(None), IN_SESSION) == VoiceChange(GUILD, 1, joined=False)
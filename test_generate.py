@@ -0,0 +1,15 @@
+import sqlalchemy
+import constants
+import data
+from benchmarks import generate
+from model import SessionMember
+
+def test_generate_is_seeded_and_consistent(db: data.DataBaseSession) -> None:
+    size = generate.Size(years=1, members=10, games=8)
+    counts = generate.generate(size, seed=1)
+    assert counts == generate.generate(size, seed=1)
+    assert counts["sessions"] == 52
+    assert all(session.date.weekday() == constants.SESSION_START_WEEKDAY for session in db.get_sessions())
+
+    member_id = db._session.scalar(sqlalchemy.select(SessionMember.member_id).limit(1))
+    assert db.get_member_stats(member_id).sessions_attended == len(db.get_session_members_for_member(member_id))
@@ -0,0 +1,48 @@
+import json
+import pytest
+import datetime
+import data
+import importer
+
+@pytest.fixture
+def rows(at) -> list[dict]:
+    week = 7 * 24 * 60
+    return [
+        {"date" : "2025-10-24", "member" : "tom", "name" : "Tom", "start" : at(0).isoformat(), "end" : at(60).isoformat(), "game" : "Factorio"},
+        {"date" : "2025-10-24", "member" : "tom", "start" : at(30).isoformat(), "end" : at(120).isoformat(), "game" : "FACTORIO™"},
+        {"date" : "2025-10-24", "member" : "jack", "start" : at(10).isoformat(), "end" : at(90).isoformat()},
+        {"date" : "2025-10-31", "member" : "jack", "start" : at(week).isoformat(), "end" : at(week + 60).isoformat(), "game" : "Satisfactory"},
+    ]
+
+def test_read_rows_streams_csv_and_json(tmp_path, rows: list[dict]) -> None:
+    csv_path = tmp_path / "history.csv"
+    csv_path.write_text("date,member,start,end,game\n2019-03-01,tom,2019-03-01T18:30,2019-03-01T19:30,\n")
+    jsonl_path = tmp_path / "history.jsonl"
+    jsonl_path.write_text("\n".join(json.dumps(row) for row in rows) + "\n")
+    assert [row["member"] for row in importer.read_rows(str(csv_path))] == ["tom"]
+    assert list(importer.read_rows(str(jsonl_path))) == rows
+
+def test_import_merges_rows_and_is_idempotent(db: data.DataBaseSession, rows: list[dict], at) -> None:
+    for _ in range(2):
+        history = importer.Importer(db, batch_size=2)
+        assert history.run(rows) == len(rows)
+
+    members = {member.discord_name: member for member in db.get_members()}
+    assert (members["tom"].name, members["jack"].name) == ("Tom", "jack")
+    assert [game.name for game in db.get_games()] == ["Factorio", "Satisfactory"]
+
+    [first, second] = db.get_sessions()
+    session_members = {session_member.member_id: session_member for session_member in db.get_session_members_for_session(first.id)}
+    assert (session_members[members["tom"].id].start, session_members[members["tom"].id].end) == (at(0), at(120))
+    [session_game] = db.get_session_games_for_session(first.id)
+    assert session_game.get_duration() == datetime.timedelta(minutes=120)
+    assert len(db.get_session_members_for_session(second.id)) == 1
+    assert sorted(member_game.member_id for member_game in db.get_member_games_for_game(session_game.game_id)) == [members["tom"].id]
+
+def test_import_rejects_incomplete_rows(db: data.DataBaseSession, at) -> None:
+    try:
+        importer.Importer(db).run([{"member" : "tom", "start" : at(0).isoformat()}])
+    except Exception as e:
+        assert "Row [1]" in str(e)
+    else:
+        assert False
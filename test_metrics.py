@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+import sqlalchemy
+import fastapi.testclient
+import prometheus_client.parser
+import data
+import app
+import metrics
+import constants
+
+@pytest.fixture
+def client():
+    return fastapi.testclient.TestClient(app.app)
+
+def get_samples(client: fastapi.testclient.TestClient) -> dict:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    return {(sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in prometheus_client.parser.text_string_to_metric_families(response.text)
+        for sample in family.samples}
+
+def test_requests_are_recorded_by_route(db: data.DataBaseSession, client: fastapi.testclient.TestClient) -> None:
+    member = db.add_member("Tom", "tom")
+    app.response_cache.clear()
+    labels = (("method", "GET"), ("route", "/api/v1/members/{id}"))
+    before = get_samples(client)
+
+    assert client.get(f"/api/v1/members/{member.id}").status_code == 200
+    assert client.get(f"/api/v1/members/{member.id}").status_code == 200
+
+    after = get_samples(client)
+    count = ("adibot_request_statements_count", labels)
+    total = ("adibot_request_statements_sum", labels)
+    assert after[count] - before.get(count, 0) == 2
+    # the second request is served from the response cache after reading the data versions
+    assert after[total] - before.get(total, 0) >= 2
+    assert ("adibot_request_seconds_count", (*labels, ("status", "200"))) in after
+    assert after[("adibot_pool_wait_seconds_count", (("engine", "async"),))] > 0
+
+def test_events_record_their_statements(db: data.DataBaseSession) -> None:
+    async def run():
+        with metrics.track_event("test") as scope:
+            async with data.AsyncDataBaseSession() as async_db:
+                await async_db.get_members()
+                await asyncio.create_task(async_db.get_games())
+        return scope
+
+    scope = asyncio.run(run())
+    assert scope.count == 2
+    assert scope.seconds > 0
+
+def test_failed_statements_are_not_recorded(db: data.DataBaseSession) -> None:
+    with metrics.statement_scope() as scope:
+        with data.get_engine().connect() as connection:
+            with pytest.raises(sqlalchemy.exc.OperationalError):
+                connection.execute(sqlalchemy.text("SELECT * FROM missing_table"))
+            connection.execute(sqlalchemy.text("SELECT 1"))
+            assert "statement_start" not in connection.info
+    assert scope.count == 1
+
+def test_authenticated_routes_reject_bad_tokens(client: fastapi.testclient.TestClient, monkeypatch) -> None:
+    monkeypatch.setattr(constants, "MASTER_API_TOKEN", "secret")
+    request = {"name" : "Tom", "discord_name" : "tom"}
+    assert client.post("/api/v1/members", json=request).status_code == 401
+    assert client.post("/api/v1/members", json=request, headers={"token" : "wrong"}).status_code == 401
+
+def test_health_and_readiness(db: data.DataBaseSession, client: fastapi.testclient.TestClient, monkeypatch) -> None:
+    assert client.get("/healthz").json() == {"status" : "ok"}
+    assert client.get("/readyz").status_code == 200
+
+    async def ping(self):
+        raise Exception("could not connect to server at db.internal:5432 as user adibot")
+    monkeypatch.setattr(data.AsyncDataBaseSession, "ping", ping, raising=False)
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json() == {"status" : "unavailable", "detail" : "database unavailable"}
+    assert client.get("/healthz").status_code == 200
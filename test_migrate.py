@@ -0,0 +1,127 @@
+import datetime
+import sqlalchemy
+import data
+import migrate
+import manage
+from model import Base, Member, Session, Game, SessionMember, SessionGame, MemberGame
+
+def create_unindexed_schema(engine: sqlalchemy.Engine) -> None:
+    Base.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            connection.execute(sqlalchemy.schema.CreateTable(table))
+
+# the tables as they were before guild_id, normalized names, durations and the stats tables were added
+BASELINE_SCHEMA = [
+    "CREATE TABLE members (id INTEGER NOT NULL PRIMARY KEY, discord_name VARCHAR(32) NOT NULL, name VARCHAR(32) NOT NULL, in_rotation BOOLEAN NOT NULL, is_admin BOOLEAN NOT NULL)",
+    "CREATE TABLE sessions (id INTEGER NOT NULL PRIMARY KEY, date DATE NOT NULL)",
+    "CREATE TABLE games (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(32) NOT NULL)",
+    "CREATE TABLE session_members (id INTEGER NOT NULL PRIMARY KEY, member_id INTEGER NOT NULL REFERENCES members (id), session_id INTEGER NOT NULL REFERENCES sessions (id), start DATETIME NOT NULL, \"end\" DATETIME NOT NULL)",
+    "CREATE TABLE session_games (id INTEGER NOT NULL PRIMARY KEY, game_id INTEGER NOT NULL REFERENCES games (id), session_id INTEGER NOT NULL REFERENCES sessions (id), start DATETIME NOT NULL, \"end\" DATETIME NOT NULL)",
+    "CREATE TABLE member_games (id INTEGER NOT NULL PRIMARY KEY, game_id INTEGER NOT NULL REFERENCES games (id), member_id INTEGER NOT NULL REFERENCES members (id))",
+]
+
+def test_upgrade_adds_and_fills_the_columns_missing_from_the_baseline_schema() -> None:
+    Base.metadata.drop_all(data.get_engine())
+    start = datetime.datetime(2025, 10, 24, 18)
+    with data.get_engine().begin() as connection:
+        for statement in BASELINE_SCHEMA: connection.execute(sqlalchemy.text(statement))
+        connection.execute(sqlalchemy.text("INSERT INTO members VALUES (1, 'tom', 'Tom', 1, 0)"))
+        connection.execute(sqlalchemy.text("INSERT INTO sessions VALUES (1, :date)"), {"date": start.date()})
+        connection.execute(sqlalchemy.text("INSERT INTO games VALUES (1, 'Factorio™')"))
+        connection.execute(sqlalchemy.text("INSERT INTO session_members VALUES (1, 1, 1, :start, :end)"), {"start": start, "end": start + datetime.timedelta(hours=4)})
+        connection.execute(sqlalchemy.text("INSERT INTO session_games VALUES (1, 1, 1, :start, :end)"), {"start": start, "end": start + datetime.timedelta(hours=2)})
+        connection.execute(sqlalchemy.text("INSERT INTO member_games VALUES (1, 1, 1)"))
+
+    migrate.upgrade(data.get_engine(), guild_id=42)
+
+    inspector = sqlalchemy.inspect(data.get_engine())
+    for table in Base.metadata.sorted_tables:
+        assert {column.name for column in table.columns} <= {column["name"] for column in inspector.get_columns(table.name)}
+        assert {index.name for index in table.indexes} <= {index["name"] for index in inspector.get_indexes(table.name)}
+
+    with data.DataBaseSession(guild_id=42) as db:
+        assert [(member.id, member.guild_id) for member in db.get_members()] == [(1, 42)]
+        assert [(session.id, session.guild_id, session.games_master_id) for session in db.get_sessions()] == [(1, 42, None)]
+        assert [(game.id, game.guild_id, game.normalized_name) for game in db.get_games()] == [(1, 42, "factorio")]
+        assert db.get_or_create_game("factorio").id == 1
+        session_members = db.get_session_members_for_session(1)
+        assert [(session_member.start, session_member.end) for session_member in session_members] == [(start, start + datetime.timedelta(hours=4))]
+        assert db.get_game_stats(1).members_played == 1
+
+def test_upgrade_merges_duplicates_and_creates_indexes() -> None:
+    create_unindexed_schema(data.get_engine())
+    start = datetime.datetime(2025, 10, 24, 18)
+    with data.get_engine().begin() as connection:
+        connection.execute(sqlalchemy.insert(Member), [{"id": 1, "name": "Tom", "discord_name": "tom"}, {"id": 2, "name": "Tom", "discord_name": "tom"}])
+        connection.execute(sqlalchemy.insert(Session), [{"id": 1, "date": start.date()}, {"id": 2, "date": start.date()}])
+        connection.execute(sqlalchemy.insert(SessionMember), [
+            {"member_id": 1, "session_id": 1, "start": start, "end": start + datetime.timedelta(hours=1)},
+            {"member_id": 2, "session_id": 2, "start": start + datetime.timedelta(hours=2), "end": start + datetime.timedelta(hours=3)},
+        ])
+
+    migrate.upgrade(data.get_engine())
+
+    inspector = sqlalchemy.inspect(data.get_engine())
+    for table in Base.metadata.sorted_tables:
+        assert {index.name for index in table.indexes} <= {index["name"] for index in inspector.get_indexes(table.name)}
+
+    with data.DataBaseSession() as db:
+        assert [member.id for member in db.get_members()] == [1]
+        assert [session.id for session in db.get_sessions()] == [1]
+        session_members = db.get_session_members_for_session(1)
+        assert len(session_members) == 1
+        assert (session_members[0].start, session_members[0].end) == (start, start + datetime.timedelta(hours=3))
+
+def test_upgrade_moves_rows_into_the_guild_and_replaces_old_indexes() -> None:
+    create_unindexed_schema(data.get_engine())
+    with data.get_engine().begin() as connection:
+        connection.execute(sqlalchemy.text("CREATE UNIQUE INDEX ix_members_discord_name ON members (discord_name)"))
+        connection.execute(sqlalchemy.insert(Member), [{"id": 1, "name": "Tom", "discord_name": "tom"}])
+
+    migrate.upgrade(data.get_engine(), guild_id=42)
+
+    indexes = {index["name"] for index in sqlalchemy.inspect(data.get_engine()).get_indexes("members")}
+    assert "ix_members_discord_name" not in indexes
+    with data.DataBaseSession(guild_id=42) as db:
+        assert [member.id for member in db.get_members()] == [1]
+        # the same discord name can now be a member of another guild
+        db.for_guild(43).add_member("Tom", "tom")
+        assert len(db.get_members_in_guilds()) == 2
+
+def test_upgrade_leaves_games_with_the_same_normalized_name_to_merge_games() -> None:
+    create_unindexed_schema(data.get_engine())
+    start = datetime.datetime(2025, 10, 24, 18)
+    with data.get_engine().begin() as connection:
+        connection.execute(sqlalchemy.insert(Member), [{"id": 1, "name": "Tom", "discord_name": "tom"}, {"id": 2, "name": "Jack", "discord_name": "jack"}])
+        connection.execute(sqlalchemy.insert(Session), [{"id": 1, "date": start.date()}])
+        connection.execute(sqlalchemy.insert(Game), [{"id": 1, "name": "Factorio"}, {"id": 2, "name": "FACTORIO™"}, {"id": 3, "name": "Satisfactory"}])
+        connection.execute(sqlalchemy.insert(SessionGame), [
+            {"session_id": 1, "game_id": 1, "start": start, "end": start + datetime.timedelta(hours=1), "duration": 3600},
+            {"session_id": 1, "game_id": 2, "start": start + datetime.timedelta(minutes=30), "end": start + datetime.timedelta(hours=2), "duration": 5400},
+            {"session_id": 1, "game_id": 3, "start": start, "end": start + datetime.timedelta(hours=1), "duration": 3600},
+        ])
+        connection.execute(sqlalchemy.insert(MemberGame), [{"member_id": 1, "game_id": 1}, {"member_id": 2, "game_id": 2}, {"member_id": 1, "game_id": 3}])
+
+    migrate.upgrade(data.get_engine())
+
+    def get_game_indexes() -> set[str]:
+        return {index["name"] for index in sqlalchemy.inspect(data.get_engine()).get_indexes("games")}
+    with data.DataBaseSession() as db:
+        assert [game.normalized_name for game in db.get_games()] == ["factorio", "factorio", "satisfactory"]
+    assert "ix_games_guild_id_normalized_name" not in get_game_indexes()
+
+    manage.merge_games(dry_run=True)
+    with data.DataBaseSession() as db:
+        assert len(db.get_games()) == 3
+
+    manage.merge_games(dry_run=False)
+    assert "ix_games_guild_id_normalized_name" in get_game_indexes()
+    with data.DataBaseSession() as db:
+        assert [(game.id, game.normalized_name) for game in db.get_games()] == [(1, "factorio"), (3, "satisfactory")]
+        session_games = {session_game.game_id: session_game for session_game in db.get_session_games_for_session(1)}
+        assert (session_games[1].start, session_games[1].end, session_games[1].duration) == (start, start + datetime.timedelta(hours=2), None)
+        assert session_games[3].duration == 3600
+        assert sorted(member_game.member_id for member_game in db.get_member_games_for_game(1)) == [1, 2]
+        assert db.get_or_create_game("factorio™").id == 1
+        assert db.merge_duplicate_games() == 0
@@ -0,0 +1,47 @@
+import os
+import json
+import pstats
+import fastapi.testclient
+import constants
+import data
+import metrics
+import profiling
+import app
+
+def test_profile_writes_stats_and_phases(tmp_path) -> None:
+    with metrics.statement_scope() as scope:
+        with profiling.profile("GET /api/v1/members", scope, str(tmp_path)) as profile:
+            with profiling.phase("serialization"): sum(range(1000))
+            scope.count += 2
+            scope.seconds += 0.5
+            # profiles don't nest, the inner block just runs
+            with profiling.profile("inner", scope, str(tmp_path)) as inner: assert inner is None
+
+    assert os.path.basename(profile.path).endswith("GET_api_v1_members")
+    assert pstats.Stats(profile.path + ".prof").total_calls > 0
+    metadata = json.load(open(profile.path + ".json"))
+    assert metadata["statements"] == 2
+    assert metadata["phases"]["db"] == 0.5 and metadata["phases"]["serialization"] > 0
+    assert "db;dur=500.00" in profile.get_server_timing()
+    assert len(os.listdir(tmp_path)) == 2
+
+def test_sample_rate() -> None:
+    scope = metrics.StatementScope()
+    with profiling.sample("voice", 0, scope) as profile: assert profile is None
+
+def test_requests_are_profiled_for_authenticated_callers(db: data.DataBaseSession, tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(constants, "MASTER_API_TOKEN", "secret")
+    monkeypatch.setattr(constants, "PROFILE_DIR", str(tmp_path))
+    db.add_member("Tom", "tom")
+    client = fastapi.testclient.TestClient(app.app)
+
+    assert "x-profile" not in client.get("/api/v1/members", headers={"X-Profile" : "1"}).headers
+    assert "x-profile" not in client.get("/api/v1/members", headers={"X-Profile" : "1", "token" : "wrong"}).headers
+    assert len(os.listdir(tmp_path)) == 0
+
+    # a response cache hit has no serialization phase, so ask for a page not cached yet
+    response = client.get("/api/v1/members", params={"limit" : 10}, headers={"X-Profile" : "1", "token" : "secret"})
+    assert response.json()[0]["name"] == "Tom"
+    assert "serialization;dur=" in response.headers["server-timing"]
+    assert sorted(os.listdir(tmp_path)) == [response.headers["x-profile"] + ".json", response.headers["x-profile"] + ".prof"]
+    assert json.load(open(tmp_path / (response.headers["x-profile"] + ".json")))["name"] == "GET /api/v1/members"
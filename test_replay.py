@@ -0,0 +1,25 @@
+import asyncio
+import datetime
+import data
+import bot
+from benchmarks import replay
+
+FRIDAY = datetime.datetime(2025, 10, 24, 19)
+
+def test_replayed_events_are_written(db: data.DataBaseSession) -> None:
+    db.add_member("Tom", "tom")
+    events = [
+        replay.Event(FRIDAY, "voice", "tom", None, "General"),
+        replay.Event(FRIDAY + datetime.timedelta(minutes=5), "presence", "tom", [], [("playing", "Factorio")]),
+        replay.Event(FRIDAY + datetime.timedelta(minutes=6), "presence", "stranger", [], [("playing", "Factorio")]),
+        replay.Event(FRIDAY + datetime.timedelta(minutes=7), "presence", "tom", [("playing", "Factorio")], [("listening", "Spotify")]),
+    ]
+    events = [replay.Event.from_json(event.to_json()) for event in events]
+
+    latencies, _ = asyncio.run(replay.replay(events))
+    assert len(latencies) == len(events)
+
+    session = db.get_session_by_date(FRIDAY.date())
+    assert [session_member.member.name for session_member in db.get_session_members_for_session(session.id)] == ["Tom"]
+    assert [session_game.game.name for session_game in db.get_session_games_for_session(session.id)] == ["Factorio"]
+    assert bot.event_filter.drops["member"] >= 1
@@ -0,0 +1,67 @@
+import asyncio
+import datetime
+import discord
+import sqlalchemy
+from types import SimpleNamespace
+import data
+import sampler
+from directory import MemberDirectory, DirectoryEntry
+from model import ActivityEvent
+from sampler import Snapshot
+
+GUILD = 0
+PLAYING = discord.ActivityType.playing
+
+def member(name: str, game: str = None) -> SimpleNamespace:
+    return SimpleNamespace(name=name, activities=[] if game is None else [SimpleNamespace(type=PLAYING, name=game)])
+
+def guild(in_voice: list, others: list = ()) -> SimpleNamespace:
+    return SimpleNamespace(id=GUILD, voice_channels=[SimpleNamespace(members=in_voice)], members=[*in_voice, *others])
+
+def get_directory() -> MemberDirectory:
+    directory = MemberDirectory()
+    directory._entries = {(GUILD, "tom"): DirectoryEntry(1, False), (GUILD, "jack"): DirectoryEntry(2, False)}
+    return directory
+
+def test_take_snapshot_ignores_non_members(session_date: datetime.date) -> None:
+    directory = get_directory()
+    snapshot = sampler.take_snapshot(guild([member("tom"), member("stranger")], [member("jack", "Factorio")]), directory, session_date)
+    assert snapshot == Snapshot(session_date, frozenset({1}), {2: "Factorio"})
+    assert (directory.hits, directory.misses) == (0, 0)
+    assert sampler.take_snapshot(guild([member("tom")]), get_directory(), None) == Snapshot()
+
+def test_get_events_diffs_snapshots(at, session_date: datetime.date) -> None:
+    before = Snapshot(session_date, frozenset({1, 2}), {1: "Factorio"})
+    after = Snapshot(session_date, frozenset({1}), {1: "Satisfactory"})
+    events = sampler.get_events(GUILD, before, after, at(5))
+    assert [(event["member_id"], event["kind"], event["game_name"]) for event in events] == [(2, "leave", None), (1, "stop", "Factorio"), (1, "start", "Satisfactory")]
+    assert sampler.get_events(GUILD, after, after, at(6)) == []
+
+    closed = sampler.get_events(GUILD, after, Snapshot(), at(7))
+    assert {(event["kind"], event["session_date"]) for event in closed} == {("leave", session_date), ("stop", session_date)}
+
+def test_get_open_snapshot_replays_the_log(session_date: datetime.date) -> None:
+    events = [ActivityEvent(member_id=1, kind="join"), ActivityEvent(member_id=2, kind="join"), ActivityEvent(member_id=2, kind="start", game_name="Factorio"),
+              ActivityEvent(member_id=1, kind="leave"), ActivityEvent(member_id=2, kind="stop", game_name="Satisfactory")]
+    assert sampler.get_open_snapshot(session_date, events) == Snapshot(session_date, frozenset({2}), {2: "Factorio"})
+
+def test_ticks_write_one_insert_and_resume_from_the_log(db: data.DataBaseSession, at, session_date: datetime.date) -> None:
+    tom, jack = member("tom", "Factorio"), member("jack")
+    guilds = [guild([tom, jack])]
+    first = sampler.Sampler(get_directory(), lambda: guilds)
+
+    statements = []
+    on_execute = lambda connection, cursor, statement, *args: statements.append(statement)
+    sqlalchemy.event.listen(data.get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+    try:
+        assert asyncio.run(first.tick(at(0))) == 3
+    finally:
+        sqlalchemy.event.remove(data.get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+    assert len([statement for statement in statements if statement.startswith("INSERT INTO activity_events")]) == 1
+    assert asyncio.run(first.tick(at(1))) == 0
+
+    # a restarted sampler rebuilds its state from the log, so only jack leaving is written
+    guilds[0] = guild([tom])
+    second = sampler.Sampler(get_directory(), lambda: guilds)
+    assert asyncio.run(second.tick(at(10))) == 1
+    assert [(event.member_id, event.kind) for event in db.get_activity_events(session_date)][-1] == (2, "leave")
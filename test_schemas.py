@@ -0,0 +1,24 @@
+import json
+import datetime
+import fastapi.encoders
+import schemas
+
+START = datetime.datetime(2025, 10, 24, 18, 30, 0, 5)
+
+def test_to_json_matches_jsonable_encoder() -> None:
+    member = {
+        "id" : 1,
+        "name" : "Tom",
+        "discord_name" : "tom",
+        "number_of_games" : 1,
+        "number_of_sessions" : 2,
+        "games" : [{"id" : 1, "name" : "Factorio"}],
+        "sessions" : [
+            {"id" : 1, "date" : START.date(), "start" : START, "end" : START + datetime.timedelta(hours=2), "duration" : datetime.timedelta(minutes=90, microseconds=1)},
+            {"id" : 2, "date" : START.date(), "start" : START, "end" : START, "duration" : None},
+        ],
+    }
+    assert json.loads(schemas.to_json(schemas.MemberDetail, member)) == fastapi.encoders.jsonable_encoder(member)
+
+def test_to_json_drops_fields_outside_the_model() -> None:
+    assert json.loads(schemas.to_json(list[schemas.Game], [{"id" : 1, "name" : "Factorio", "normalized_name" : "factorio"}])) == [{"id" : 1, "name" : "Factorio"}]
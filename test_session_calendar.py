@@ -0,0 +1,65 @@
+import pytest
+import datetime
+import zoneinfo
+import numpy as np
+from session_calendar import SessionCalendar, Window, ExtraSession
+
+FRIDAY = Window.parse("Fri 18:00-Sat 07:00")
+TUESDAY = Window.parse("Tue 19:30-Tue 23:00")
+NEW_YEAR = ExtraSession(datetime.datetime(2025, 12, 31, 20), datetime.datetime(2026, 1, 1, 2))
+
+@pytest.fixture
+def calendar() -> SessionCalendar:
+    return SessionCalendar([FRIDAY, TUESDAY], [NEW_YEAR])
+
+testdata = [
+    (datetime.datetime(2025, 10, 24, 17, 59), None),
+    (datetime.datetime(2025, 10, 24, 18, 0), datetime.date(2025, 10, 24)),
+    (datetime.datetime(2025, 10, 25, 2, 30), datetime.date(2025, 10, 24)),
+    (datetime.datetime(2025, 10, 25, 6, 59), datetime.date(2025, 10, 24)),
+    (datetime.datetime(2025, 10, 25, 7, 0), None),
+    (datetime.datetime(2025, 10, 28, 19, 29), None),
+    (datetime.datetime(2025, 10, 28, 19, 30), datetime.date(2025, 10, 28)),
+    (datetime.datetime(2026, 1, 1, 1, 0), datetime.date(2025, 12, 31)),
+    (datetime.datetime(2026, 1, 1, 2, 0), None),
+]
+
+@pytest.mark.parametrize("timestamp, expected", testdata)
+def test_get_session_date(calendar: SessionCalendar, timestamp: datetime.datetime, expected: datetime.date) -> None:
+    assert calendar.get_session_date(timestamp) == expected
+
+def test_classify_matches_get_session_date(calendar: SessionCalendar) -> None:
+    rng = np.random.default_rng(0)
+    start = np.datetime64("2025-06-01T00:00", "m")
+    timestamps = start + rng.integers(0, 60 * 24 * 365, 5000).astype("timedelta64[m]")
+    timestamps = np.append(timestamps, [np.datetime64(timestamp, "m") for timestamp, _ in testdata] + [np.datetime64("NaT", "m")])
+
+    dates = calendar.classify(timestamps)
+    expected = [calendar.get_session_date(timestamp.astype(datetime.datetime)) if not np.isnat(timestamp) else None for timestamp in timestamps]
+    assert [None if np.isnat(date) else date.astype(datetime.date) for date in dates] == expected
+
+def test_timezones_are_converted_to_wall_clock() -> None:
+    calendar = SessionCalendar([FRIDAY], timezone=zoneinfo.ZoneInfo("Europe/London"))
+    # 17:30 UTC is 18:30 in London during summer time, but still 17:30 once the clocks go back
+    summer = datetime.datetime(2025, 10, 24, 17, 30, tzinfo=datetime.timezone.utc)
+    winter = datetime.datetime(2025, 10, 31, 17, 30, tzinfo=datetime.timezone.utc)
+    assert calendar.get_session_date(summer) == datetime.date(2025, 10, 24)
+    assert calendar.get_session_date(winter) is None
+
+    dates = calendar.classify(np.array([summer.replace(tzinfo=None), winter.replace(tzinfo=None)], dtype="datetime64[m]"), utc=True)
+    assert dates[0] == np.datetime64("2025-10-24") and np.isnat(dates[1])
+
+def test_get_current_or_last_session_date(calendar: SessionCalendar) -> None:
+    assert calendar.get_current_or_last_session_date(datetime.date(2025, 10, 27)) == datetime.date(2025, 10, 24)
+    assert calendar.get_current_or_last_session_date(datetime.date(2025, 10, 30)) == datetime.date(2025, 10, 28)
+    assert calendar.get_current_or_last_session_date(datetime.date(2026, 1, 1)) == datetime.date(2025, 12, 31)
+
+def test_overlapping_windows_are_rejected() -> None:
+    with pytest.raises(Exception):
+        SessionCalendar([FRIDAY, Window.parse("Sat 06:00-Sat 08:00")])
+
+def test_is_closed(calendar: SessionCalendar) -> None:
+    friday = datetime.date(2025, 10, 24)
+    assert not calendar.is_closed(friday, datetime.datetime(2025, 10, 24, 23))
+    assert not calendar.is_closed(friday, datetime.datetime(2025, 10, 25, 6, 59))
+    assert calendar.is_closed(friday, datetime.datetime(2025, 10, 25, 7))
@@ -0,0 +1,60 @@
+import pytest
+import datetime
+import numpy as np
+import data
+import streaks
+from streaks import StreakMatrix
+
+def get_streaks_naively(row: list[bool]) -> tuple[int, int]:
+    longest = current = 0
+    for attended in row:
+        current = current + 1 if attended else 0
+        longest = max(longest, current)
+    return current, longest
+
+testdata = [
+    np.zeros((0, 5), dtype=bool),
+    np.zeros((3, 0), dtype=bool),
+    [[True, True, False, True]],
+    [[False, False], [True, True], [True, False]],
+    np.random.default_rng(0).random((20, 50)) < 0.7,
+]
+
+@pytest.mark.parametrize("attended", testdata)
+def test_streaks_match_a_naive_walk(attended) -> None:
+    attended = np.array(attended, dtype=bool)
+    expected = [get_streaks_naively(row) for row in attended.tolist()]
+    assert list(zip(streaks.get_current_streaks(attended).tolist(), streaks.get_longest_streaks(attended).tolist())) == expected
+
+def test_append_matches_a_full_rebuild() -> None:
+    rng = np.random.default_rng(1)
+    attended = rng.random((30, 200)) < 0.6
+    dates = [datetime.date(2020, 1, 3) + datetime.timedelta(weeks=i) for i in range(200)]
+
+    matrix = StreakMatrix(range(30), dates[:100], attended[:, :100])
+    for column in range(100, 200):
+        matrix.append(dates[column], np.nonzero(attended[:, column])[0].tolist())
+    rebuilt = StreakMatrix(range(30), dates, attended)
+
+    assert matrix.to_dicts() == rebuilt.to_dicts()
+    assert np.array_equal(matrix.attended, attended)
+
+def test_refresh_picks_up_new_sessions_and_late_arrivals(db: data.DataBaseSession) -> None:
+    members = [db.add_member(f"member-{i}", f"discord-{i}") for i in range(3)]
+    start = datetime.datetime(2025, 10, 3, 18)
+
+    def attend(week: int, *member_indices: int) -> None:
+        session = db.get_or_create_session(start.date() + datetime.timedelta(weeks=week))
+        for i in member_indices:
+            db.add_or_update_session_member(session.id, members[i].id, start=start + datetime.timedelta(weeks=week))
+
+    attend(0, 0, 1)
+    attend(1, 0)
+    matrix = streaks.refresh(db, None, db.get_session_member_dates)
+    assert matrix.current_streaks.tolist() == [2, 0]
+
+    attend(1, 2)
+    attend(2, 0, 2)
+    matrix = streaks.refresh(db, matrix, db.get_session_member_dates)
+    by_id = {row["id"]: row for row in matrix.to_dicts()}
+    assert [(by_id[member.id]["current_streak"], by_id[member.id]["longest_streak"], by_id[member.id]["total"]) for member in members] == [(3, 3, 3), (0, 1, 1), (2, 2, 2)]
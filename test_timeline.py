@@ -0,0 +1,39 @@
+import datetime
+import fastapi.testclient
+import data
+import app
+import timeline
+
+def test_timeline_steps_and_peak(at) -> None:
+    members = [(at(0), at(60), 1), (at(30), at(90), 2), (at(60), at(120), 3)]
+    games = [(at(30), at(90), 7), (at(60), at(60), 8)]
+    result = timeline.get_timeline(members, games)
+    assert [(step["time"], step["members"], step["game_ids"]) for step in result["steps"]] == [
+        (at(0), 1, []),
+        (at(30), 2, [7]),
+        # 1 leaves as 3 joins, so the count never reaches 3
+        (at(60), 2, [7]),
+        (at(90), 1, []),
+        (at(120), 0, []),
+    ]
+    assert (result["peak_members"], result["peak_time"]) == (2, at(30))
+
+def test_timeline_is_stored_once_the_session_closes(db: data.DataBaseSession, session_date: datetime.date) -> None:
+    tom = db.add_member("Tom", "tom").id
+    factorio = db.get_or_create_game("Factorio").id
+    past = db.get_or_create_session(session_date)
+    future = db.get_or_create_session(datetime.date.today() + datetime.timedelta(days=7))
+    for session in (past, future):
+        start = datetime.datetime.combine(session.date, datetime.time(18))
+        db.add_or_update_session_member(session.id, tom, start, start + datetime.timedelta(hours=2))
+        db.add_or_update_session_game(session.id, factorio, start, start + datetime.timedelta(hours=1))
+
+    client = fastapi.testclient.TestClient(app.app)
+    app.response_cache.clear()
+    response = client.get(f"/api/v1/sessions/{past.id}/timeline").json()
+    assert response["peak_members"] == 1
+    assert response["games"] == [{"id" : factorio, "name" : "Factorio"}]
+    assert db.get_session_timeline(past.id) == response
+
+    assert client.get(f"/api/v1/sessions/{future.id}/timeline").json()["peak_members"] == 1
+    assert db.get_session_timeline(future.id) is None
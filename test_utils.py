@@ -16,4 +16,23 @@ testdata = [
 @pytest.mark.parametrize("input, expected", testdata)
 def test_get_current_or_last_session_start_date(input: datetime.date, expected: datetime.date) -> None:  
     result = utils.get_current_or_last_session_start_date(input) 
-    assert result == expected
\ No newline at end of file
+    assert result == expected
+
+game_names = [
+    ("Factorio", "factorio"),
+    ("  FACTORIO™ ", "factorio"),
+    ("Ｆａｃｔｏｒｉｏ", "factorio"),
+    ("Counter-Strike 2", "counterstrike 2"),
+    ("Baldur's Gate 3: Deluxe Edition", "baldurs gate 3"),
+    ("The Witcher 3: Wild Hunt - Game of the Year Edition", "the witcher 3 wild hunt"),
+    ("Fallout 4 GOTY", "fallout 4"),
+    ("Pokémon Gold", "pokémon gold"),
+    ("Super Smash Bros. Ultimate", "super smash bros ultimate"),
+    ("Gold", "gold"),
+    ("Gold Edition", "gold edition"),
+    ("???", "???"),
+]
+
+@pytest.mark.parametrize("input, expected", game_names)
+def test_normalize_game_name(input: str, expected: str) -> None:
+    assert utils.normalize_game_name(input) == expected
@@ -0,0 +1,93 @@
+import pytest
+import asyncio
+import datetime
+import sqlalchemy
+import data
+from writer import EventWriter
+
+def test_writer_appends_events_in_one_insert(db: data.DataBaseSession, at, session_date: datetime.date) -> None:
+    tom = db.add_member("Tom", "tom").id
+    jack = db.add_member("Jack", "jack").id
+    statements = []
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.split()[:3]).upper())
+    sqlalchemy.event.listen(data.get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+
+    async def run():
+        writer = EventWriter(max_batch_size=1000, flush_interval=60)
+        writer.start()
+        for minute in range(50):
+            for member_id in (tom, jack):
+                writer.add_event(db.guild_id, member_id, "start", session_date, at(minute), "Factorio")
+        writer.add_event(db.guild_id, tom, "leave", session_date, at(120))
+        await writer.stop()
+
+    try:
+        asyncio.run(run())
+    finally:
+        sqlalchemy.event.remove(data.get_async_engine().sync_engine, "before_cursor_execute", on_execute)
+
+    # the events in one INSERT, and their session marked pending in one more
+    assert statements.count("INSERT INTO ACTIVITY_EVENTS") == 1
+    assert statements.count("INSERT INTO PENDING_SESSIONS") == 1
+    events = db.get_activity_events(session_date)
+    assert len(events) == 101
+    assert (events[-1].member_id, events[-1].kind, events[-1].game_name) == (tom, "leave", None)
+    # nothing is written to the session tables until compaction
+    assert db.get_session_by_date(session_date) is None
+
+def test_writer_flushes_when_batch_is_full(db: data.DataBaseSession, at, session_date: datetime.date) -> None:
+    tom = db.add_member("Tom", "tom").id
+
+    async def run():
+        writer = EventWriter(max_batch_size=1, flush_interval=60)
+        writer.start()
+        writer.add_event(db.guild_id, tom, "join", session_date, at(0))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if len(db.get_activity_events(session_date)) > 0: break
+        flushed = len(db.get_activity_events(session_date)) > 0
+        await writer.stop()
+        return flushed
+
+    assert asyncio.run(run())
+
+def test_writer_drops_only_rejected_events(db: data.DataBaseSession, at, session_date: datetime.date) -> None:
+    tom = db.add_member("Tom", "tom").id
+
+    async def run():
+        writer = EventWriter(max_batch_size=1000, flush_interval=60)
+        writer.start()
+        writer.add_event(db.guild_id, tom, "join", session_date, at(0))
+        writer.add_event(db.guild_id, tom, None, session_date, at(1))
+        writer.add_event(db.guild_id, tom, "leave", session_date, at(2))
+        await writer.stop()
+
+    asyncio.run(run())
+    assert [event.kind for event in db.get_activity_events(session_date)] == ["join", "leave"]
+
+def test_writer_retries_when_the_database_is_unavailable(db: data.DataBaseSession, monkeypatch: pytest.MonkeyPatch, at, session_date: datetime.date) -> None:
+    tom = db.add_member("Tom", "tom").id
+    add_activity_events = data.DataBaseSession.add_activity_events
+    attempts = []
+    def flaky(self, events: list[dict]) -> None:
+        attempts.append(len(events))
+        if len(attempts) <= 2: raise sqlalchemy.exc.OperationalError("INSERT", {}, Exception("database is unavailable"))
+        add_activity_events(self, events)
+    monkeypatch.setattr(data.DataBaseSession, "add_activity_events", flaky)
+
+    async def run():
+        writer = EventWriter(max_batch_size=2, flush_interval=60, retry_delay=0.01)
+        writer.start()
+        writer.add_event(db.guild_id, tom, "join", session_date, at(0))
+        writer.add_event(db.guild_id, tom, "start", session_date, at(1), "Factorio")
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if len(attempts) >= 3: break
+        writer.add_event(db.guild_id, tom, "leave", session_date, at(2))
+        await writer.stop()
+        return writer.failures
+
+    assert asyncio.run(run()) == 0
+    assert attempts[:3] == [2, 2, 2]
+    assert [event.kind for event in db.get_activity_events(session_date)] == ["join", "start", "leave"]
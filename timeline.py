@@ -0,0 +1,32 @@
+import datetime
+from typing import Iterable
+
+def get_timeline(members: Iterable[tuple[datetime.datetime, datetime.datetime, int]], games: Iterable[tuple[datetime.datetime, datetime.datetime, int]]) -> dict:
+    """Gets a step function of the members present and games active over a session from their (start, end, id) intervals.
+
+    Every start and end is sorted once and walked in order, emitting a step whenever the time moves on. Ends sort
+    before starts at the same time, so someone leaving as another joins never counts as both present at once."""
+    # (time, order, delta, kind, id) with order 0 for ends so they apply first
+    endpoints = []
+    for kind, intervals in (("member", members), ("game", games)):
+        for start, end, id in intervals:
+            if end <= start: continue
+            endpoints.append((start, 1, 1, kind, id))
+            endpoints.append((end, 0, -1, kind, id))
+    endpoints.sort()
+
+    steps = []
+    present = 0
+    active: dict[int, int] = {}
+    peak_members, peak_time = 0, None
+    for i, (time, _, delta, kind, id) in enumerate(endpoints):
+        if kind == "member":
+            present += delta
+        else:
+            active[id] = active.get(id, 0) + delta
+            if active[id] == 0: del active[id]
+        if i + 1 < len(endpoints) and endpoints[i + 1][0] == time: continue
+
+        steps.append({"time" : time, "members" : present, "game_ids" : sorted(active)})
+        if present > peak_members: peak_members, peak_time = present, time
+    return {"peak_members" : peak_members, "peak_time" : peak_time, "steps" : steps}
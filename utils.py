@@ -1,20 +1,28 @@
+import re
 import datetime
-from constants import SESSION_START_WEEKDAY, SESSION_START_TIME, SESSION_END_WEEKDAY, SESSION_END_TIME
+import unicodedata
+from session_calendar import calendar
+
+# only a named edition or a game of the year marker, as a bare "gold" or "ultimate" is often part of the title
+EDITION_SUFFIX = re.compile(r"\s*[-:–—]?\s*\(?\b((definitive|deluxe|complete|ultimate|standard|special|gold|premium|anniversary|enhanced|game of the year|goty) edition|game of the year|goty)\)?$")
 
 def get_current_or_last_session_start_date(current_date: datetime.date) -> datetime.date:
     """Gets the datetime.date for the start of the current or last session relative to the provided datetime.date."""
-    while current_date.weekday() != SESSION_START_WEEKDAY:
-        current_date -= datetime.timedelta(days=1)
-    return current_date
+    return calendar.get_current_or_last_session_date(current_date)
 
 def is_valid_session_from_datetime(datetime: datetime.datetime) -> bool:
     """Checks whether the provided datetime is within a valid session window."""
-    return is_valid_session(datetime.weekday(), datetime.hour)
+    return calendar.is_in_session(datetime)
+
+def normalize_game_name(name: str) -> str:
+    """Gets the key a game is catalogued under, ignoring case, punctuation, trademark symbols and edition suffixes,
+    so "Baldur's Gate™ 3: Deluxe Edition" and "baldurs gate 3" are the same game. "Pokémon Gold" is not "Pokémon"."""
+    # drop the symbols first, as NFKC would spell ™ out as "tm"
+    name = unicodedata.normalize("NFKC", re.sub(r"[™®©]", "", name)).casefold()
+    normalized = " ".join(re.sub(r"[^\w\s]", "", EDITION_SUFFIX.sub("", name.strip())).split())
+    # a name that is nothing but a suffix or punctuation keeps its own key rather than sharing the empty one
+    return normalized if normalized != "" else " ".join(name.split())
 
 def is_valid_session(weekday: int, hour: int) -> bool:
     """Checks whether the provided weekday and hour combination is within a valid session window."""
-    if weekday == SESSION_START_WEEKDAY:
-        return hour >= SESSION_START_TIME
-    elif weekday == SESSION_END_WEEKDAY:
-        return hour <= SESSION_END_TIME
-    return False
\ No newline at end of file
+    return calendar.contains(weekday, hour)
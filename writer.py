@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+import sqlalchemy.exc
+import metrics
+from typing import Optional
+from data import AsyncDataBaseSession
+
+from rich import print
+
+class EventWriter:
+    """Queues bot events and appends them to activity_events in one INSERT whenever max_batch_size events are
+    pending or flush_interval seconds have passed since the first pending event.
+
+    If the INSERT fails because the database is unreachable, the events are kept and retried after a backoff
+    that doubles from retry_delay up to max_retry_delay. If the database rejects a row, the events are written
+    one at a time so that only the rejected rows are dropped.
+
+    The events are merged into session_members and session_games later, by compaction.Compactor."""
+
+    # errors caused by the rows themselves, which retrying won't fix
+    REJECTED = (sqlalchemy.exc.DataError, sqlalchemy.exc.IntegrityError)
+
+    def __init__(self, max_batch_size: int = 100, flush_interval: float = 5.0, retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.failures = 0
+        self._queue = asyncio.Queue()
+        self._batch: list[dict] = []
+        self._task = None
+
+    def start(self) -> None:
+        """Starts consuming events, must be called from within the running event loop."""
+        if self._task is None: self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Writes every event queued so far, in one last attempt, and stops the consumer."""
+        if self._task is None: return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    def add_event(self, guild_id: int, member_id: int, kind: str, session_date: datetime.date, timestamp: datetime.datetime, game_name: Optional[str] = None) -> None:
+        """Queues a join, leave, start or stop event, where start and stop are of the game game_name."""
+        self._queue.put_nowait({
+            "guild_id" : guild_id,
+            "member_id" : member_id,
+            "kind" : kind,
+            "game_name" : game_name,
+            "session_date" : session_date,
+            "timestamp" : timestamp,
+        })
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            try:
+                event = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                deadline = await self._flush(loop)
+                continue
+
+            if event is None:
+                if not await self.flush(): print(f"Dropped {len(self._batch)} pending events on shutdown.")
+                return
+
+            self._batch.append(event)
+            if deadline is None: deadline = loop.time() + self.flush_interval
+            # while backing off, a full batch waits for the retry rather than hitting the database again
+            if len(self._batch) >= self.max_batch_size and self.failures == 0:
+                deadline = await self._flush(loop)
+
+    async def _flush(self, loop: asyncio.AbstractEventLoop) -> Optional[float]:
+        """Flushes, returning the time to retry at if the events were kept, else None."""
+        if await self.flush(): return None
+        return loop.time() + self.get_retry_delay()
+
+    def get_retry_delay(self) -> float:
+        return min(self.retry_delay * 2 ** (self.failures - 1), self.max_retry_delay)
+
+    async def flush(self) -> bool:
+        """Appends the pending events in a single INSERT. Returns False if they couldn't be written, in which case
+        they are kept pending."""
+        batch, self._batch = self._batch, []
+        if len(batch) == 0: return True
+        written = 0
+        try:
+            with metrics.track_event("flush"):
+                async with AsyncDataBaseSession() as db:
+                    try:
+                        await db.add_activity_events(batch)
+                    except self.REJECTED:
+                        # one bad row fails the whole INSERT, so find it by writing the events one at a time
+                        await db.rollback()
+                        for event in batch:
+                            try:
+                                await db.add_activity_events([event])
+                            except self.REJECTED as e:
+                                await db.rollback()
+                                print(f"Dropped an event the database rejected: {e}")
+                            written += 1
+        except Exception as e:
+            self._batch = batch[written:] + self._batch
+            self.failures += 1
+            print(f"Failed to write {len(self._batch)} pending events, retrying in {self.get_retry_delay():.0f}s: {e}")
+            return False
+        self.failures = 0
+        return True